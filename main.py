@@ -1,9 +1,14 @@
+import argparse
+import hashlib
+import json
 import os
 import subprocess
-from docx import Document
+import sys
+import time
 
 # --- 1. Data Definitions for docx Generation ---
 DATA_FILE = "travel_data.docx"
+STAMP_SUFFIX = ".stamp"
 
 SAMPLE_JSON = """
 {
@@ -332,28 +337,108 @@ SAMPLE_JSON = """
 }
 """
 
-def generate_data_docx():
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+def generate_data_docx(path: str = DATA_FILE):
     """Generates the required travel_data.docx file with the raw JSON content."""
     try:
-        if os.path.exists(DATA_FILE):
-             print(f"File {DATA_FILE} exists. Overwriting with new data...")
+        if os.path.exists(path):
+             print(f"File {path} exists. Overwriting with new data...")
         else:
-             print(f"Creating required data file: {DATA_FILE}")
+             print(f"Creating required data file: {path}")
         
+        from docx import Document
         doc = Document()
         doc.add_paragraph(SAMPLE_JSON.strip())
-        doc.save(DATA_FILE)
+        doc.save(path)
+        write_stamp(path, content_hash(SAMPLE_JSON), generated=True)
         print("Data Generation successful.")
 
     except Exception as e:
-        print(f"ERROR: Could not generate {DATA_FILE}. Please check 'python-docx' installation. {e}")
+        print(f"ERROR: Could not generate {path}. Please check 'python-docx' installation. {e}")
         exit()
 
+# The stamp (travel_data.docx.stamp) records the content hash of the docx together with
+# its size and mtime, so an unchanged file is recognised without opening it, and whether
+# the file is still exactly what generate_data_docx() wrote.
+def read_stamp(path: str) -> dict:
+    try:
+        with open(path + STAMP_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_stamp(path: str, sha256: str, generated: bool = False):
+    stat = os.stat(path)
+    try:
+        with open(path + STAMP_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump({"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                       "generated": generated}, f)
+    except OSError:
+        pass
+
+def ensure_data_docx(path: str = DATA_FILE, force: bool = False) -> str:
+    """
+    Writes SAMPLE_JSON to the docx only when needed. Returns what happened:
+    "current" (content already matches), "kept" (the file has local edits, which are
+    not overwritten), or "generated" (missing, unreadable, forced, or an untouched
+    copy of older sample data). python-docx is only imported to read a file whose
+    stamp is missing or stale, or to write one.
+    """
+    expected = content_hash(SAMPLE_JSON)
+    if not force and os.path.exists(path):
+        stat = os.stat(path)
+        stamp = read_stamp(path)
+        generated = False
+        if stamp.get("size") == stat.st_size and stamp.get("mtime_ns") == stat.st_mtime_ns:
+            actual, generated = stamp.get("sha256"), stamp.get("generated", False)
+        else:
+            try:
+                # Read here rather than via travel_core, which would pull in numpy for a text check.
+                from docx import Document
+                actual = content_hash("".join(para.text for para in Document(path).paragraphs))
+            except Exception:
+                actual = None
+            if actual is not None:
+                write_stamp(path, actual, generated=actual == expected)
+        if actual == expected:
+            return "current"
+        if actual is not None and not generated:
+            print(f"{path} differs from the built-in sample data; keeping your edits "
+                  "(run with --regenerate-data to overwrite).")
+            return "kept"
+    generate_data_docx(path)
+    return "generated"
+
+def start_service(port: int) -> subprocess.Popen:
+    """Starts the headless JSON planning service (travel_service.py) in the background."""
+    print(f"Starting planning service on port {port}...")
+    return subprocess.Popen([sys.executable, "travel_service.py", "--data", DATA_FILE, "--port", str(port)])
+
 if __name__ == "__main__":
-    generate_data_docx()
+    parser = argparse.ArgumentParser(description="AI Virtual Travel Guide launcher.")
+    parser.add_argument("--service", action="store_true", help="Also start the JSON planning service.")
+    parser.add_argument("--service-only", action="store_true", help="Start only the JSON planning service (no Streamlit).")
+    parser.add_argument("--service-port", type=int, default=8502)
+    parser.add_argument("--regenerate-data", action="store_true", help=f"Overwrite {DATA_FILE} with the sample data.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data_status = ensure_data_docx(DATA_FILE, force=args.regenerate_data)
+    print(f"Startup: data check {(time.perf_counter() - started) * 1000:.1f} ms ({data_status}).")
+
+    if args.service_only:
+        import travel_service
+        sys.exit(travel_service.main(["--data", DATA_FILE, "--port", str(args.service_port)]))
+
+    service = start_service(args.service_port) if args.service else None
     print("\nStarting Streamlit UI...")
     try:
         subprocess.call(["streamlit", "run", "travel_ui.py"])
     except FileNotFoundError:
         print("\nFATAL ERROR: 'streamlit' command not found.")
-        print("Please ensure Streamlit is installed: pip install streamlit")
\ No newline at end of file
+        print("Please ensure Streamlit is installed: pip install streamlit")
+    finally:
+        if service is not None:
+            service.terminate()
@@ -0,0 +1,1267 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from travel_catalog import (
+    AnswerCube, build_answer_cube, build_mapped_catalog, build_snapshot, generate_synthetic_catalog, hash_source, ingest_catalog, load_catalog,
+    open_catalog, open_mapped_agent, parse_source, snapshot_path_for, verify_answer_cube, write_catalog,
+)
+from travel_core import (
+    DISTANCE_SCALING, PAK_CITIES_COORDS, Destination, ItineraryPlanner, ItineraryProvider, PlanningCache, PlanningSession,
+    PlanningTrace, RoutePlanner, SearchAlgorithms, TravelAgent, load_json_from_docx,
+)
+
+INTEREST_OPTIONS = ["beach", "adventure", "mountains", "history", "nightlife", "food", "art", "gardens"]
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.3f} ms"
+
+
+# --- Reference implementations (pre-vectorization loops) ---
+class ReferenceDestination:
+    """The original dict-backed Destination, kept for the memory comparison."""
+    def __init__(self, data: Dict[str, Any]):
+        self.id = data["id"]
+        self.name = data["name"]
+        self.country = data["country"]
+        self.cost = data["avg_daily_cost"]
+        self.tags = set(data["tags"])
+        self.coords = tuple(data["coords"])
+        self.activities = data["activities"]
+        self.hotel_reco = data["hotel_reco"]
+        self.local_transport = data.get("local_transport", [])
+
+def reference_flight_costs(destinations: List[Destination], origin_city: str) -> List[int]:
+    origin_coords = PAK_CITIES_COORDS.get(origin_city, (65, 55))
+    return [int(300 + (SearchAlgorithms.calculate_distance(origin_coords, dest.coords) * 8)) for dest in destinations]
+
+
+def reference_utility_scores(destinations: List[Destination], user_input: Dict[str, Any]) -> List[float]:
+    user_interests = set(user_input["interests"])
+    max_daily_cost = user_input["budget"]
+    origin_coords = PAK_CITIES_COORDS.get(user_input.get("origin_city", "Karachi"), (65, 55))
+
+    scores = []
+    for dest in destinations:
+        budget_fit = dest.cost / max_daily_cost if dest.cost <= max_daily_cost else 0.1
+        budget_fit = min(budget_fit, 1.0)
+        common_interests = dest.tags.intersection(user_interests)
+        interest_match = len(common_interests) / len(user_interests) if user_interests else 0.5
+        distance = SearchAlgorithms.calculate_distance(origin_coords, dest.coords)
+        distance_score = max(0.1, 1.0 - (distance * DISTANCE_SCALING))
+        scores.append((interest_match * 0.55) + (budget_fit * 0.40) + (distance_score * 0.05))
+    return scores
+
+
+def reference_bfs_budget_filter(all_destinations: List[Destination], max_cost: float) -> List[Destination]:
+    queue = all_destinations[:]
+    filtered_destinations = []
+    while queue:
+        dest = queue.pop(0)
+        if dest.cost <= max_cost:
+            filtered_destinations.append(dest)
+    return filtered_destinations
+
+
+def reference_dfs_activity_explorer(activities_list: List[str], max_depth: int) -> List[str]:
+    """The original permutation search; exponential once distinct activities run out."""
+    def dfs(current_path: List[str]):
+        if len(current_path) >= max_depth:
+            return current_path
+        shuffled = list(activities_list)
+        random.shuffle(shuffled)
+        for activity in shuffled:
+            if activity not in current_path:
+                result = dfs(current_path + [activity])
+                if result:
+                    return result
+        return None
+
+    result = dfs([]) or []
+    while len(result) < max_depth:
+        result.append(random.choice(activities_list) if activities_list else "Relaxing Walk")
+    return result
+
+
+def reference_best_route(agent: TravelAgent, user_input: Dict[str, Any], candidates: int, max_stops: int,
+                         min_days_per_stop: int, total_budget: float, travel_weight: float) -> float:
+    """Best objective by trying every ordered selection of the candidates (exponential)."""
+    pool = agent.rank(user_input, candidates)
+    origin = PAK_CITIES_COORDS.get(user_input.get("origin_city", "Karachi"), (65, 55))
+    duration = user_input["duration"]
+    best = -float("inf")
+    for k in range(1, min(max_stops, max(1, duration // min_days_per_stop), len(pool)) + 1):
+        days = RoutePlanner.days_by_position(duration, k)
+        for route in itertools.permutations(pool, k):
+            stops = [origin] + [dest.coords for dest in route] + [origin]
+            travel = sum(RoutePlanner.leg_cost(a, b) for a, b in zip(stops, stops[1:]))
+            if travel + sum(dest.cost * d for dest, d in zip(route, days)) <= total_budget:
+                best = max(best, sum(dest.utility_score for dest in route) - travel_weight * travel)
+    return best
+
+
+def sample_user_inputs(count: int, seed: int = 11) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    origins = list(PAK_CITIES_COORDS)
+    return [{
+        "origin_city": rng.choice(origins),
+        "budget": rng.randrange(50, 3001, 10),
+        "duration": rng.randint(1, 14),
+        "interests": rng.sample(INTEREST_OPTIONS, rng.randint(0, 4)),
+    } for _ in range(count)]
+
+
+# --- Benchmarks ---
+def bench_snapshot(source: str, reruns: int, max_ratio: float) -> int:
+    """
+    Simulates Streamlit reruns: every rerun loads the catalog again. Fails if the snapshot
+    does not reproduce the parsed source, or if the last reruns' median load time is more
+    than max_ratio times the first reruns' (load time must stay flat).
+    """
+    snapshot = snapshot_path_for(source)
+    if os.path.exists(snapshot):
+        os.remove(snapshot)
+
+    started = time.perf_counter()
+    parsed = parse_source(source)
+    parse_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    data, _ = build_snapshot(source)
+    build_time = time.perf_counter() - started
+    if "error" in data:
+        print(f"ERROR: {data['error']}")
+        return 1
+
+    timings = []
+    loaded = None
+    for _ in range(reruns):
+        started = time.perf_counter()
+        loaded = load_catalog(source)
+        timings.append(time.perf_counter() - started)
+    failures = 0
+    if loaded != parsed:
+        print("snapshot round-trip does not reproduce the source catalog")
+        failures += 1
+
+    window = max(1, reruns // 10)
+    first, last = statistics.median(timings[:window]), statistics.median(timings[-window:])
+    print(f"source parse (per rerun, before): {_ms(parse_time)}")
+    print(f"snapshot build (first load):      {_ms(build_time)}")
+    print(f"snapshot load x{reruns}: mean {_ms(statistics.mean(timings))}, "
+          f"p99 {_ms(sorted(timings)[int(len(timings) * 0.99) - 1])}")
+    print(f"first {window} reruns {_ms(first)} vs last {window} reruns {_ms(last)} "
+          f"(median ratio {last / first:.2f}, limit {max_ratio:.2f})")
+    if last / first > max_ratio:
+        print("snapshot load time grew across reruns")
+        failures += 1
+    return 1 if failures else 0
+
+
+def bench_scoring(seed: int, size: int, requests: int) -> int:
+    """Checks ScoringEngine against the reference loops and times both."""
+    agent = TravelAgent(generate_synthetic_catalog(size, seed))
+    dests = agent.all_destinations
+    loop_time = engine_time = 0.0
+    mismatches = 0
+
+    for user_input in sample_user_inputs(requests):
+        started = time.perf_counter()
+        expected_flights = reference_flight_costs(dests, user_input["origin_city"])
+        expected_scores = reference_utility_scores(dests, user_input)
+        expected_order = sorted(range(len(dests)), key=lambda i: expected_scores[i], reverse=True)
+        loop_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        flights = agent.estimate_flight_costs(user_input["origin_city"])
+        ranked = agent.calculate_utility_scores(dests, user_input)
+        engine_time += time.perf_counter() - started
+
+        if (flights != expected_flights
+                or [d.estimated_flight_cost for d in ranked] != [expected_flights[i] for i in expected_order]
+                or [d.utility_score for d in ranked] != [expected_scores[i] for i in expected_order]
+                or [d.id for d in ranked] != [dests[i].id for i in expected_order]):
+            mismatches += 1
+
+    print(f"{size} destinations x {requests} requests")
+    print(f"reference loop: {_ms(loop_time / requests)} per request")
+    print(f"ScoringEngine:  {_ms(engine_time / requests)} per request ({loop_time / engine_time:.1f}x)")
+    print(f"exact mismatches: {mismatches}")
+    return 1 if mismatches else 0
+
+
+def bench_topk(seed: int, sizes: List[int], k: int, requests: int) -> int:
+    """Full stable sort vs top-k selection in calculate_utility_scores."""
+    failures = 0
+    for size in sizes:
+        agent = TravelAgent(generate_synthetic_catalog(size, seed))
+        full_time = topk_time = 0.0
+        for user_input in sample_user_inputs(requests):
+            started = time.perf_counter()
+            full = agent.calculate_utility_scores(agent.all_destinations, user_input)
+            full_time += time.perf_counter() - started
+            expected = [(d.id, d.utility_score) for d in full[:k]]
+
+            started = time.perf_counter()
+            top = agent.calculate_utility_scores(agent.all_destinations, user_input, top_k=k)
+            topk_time += time.perf_counter() - started
+            if [(d.id, d.utility_score) for d in top] != expected:
+                failures += 1
+
+        print(f"{size:>8} destinations: full sort {_ms(full_time / requests)}, "
+              f"top-{k} {_ms(topk_time / requests)} ({full_time / topk_time:.1f}x)")
+    print(f"top-k vs sorted[:k] mismatches: {failures}")
+    return 1 if failures else 0
+
+
+def bench_budget(seed: int, sizes: List[int], requests: int) -> int:
+    """Quadratic pop(0) filter vs deque filter vs CostIndex range query."""
+    failures = 0
+    for size in sizes:
+        agent = TravelAgent(generate_synthetic_catalog(size, seed))
+        timings = {"pop(0) loop": 0.0, "deque BFS": 0.0, "CostIndex": 0.0}
+        for user_input in sample_user_inputs(requests):
+            budget = user_input["budget"]
+            started = time.perf_counter()
+            expected = reference_bfs_budget_filter(agent.all_destinations, budget)
+            timings["pop(0) loop"] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            filtered = SearchAlgorithms.bfs_budget_filter(agent.all_destinations, budget)
+            timings["deque BFS"] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            rows = agent.cost_index.rows_within(budget)
+            timings["CostIndex"] += time.perf_counter() - started
+
+            expected_ids = [d.id for d in expected]
+            if ([d.id for d in filtered] != expected_ids
+                    or [agent.all_destinations[r].id for r in sorted(rows.tolist())] != expected_ids):
+                failures += 1
+        print(f"{size:>8} destinations: " + ", ".join(f"{name} {_ms(t / requests)}" for name, t in timings.items()))
+    print(f"filter result mismatches: {failures}")
+    return 1 if failures else 0
+
+
+def bench_interests(seed: int, sizes: List[int], requests: int) -> int:
+    """Per-destination set intersection vs TagIndex bitset counts over the whole catalog."""
+    failures = 0
+    for size in sizes:
+        agent = TravelAgent(generate_synthetic_catalog(size, seed))
+        loop_time = index_time = 0.0
+        kept = 0
+        for user_input in sample_user_inputs(requests):
+            interests = set(user_input["interests"])
+            started = time.perf_counter()
+            expected = [len(dest.tags.intersection(interests)) for dest in agent.all_destinations]
+            loop_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            counts = agent.tag_index.match_counts(interests)
+            any_match = agent.tag_index.any_match(interests)
+            index_time += time.perf_counter() - started
+
+            kept += int(any_match.sum())
+            if counts.tolist() != expected or any_match.tolist() != [c > 0 for c in expected]:
+                failures += 1
+        print(f"{size:>8} destinations: set intersection {_ms(loop_time / requests)}, "
+              f"TagIndex {_ms(index_time / requests)} ({loop_time / index_time:.1f}x), "
+              f"prefilter keeps {kept / (size * requests):.0%}")
+    print(f"interest count mismatches: {failures}")
+    return 1 if failures else 0
+
+
+def bench_activities(durations: List[int], pools: List[int], reference_max: int) -> int:
+    """Long trips against small activity pools: the case that made the old DFS hang."""
+    failures = 0
+    for pool_size in pools:
+        activities = [f"Activity {i}" for i in range(pool_size)]
+        for duration in durations:
+            depth = duration * 2
+            started = time.perf_counter()
+            picked = SearchAlgorithms.dfs_activity_explorer(activities, depth, random.Random(duration))
+            elapsed = time.perf_counter() - started
+
+            distinct_first = min(pool_size, depth)
+            if (len(picked) != depth or len(set(picked[:distinct_first])) != distinct_first
+                    or picked != SearchAlgorithms.dfs_activity_explorer(activities, depth, random.Random(duration))):
+                failures += 1
+
+            line = f"pool {pool_size:>3}, {duration:>4} days: selection {_ms(elapsed)}"
+            if pool_size <= reference_max:
+                started = time.perf_counter()
+                reference_dfs_activity_explorer(activities, depth)
+                line += f", original DFS {_ms(time.perf_counter() - started)}"
+            print(line)
+    print(f"property/reproducibility failures: {failures}")
+    return 1 if failures else 0
+
+
+def bench_concurrency(seed: int, size: int, requests: int, workers: int) -> int:
+    """Stress: many concurrent plans from different origins must match their serial results."""
+    agent = TravelAgent(generate_synthetic_catalog(size, seed))
+    user_inputs = sample_user_inputs(requests)
+
+    def plan(i: int):
+        ranked, best, itinerary = agent.run_planning(user_inputs[i], top_k=5, rng=random.Random(i))
+        return [(d.id, d.utility_score, d.estimated_flight_cost) for d in ranked], itinerary
+
+    started = time.perf_counter()
+    expected = [plan(i) for i in range(requests)]
+    serial_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(plan, range(requests)))
+    parallel_time = time.perf_counter() - started
+
+    # The planning service's thread pool serves repeats from PlanningCache; time those too.
+    cache = PlanningCache()
+    hot = user_inputs[:cache.maxsize]
+    for user_input in hot:
+        cache.get_or_plan(agent, user_input, 5)
+    repeats = [hot[i % len(hot)] for i in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda user_input: cache.get_or_plan(agent, user_input, 5), repeats))
+    hit_time = time.perf_counter() - started
+
+    failures = sum(1 for got, want in zip(results, expected) if got != want)
+    print(f"{requests} plans over {size} destinations from {len(set(u['origin_city'] for u in user_inputs))} origins "
+          f"({os.cpu_count()} CPUs)")
+    print(f"serial {_ms(serial_time)} ({requests / serial_time:.0f} plans/s), {workers} threads {_ms(parallel_time)} "
+          f"({requests / parallel_time:.0f} plans/s, {serial_time / parallel_time:.2f}x)")
+    print(f"cache hits on {workers} threads: {requests / hit_time:.0f} requests/s")
+    print(f"results differing from serial run: {failures}")
+    return 1 if failures else 0
+
+
+def bench_batch(seed: int, size: int, profiles: int, workers: int) -> int:
+    """plan_many on a process pool vs serial execution; results must match exactly."""
+    agent = TravelAgent(generate_synthetic_catalog(size, seed), version="bench")
+    user_inputs = sample_user_inputs(profiles)
+
+    def flatten(result):
+        ranked, _, itinerary = result
+        return [(d.id, d.utility_score, d.estimated_flight_cost) for d in ranked], itinerary
+
+    started = time.perf_counter()
+    expected = {i: flatten(agent.plan_seeded(u, top_k=5)) for i, u in enumerate(user_inputs)}
+    serial_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    first_result = None
+    results = {}
+    for index, result in agent.plan_many(user_inputs, workers=workers, top_k=5):
+        if first_result is None:
+            first_result = time.perf_counter() - started
+        results[index] = flatten(result)
+    pool_time = time.perf_counter() - started
+
+    failures = sum(1 for i in expected if results.get(i) != expected[i])
+    print(f"{profiles} profiles over {size} destinations")
+    print(f"serial {_ms(serial_time)}, plan_many({workers} workers) {_ms(pool_time)} "
+          f"({serial_time / pool_time:.1f}x), first result after {_ms(first_result or 0.0)}")
+    print(f"results differing from serial run: {failures}")
+    return 1 if failures else 0
+
+
+def bench_tracing(seed: int, size: int, requests: int) -> int:
+    """run_planning cost with instrumentation off, with a trace, and with cProfile capture."""
+    agent = TravelAgent(generate_synthetic_catalog(size, seed))
+    user_inputs = sample_user_inputs(requests, seed)
+    modes = {
+        "disabled": lambda u, i: agent.run_planning(u, 10, random.Random(i)),
+        "trace": lambda u, i: agent.run_planning(u, 10, random.Random(i), PlanningTrace()),
+        "trace+cProfile": lambda u, i: agent.run_planning(u, 10, random.Random(i), PlanningTrace(profile=True)),
+    }
+    timings = {}
+    for name, plan in modes.items():
+        per_request = []
+        for i, user_input in enumerate(user_inputs):
+            started = time.perf_counter()
+            plan(user_input, i)
+            per_request.append(time.perf_counter() - started)
+        timings[name] = statistics.median(per_request)
+    base = timings["disabled"]
+    print(f"{size} destinations, median of {requests} requests")
+    for name, t in timings.items():
+        print(f"{name:>15}: {_ms(t)} ({t / base - 1:+.1%} vs disabled)")
+    return 0
+
+
+def _retained_bytes(model: Callable[[Dict[str, Any]], Any], payload: str) -> int:
+    """Bytes still allocated once the parsed JSON is dropped and only the objects remain."""
+    tracemalloc.start()
+    records = json.loads(payload)["destinations"]
+    destinations = [model(record) for record in records]
+    del records
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del destinations
+    return retained
+
+
+def bench_memory(seed: int, sizes: List[int]) -> int:
+    """Resident size of the old dict-backed Destination vs the slotted, interned one."""
+    failures = 0
+    for size in sizes:
+        # Round-trip through JSON so every record owns its own strings, as when read from disk.
+        payload = json.dumps(generate_synthetic_catalog(size, seed))
+        old_bytes = _retained_bytes(ReferenceDestination, payload)
+        new_bytes = _retained_bytes(Destination, payload)
+
+        records = json.loads(payload)["destinations"]
+        for old, new in zip(map(ReferenceDestination, records), map(Destination, records)):
+            same = (old.id, old.name, old.country, old.cost, old.tags, old.coords, old.hotel_reco) == \
+                   (new.id, new.name, new.country, new.cost, new.tags, new.coords, new.hotel_reco) and \
+                   list(old.local_transport) == list(new.local_transport) and \
+                   {tag: list(acts) for tag, acts in new.activities.items()} == old.activities
+            failures += not same
+
+        print(f"{size:>9} destinations: old {old_bytes / size:7.0f} B/dest, new {new_bytes / size:7.0f} B/dest "
+              f"({1 - new_bytes / old_bytes:.0%} smaller)")
+    print(f"attribute mismatches: {failures}")
+    return 1 if failures else 0
+
+
+def _peak_bytes(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def _corrupt_lines(lines: List[str], bad_records: int) -> List[str]:
+    """Replaces evenly spaced records with broken ones: bad JSON, missing field, bad type, duplicate id."""
+    lines = list(lines)
+    step = max(1, len(lines) // (bad_records + 1))
+    for n in range(bad_records):
+        i = (n + 1) * step
+        kind = n % 4
+        if kind == 0:
+            lines[i] = lines[i][: len(lines[i]) // 2] + "\n"
+        elif kind == 1:
+            record = json.loads(lines[i])
+            del record["coords"]
+            lines[i] = json.dumps(record) + "\n"
+        elif kind == 2:
+            record = json.loads(lines[i])
+            record["avg_daily_cost"] = "cheap"
+            lines[i] = json.dumps(record) + "\n"
+        else:
+            lines[i] = lines[i - 1]
+    return lines
+
+
+def bench_ingest(seed: int, size: int, bad_records: int) -> int:
+    """Whole-document load vs streaming ingestion: peak memory, time, rankings and bad-record reporting."""
+    data = generate_synthetic_catalog(size, seed)
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path, lines_path, bad_path = (os.path.join(tmp, name) for name in ("c.json", "c.jsonl", "bad.jsonl"))
+        write_catalog(json_path, data)
+        write_catalog(lines_path, data)
+        del data
+
+        def whole_document():
+            with open(json_path, "r", encoding="utf-8") as f:
+                return TravelAgent(json.load(f))
+
+        loaders = {
+            "json.load + TravelAgent": whole_document,
+            "stream .json": lambda: ingest_catalog(json_path)[0],
+            "stream .jsonl": lambda: ingest_catalog(lines_path)[0],
+        }
+        source_mb = os.path.getsize(json_path) / 1e6
+        print(f"{size} destinations, {source_mb:.1f} MB of JSON")
+        agents = {}
+        for name, load in loaders.items():
+            started = time.perf_counter()
+            agents[name] = load()
+            elapsed = time.perf_counter() - started
+            peak = _peak_bytes(load)
+            print(f"{name:>24}: {_ms(elapsed)}, peak {peak / 1e6:7.1f} MB ({peak / 1e6 / source_mb:.1f}x source)")
+
+        reference = agents.pop("json.load + TravelAgent")
+        for user_input in sample_user_inputs(50, seed):
+            expected = [(d.id, d.utility_score, d.estimated_flight_cost) for d in reference.rank(user_input, 10)]
+            for agent in agents.values():
+                failures += expected != [(d.id, d.utility_score, d.estimated_flight_cost) for d in agent.rank(user_input, 10)]
+        print(f"rankings differing from the whole-document load: {failures}")
+
+        with open(lines_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        with open(bad_path, "w", encoding="utf-8") as f:
+            f.writelines(_corrupt_lines(lines, bad_records))
+        _, report = ingest_catalog(bad_path)
+        reported_ok = report.rejected == bad_records and report.accepted == size - bad_records
+        print(f"{bad_records} corrupted records: {report.accepted} accepted, {report.rejected} rejected, e.g.")
+        for problem in report.problems[:4]:
+            print(f"  {problem}")
+        failures += not reported_ok
+    return 1 if failures else 0
+
+
+def _record_of(dest: Destination) -> Dict[str, Any]:
+    return {
+        "id": dest.id, "name": dest.name, "country": dest.country, "avg_daily_cost": dest.cost,
+        "tags": sorted(dest.tags), "coords": list(dest.coords),
+        "activities": {tag: list(acts) for tag, acts in dest.activities.items()},
+        "hotel_reco": dest.hotel_reco, "local_transport": list(dest.local_transport),
+    }
+
+
+def bench_mutations(seed: int, sizes: List[int], mutations: int, requests: int) -> int:
+    """
+    Random price updates, moves, inserts and deletes applied in place vs a full rebuild;
+    afterwards rankings must match an agent rebuilt from the mutated catalog.
+    """
+    failures = 0
+    for size in sizes:
+        data = generate_synthetic_catalog(size + mutations, seed)
+        spare = data["destinations"][size:]
+        agent = TravelAgent({"destinations": data["destinations"][:size]}, version="bench")
+        rng = random.Random(seed)
+        timings = {"price": [], "move": [], "insert": [], "delete": []}
+        for i in range(mutations):
+            kind = rng.choices(list(timings), weights=[6, 1, 2, 1])[0]
+            started = time.perf_counter()
+            if kind == "insert":
+                agent.upsert(spare.pop())
+            elif kind == "delete":
+                agent.delete(rng.choice(agent.all_destinations).id)
+            else:
+                record = _record_of(rng.choice(agent.all_destinations))
+                if kind == "price":
+                    record["avg_daily_cost"] = rng.randint(20, 600)
+                else:
+                    record["coords"] = [rng.uniform(0, 100), rng.uniform(0, 100)]
+                agent.upsert(record)
+            timings[kind].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        rebuilt = TravelAgent({"destinations": [_record_of(d) for d in agent.all_destinations]})
+        rebuild_time = time.perf_counter() - started
+
+        for user_input in sample_user_inputs(requests, seed):
+            user_input["min_budget"] = rng.choice([0, 0, 50])
+            expected = [(d.id, d.utility_score, d.estimated_flight_cost) for d in rebuilt.rank(user_input, 10)]
+            failures += expected != [(d.id, d.utility_score, d.estimated_flight_cost)
+                                     for d in agent.rank(user_input, 10)]
+            failures += sorted(rebuilt.affordable_rows(user_input).tolist()) != \
+                sorted(agent.affordable_rows(user_input).tolist())
+
+        per_op = ", ".join(f"{kind} {_ms(statistics.mean(t))}" for kind, t in timings.items() if t)
+        print(f"{size:>9} destinations, {mutations} mutations (revision {agent.revision}): mean {per_op}; "
+              f"full rebuild {_ms(rebuild_time)}")
+    print(f"rankings differing from a rebuilt catalog: {failures}")
+    return 1 if failures else 0
+
+
+def bench_shards(seed: int, size: int, shard_counts: List[int], requests: int) -> int:
+    """Scatter-gather ranking over shard processes vs one process; rankings must be identical."""
+    agent = TravelAgent(generate_synthetic_catalog(size, seed), version="bench")
+    user_inputs = sample_user_inputs(requests, seed)
+
+    def flatten(ranked):
+        return [(d.id, d.utility_score, d.estimated_flight_cost) for d in ranked]
+
+    # Full rankings ship every affordable destination back from the shards; check a few.
+    checked = {10: user_inputs, None: user_inputs[:3]}
+    expected = {k: [flatten(agent.rank(u, k)) for u in inputs] for k, inputs in checked.items()}
+    single = _median_ms(lambda: [agent.rank(u, 10) for u in user_inputs], 3) / requests
+    print(f"{size} destinations, {requests} requests; single process top-10: {single:.3f} ms/request")
+
+    failures = 0
+    for by in ("region", "hash"):
+        for shards in shard_counts:
+            started = time.perf_counter()
+            with agent.shard(shards, by) as sharded:
+                startup = time.perf_counter() - started
+                for k, rankings in expected.items():
+                    failures += sum(flatten(sharded.rank(u, k)) != ranking for u, ranking in zip(checked[k], rankings))
+                failures += sum(sharded.plan_seeded(u, 5)[2] != agent.plan_seeded(u, 5)[2] for u in user_inputs[:20])
+                per_request = _median_ms(lambda: [sharded.rank(u, 10) for u in user_inputs], 3) / requests
+                sizes = sharded.stats()["shard_sizes"]
+            print(f"{by:>7} x{shards}: {per_request:.3f} ms/request top-10, startup {_ms(startup)}, "
+                  f"shard sizes {min(sizes)}-{max(sizes)}")
+    print(f"rankings differing from single-process: {failures}")
+    return 1 if failures else 0
+
+
+def bench_route(seed: int, size: int, candidate_counts: List[int], max_stops: int, requests: int,
+                reference_max: int) -> int:
+    """Multi-city route search: time and nodes expanded; optimal vs brute force for small candidate sets."""
+    agent = TravelAgent(generate_synthetic_catalog(size, seed), version="bench")
+    rng = random.Random(seed)
+    user_inputs = []
+    for user_input in sample_user_inputs(requests, seed):
+        user_input["duration"] = rng.randint(max_stops, 2 * max_stops)
+        user_input["budget"] = max(user_input["budget"], 150)
+        user_inputs.append((user_input, rng.choice([5000, 10000, 20000])))
+
+    failures = 0
+    print(f"{size} destinations, up to {max_stops} stops, {requests} requests")
+    for candidates in candidate_counts:
+        timings, expanded, stops = [], [], []
+        for user_input, total_budget in user_inputs:
+            options = dict(candidates=candidates, max_stops=max_stops, min_days_per_stop=2,
+                           total_budget=total_budget, travel_weight=0.001)
+            plan = agent.plan_route(user_input, **options)
+            timings.append(plan.stats["seconds"])
+            expanded.append(plan.stats["nodes_expanded"])
+            stops.append(len(plan.stops))
+            if candidates <= reference_max:
+                expected = reference_best_route(agent, user_input, **options)
+                got = plan.objective if plan.stops else -float("inf")
+                failures += not (got == expected or abs(got - expected) < 1e-9)
+        print(f"{candidates:>3} candidates: median {_ms(statistics.median(timings))}, max {_ms(max(timings))}, "
+              f"nodes expanded median {statistics.median(expanded):.0f} / max {max(expanded)}, "
+              f"mean stops {statistics.mean(stops):.1f}"
+              + (" (checked vs brute force)" if candidates <= reference_max else ""))
+    print(f"routes worse than brute force: {failures}")
+    return 1 if failures else 0
+
+
+def _unshared(itinerary: List[List[str]]) -> List[List[str]]:
+    """Same lines as fresh string objects, as the per-day f-strings used to produce."""
+    return [[(line + " ")[:-1] for line in day] for day in itinerary]
+
+
+def bench_itineraries(seed: int, size: int, requests: int, top_k: int) -> int:
+    """Eager itineraries for every alternative vs lazy ItineraryProvider; outputs must match."""
+    agent = TravelAgent(generate_synthetic_catalog(size, seed), version="bench")
+    rng = random.Random(seed)
+    user_inputs = sample_user_inputs(requests, seed)
+    for user_input in user_inputs:
+        user_input["duration"] = rng.randint(3, 30)
+
+    def eager(user_input):
+        ranked, best, itinerary = agent.plan_seeded(user_input, top_k)
+        return ranked, [itinerary] + [agent.itinerary_for(scored, user_input) for scored in ranked[1:]]
+
+    def lazy(user_input):
+        ranked, best, itinerary = agent.plan_seeded(user_input, top_k)
+        return ItineraryProvider(agent, user_input, ranked, known={best.id: itinerary} if best else None)
+
+    failures = 0
+    for user_input in user_inputs:
+        ranked, expected = eager(user_input)
+        provider = lazy(user_input)
+        provider.prefetch(2)
+        failures += sum(provider.get(i) != itinerary for i, itinerary in enumerate(expected))
+        failures += provider.generated != len(ranked) - 1 if ranked else 0
+
+    eager_ms = _median_ms(lambda: [eager(u) for u in user_inputs], 3) / requests
+    lazy_ms = _median_ms(lambda: [lazy(u) for u in user_inputs], 3) / requests
+    providers = [lazy(u) for u in user_inputs]
+    click_ms = _median_ms(lambda: [p.get(1) for p in providers if len(p) > 1], 1) / requests
+    print(f"{size} destinations, {requests} requests, top-{top_k}")
+    print(f"eager (all {top_k} itineraries): {eager_ms:.3f} ms/request")
+    print(f"lazy (best only): {lazy_ms:.3f} ms/request, first alternative on click {click_ms:.3f} ms")
+
+    # Template lines are already cached from the runs above, as in a long-lived server.
+    tracemalloc.start()
+    itineraries = [itinerary for u in user_inputs for itinerary in eager(u)[1]]
+    shared, _ = tracemalloc.get_traced_memory()
+    copies = [_unshared(itinerary) for itinerary in itineraries]
+    unshared = tracemalloc.get_traced_memory()[0] - shared
+    tracemalloc.stop()
+    del copies
+    print(f"retained by {len(itineraries)} itineraries: per-day strings {unshared / 1024:.0f} KiB, "
+          f"shared templates {shared / 1024:.0f} KiB")
+    print(f"itineraries differing from eager generation: {failures}")
+    return 1 if failures else 0
+
+
+# Runs in a fresh interpreter: "old" imports python-docx up front and regenerates the
+# data file unconditionally (the previous launcher), "new" uses the hash-checked fast path.
+STARTUP_CHILD = """
+import contextlib, io, json, sys, time
+started = time.perf_counter()
+if sys.argv[1] == "old":
+    import docx
+import main, travel_catalog
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    status = main.generate_data_docx(sys.argv[2]) if sys.argv[1] == "old" else main.ensure_data_docx(sys.argv[2])
+checked = time.perf_counter()
+catalog = travel_catalog.SharedCatalog(sys.argv[2])
+catalog.current()
+loaded = time.perf_counter()
+print(json.dumps({"import": imported - started, "data": checked - imported, "load": loaded - checked,
+                  "status": status, "docx_imported": "docx" in sys.modules, "breakdown": catalog.load_breakdown}))
+"""
+
+
+def _startup_run(mode: str, data_path: str) -> Dict[str, Any]:
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", STARTUP_CHILD, mode, data_path], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output)
+    result["process"] = time.perf_counter() - started
+    return result
+
+
+def bench_startup(source: str, repeats: int) -> int:
+    """Cold start (fresh process): eager docx import + unconditional regeneration vs the fast path."""
+    import main
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for mode in ("old", "new"):
+            os.makedirs(os.path.join(tmp, mode))
+            paths[mode] = os.path.join(tmp, mode, "travel_data.docx")
+            shutil.copyfile(source, paths[mode])
+            _startup_run(mode, paths[mode])  # first run builds the snapshot / stamp
+
+        results = {mode: [_startup_run(mode, path) for _ in range(repeats)] for mode, path in paths.items()}
+        print(f"cold start over {repeats} fresh processes (median ms):")
+        print(f"{'':>5} {'imports':>8} {'data':>8} {'catalog':>8} {'process':>8}  docx imported  catalog load")
+        for mode, runs in results.items():
+            row = [statistics.median(run[stage] for run in runs) * 1000 for stage in ("import", "data", "load", "process")]
+            print(f"{mode:>5} " + " ".join(f"{value:8.1f}" for value in row)
+                  + f"  {str(runs[-1]['docx_imported']):>13}  {runs[-1]['breakdown']}")
+        failures += any(run["docx_imported"] or run["status"] != "current" for run in results["new"])
+
+        # The sample-data docx must be untouched by the fast path, and local edits must survive it.
+        failures += main.read_stamp(paths["new"]).get("sha256") != main.content_hash(main.SAMPLE_JSON)
+        edited = os.path.join(tmp, "edited.docx")
+        from docx import Document
+        doc = Document()
+        doc.add_paragraph(json.dumps({"destinations": json.loads(main.SAMPLE_JSON)["destinations"][:3]}))
+        doc.save(edited)
+        before = hash_source(edited)
+        status = _startup_run("new", edited)["status"]
+        failures += status != "kept" or hash_source(edited) != before
+        print(f"edited data file: {status}, content {'preserved' if hash_source(edited) == before else 'OVERWRITTEN'}")
+    print(f"startup checks failed: {failures}")
+    return 1 if failures else 0
+
+
+# Loads a catalog, ranks a few requests, then waits on stdin so all workers are alive
+# together when they read their memory from /proc/self/smaps_rollup (Linux).
+MAPPED_CHILD = """
+import json, sys
+import travel_catalog
+from travel_bench import sample_user_inputs
+
+def memory():
+    with open("/proc/self/smaps_rollup") as f:
+        fields = {line.split()[0].rstrip(":"): int(line.split()[1]) for line in f if line.rstrip().endswith("kB")}
+    return {"pss": fields["Pss"], "private": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+before = memory()
+catalog = travel_catalog.SharedCatalog(sys.argv[1])
+agent = catalog.current().agent
+for user_input in sample_user_inputs(5):
+    agent.rank(user_input, 10)
+print("ready", flush=True)
+sys.stdin.readline()
+after = memory()
+print(json.dumps({key: after[key] - before[key] for key in after}))
+"""
+
+
+def _worker_memory(data_path: str, workers: int) -> List[Dict[str, int]]:
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    procs = [subprocess.Popen([sys.executable, "-c", MAPPED_CHILD, data_path], env=env, text=True,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE) for _ in range(workers)]
+    for proc in procs:
+        if proc.stdout.readline().strip() != "ready":
+            raise RuntimeError(f"worker failed to load {data_path}")
+    results = [json.loads(proc.communicate("go\n")[0]) for proc in procs]
+    return results
+
+
+def bench_mapped(seed: int, size: int, requests: int, workers: int) -> int:
+    """Mapped .tcat catalog vs the pickled snapshot: open time, worker memory, identical fields and rankings."""
+    data = generate_synthetic_catalog(size, seed)
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "catalog.json")
+        write_catalog(source, data)
+        del data
+        started = time.perf_counter()
+        summary = build_mapped_catalog(source)
+        print(f"{size} destinations: converted in {_ms(time.perf_counter() - started)}, "
+              f"{summary['bytes'] / 2**20:.1f} MiB ({summary['strings']} distinct strings)")
+
+        def open_snapshot():
+            snapshot, header = open_catalog(source)
+            return TravelAgent(snapshot, version=header["source_sha256"][:12])
+
+        agent = open_snapshot()
+        mapped = open_mapped_agent(summary["output"])
+        print(f"open: snapshot + index build {_median_ms(open_snapshot, 3):.1f} ms, "
+              f"mmap {_median_ms(lambda: open_mapped_agent(summary['output']), 3):.1f} ms")
+
+        fields = ("id", "name", "country", "cost", "tags", "coords", "activities", "hotel_reco", "local_transport")
+        failures += sum(any(getattr(dest, field) != getattr(view, field) for field in fields)
+                        for dest, view in zip(agent.all_destinations, mapped.all_destinations))
+        print(f"destinations with differing fields: {failures}")
+
+        user_inputs = sample_user_inputs(requests, seed)
+        ranking_failures = sum(
+            [(r.id, r.utility_score, r.estimated_flight_cost) for r in agent.rank(u, 10)]
+            != [(r.id, r.utility_score, r.estimated_flight_cost) for r in mapped.rank(u, 10)]
+            or agent.plan_seeded(u, 3)[2] != mapped.plan_seeded(u, 3)[2]
+            for u in user_inputs)
+        failures += ranking_failures
+        print(f"rank top-10: snapshot {_median_ms(lambda: [agent.rank(u, 10) for u in user_inputs], 3) / requests:.3f} "
+              f"ms/request, mapped {_median_ms(lambda: [mapped.rank(u, 10) for u in user_inputs], 3) / requests:.3f} "
+              f"ms/request; plans differing: {ranking_failures}")
+
+        if os.path.exists("/proc/self/smaps_rollup"):
+            for label, path in (("snapshot", source), ("mapped", summary["output"])):
+                memory = _worker_memory(path, workers)
+                print(f"{workers} workers, {label:>8}: catalog adds {statistics.mean(m['private'] for m in memory) / 1024:.1f} "
+                      f"MiB private / {statistics.mean(m['pss'] for m in memory) / 1024:.1f} MiB proportional per worker")
+            table = mapped.engine.distance_matrix
+            print(f"  (origin distance table: {(table.distance_scores.nbytes + table.flight_costs.nbytes) / 2**20:.1f} MiB, "
+                  f"built per snapshot worker, mapped from the file by mapped workers)")
+    print(f"mapped catalog mismatches: {failures}")
+    return 1 if failures else 0
+
+
+SESSION_CONTROLS = ("budget", "interests", "origin_city", "inside_city", "airline_pref")
+
+
+def bench_session(seed: int, size: int, steps: int) -> int:
+    """A user changing one sidebar control per rerun: full plan_seeded vs PlanningSession; plans must match."""
+    agent = TravelAgent(generate_synthetic_catalog(size, seed), version="bench")
+    rng = random.Random(seed)
+    user_input = sample_user_inputs(1, seed)[0]
+    walk = []
+    for _ in range(steps):
+        user_input, control = dict(user_input), rng.choice(SESSION_CONTROLS)
+        if control == "budget":
+            user_input["budget"] = rng.choice([80, 120, 150, 200, 300, 500])
+        elif control == "interests":
+            user_input["interests"] = rng.sample(INTEREST_OPTIONS, rng.randint(1, 3))
+        elif control == "origin_city":
+            user_input["origin_city"] = rng.choice(list(PAK_CITIES_COORDS))
+        elif control == "inside_city":
+            user_input["inside_city"] = rng.choice(["metro", "taxi", "rental car", "walk"])
+        else:
+            user_input["airline_pref"] = rng.choice(["Cheap", "Comfortable"])
+        walk.append((control, user_input))
+
+    def flatten(plan):
+        ranked, _, itinerary = plan
+        return [(d.id, d.utility_score, d.estimated_flight_cost) for d in ranked], itinerary
+
+    full, incremental = defaultdict(list), defaultdict(list)
+    session, failures = PlanningSession(agent), 0
+    session.plan(sample_user_inputs(1, seed)[0], 3)
+    for control, user_input in walk:
+        started = time.perf_counter()
+        expected = agent.plan_seeded(user_input, 3)
+        full[control].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        got = session.plan(user_input, 3)
+        incremental[control].append(time.perf_counter() - started)
+        failures += flatten(got) != flatten(expected)
+
+    print(f"{size} destinations, {steps} reruns changing one control each (median per rerun)")
+    for control in SESSION_CONTROLS:
+        if full[control]:
+            print(f"{control:>13}: full {_ms(statistics.median(full[control]))}, "
+                  f"session {_ms(statistics.median(incremental[control]))} ({len(full[control])} reruns)")
+    print(f"session recomputations: {session.recomputed}")
+    print(f"plans differing from plan_seeded: {failures}")
+    return 1 if failures else 0
+
+
+def bench_cube(seed: int, sizes: List[int], top_k: int, requests: int, samples: int) -> int:
+    """Answer cube per catalog size: build time, file size, lookup vs live rank(), verification."""
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            agent = TravelAgent(generate_synthetic_catalog(size, seed), version="bench")
+            report = build_answer_cube(agent, os.path.join(tmp, f"{size}.cube"), top_k)
+            if "error" in report:
+                print(f"{size:>6} destinations: {report['error']}")
+                continue
+            cube = AnswerCube(report["path"])
+            inputs = sample_user_inputs(requests, seed)
+
+            started = time.perf_counter()
+            live = [agent.rank(user_input, top_k) for user_input in inputs]
+            live_seconds = time.perf_counter() - started
+            agent.answer_cube = cube
+            started = time.perf_counter()
+            cached = [agent.rank(user_input, top_k) for user_input in inputs]
+            cube_seconds = time.perf_counter() - started
+            agent.answer_cube, hits = None, cube.hits
+
+            checked, mismatches = verify_answer_cube(agent, cube, samples, seed)
+            mismatches += sum([(r.id, r.utility_score) for r in a] != [(r.id, r.utility_score) for r in b]
+                              for a, b in zip(live, cached))
+            failures += mismatches
+            print(f"{size:>6} destinations: build {report['build_seconds']:.2f} s, {report['bytes'] / 1e6:.1f} MB "
+                  f"({report['cells']} cells x top-{top_k}, {report['dtype']}); rank live {_ms(live_seconds / requests)}, "
+                  f"cube {_ms(cube_seconds / requests)} ({hits}/{requests} hits); {mismatches} mismatches in "
+                  f"{checked + requests} checks")
+    return 1 if failures else 0
+
+
+def bench_retrieval(seed: int, sizes: List[int], pools: List[int], top_k: int, requests: int,
+                    per_list: Optional[int], target_recall: float) -> int:
+    """
+    Embedding-index candidates + exact rerank vs brute-force rank(): recall@k and latency
+    per pool, then the trade-off per size (smallest pool reaching target_recall, and
+    whether it beats exact ranking at all).
+    """
+    inputs = [user_input for user_input in sample_user_inputs(requests, seed) if user_input["interests"]]
+    failures = 0
+    for size in sizes:
+        agent = TravelAgent(generate_synthetic_catalog(size, seed), version="bench")
+        brute_times, exact = [], []
+        for user_input in inputs:
+            started = time.perf_counter()
+            exact.append(agent.rank(user_input, top_k))
+            brute_times.append(time.perf_counter() - started)
+        brute = statistics.median(brute_times)
+        index = agent.enable_retrieval(per_list=per_list)
+        stats = index.stats()
+        print(f"{size} destinations: index built in {index.build_seconds:.2f} s ({stats['terms']} terms, "
+              f"{stats['dim']} dims, {stats['lists']} lists); brute force {_ms(brute)}")
+        for term in ("beach", "views"):
+            print(f"  nearest to {term!r}: {', '.join(name for name, _ in index.embeddings.similar(term, 4))}")
+        results = []
+        for pool in pools:
+            agent.retrieval_pool = pool
+            times, recalls, candidates = [], [], []
+            for user_input, expected in zip(inputs, exact):
+                # Timed untraced, like the brute-force runs; a traced call counts the candidates.
+                started = time.perf_counter()
+                ranked = agent.rank(user_input, top_k)
+                times.append(time.perf_counter() - started)
+                trace = PlanningTrace()
+                trace.begin()
+                agent.rank(user_input, top_k, trace)
+                candidates.append(next(stage["out"] for stage in trace.stages if stage["stage"] == "retrieval"))
+                recalls.append(len({r.id for r in ranked} & {r.id for r in expected}) / max(1, len(expected)))
+                # Reranking is exact: every returned score must be the live one.
+                failures += sum(r.utility_score != agent.score_destination(r.id, user_input).utility_score for r in ranked)
+            recall, latency = statistics.mean(recalls), statistics.median(times)
+            results.append((pool, recall, latency))
+            print(f"  pool {pool:>5}: recall@{top_k} {recall:.3f}, {_ms(latency)} ({brute / latency:.1f}x), "
+                  f"~{statistics.mean(candidates):.0f} candidates scored")
+        reaching = [result for result in results if result[1] >= target_recall]
+        if not reaching:
+            print(f"  trade-off: no pool reaches recall@{top_k} {target_recall:.2f}")
+        else:
+            pool, recall, latency = reaching[0]
+            verdict = "faster" if latency < brute else "slower"
+            print(f"  trade-off: recall@{top_k} >= {target_recall:.2f} first at pool {pool} "
+                  f"({recall:.3f}, {_ms(latency)}, {brute / latency:.1f}x, {verdict} than exact ranking)")
+    print(f"reranked scores differing from live scoring: {failures}")
+    return 1 if failures else 0
+
+
+# --- Stage-by-stage suite ---
+SUITE_STAGES = [
+    "build_agent", "bfs_budget_filter", "cost_index_filter", "calculate_utility_scores",
+    "rank_top_k", "dfs_activity_explorer", "generate_itinerary", "run_planning",
+]
+
+
+def _median_ms(fn: Callable[[], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 4)
+
+
+def run_suite(sizes: List[int], requests: int, seed: int, top_k: int = 10) -> Dict[str, Any]:
+    """Median wall time (ms) of each pipeline stage per catalog size, over `requests` inputs."""
+    results: Dict[str, Dict[str, float]] = {}
+    for size in sizes:
+        data = generate_synthetic_catalog(size, seed)
+        started = time.perf_counter()
+        agent = TravelAgent(data, version="bench")
+        stage_ms = {"build_agent": round((time.perf_counter() - started) * 1000, 4)}
+        per_stage: Dict[str, List[float]] = {stage: [] for stage in SUITE_STAGES[1:]}
+
+        for i, user_input in enumerate(sample_user_inputs(requests, seed)):
+            budget = user_input["budget"]
+            per_stage["bfs_budget_filter"].append(
+                _median_ms(lambda: SearchAlgorithms.bfs_budget_filter(agent.all_destinations, budget), 1))
+            per_stage["cost_index_filter"].append(_median_ms(lambda: agent.affordable_rows(user_input), 3))
+            affordable = SearchAlgorithms.bfs_budget_filter(agent.all_destinations, budget)
+            per_stage["calculate_utility_scores"].append(
+                _median_ms(lambda: agent.calculate_utility_scores(affordable, user_input), 1))
+            per_stage["rank_top_k"].append(_median_ms(lambda: agent.rank(user_input, top_k), 3))
+
+            ranked = agent.rank(user_input, 1)
+            if ranked:
+                best = ranked[0]
+                activities = [a for interest in user_input["interests"] for a in best.activities.get(interest, [])]
+                depth = int(user_input["duration"]) * 2
+                per_stage["dfs_activity_explorer"].append(_median_ms(
+                    lambda: SearchAlgorithms.dfs_activity_explorer(activities, depth, random.Random(i)), 3))
+                per_stage["generate_itinerary"].append(_median_ms(
+                    lambda: ItineraryPlanner().generate_itinerary(best, user_input, random.Random(i)), 3))
+            per_stage["run_planning"].append(
+                _median_ms(lambda: agent.run_planning(user_input, top_k, random.Random(i)), 1))
+
+        for stage, timings in per_stage.items():
+            stage_ms[stage] = round(statistics.median(timings), 4) if timings else None
+        results[str(size)] = stage_ms
+        print(f"{size:>8} destinations: " + ", ".join(f"{k} {v}ms" for k, v in stage_ms.items()))
+
+    return {
+        "meta": {
+            "seed": seed, "requests": requests, "top_k": top_k, "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine(), "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare_to_baseline(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                        noise_floor_ms: float = 0.05) -> List[str]:
+    """Stages slower than baseline by more than `tolerance` (fraction) and the noise floor."""
+    regressions = []
+    for size, stages in current["results"].items():
+        base_stages = baseline.get("results", {}).get(size, {})
+        for stage, ms in stages.items():
+            base_ms = base_stages.get(stage)
+            if ms is None or base_ms is None:
+                continue
+            if ms > base_ms * (1 + tolerance) and ms - base_ms > noise_floor_ms:
+                regressions.append(f"{size} destinations / {stage}: {base_ms}ms -> {ms}ms (+{ms / base_ms - 1:.0%})")
+    return regressions
+
+
+def bench_suite(sizes: List[int], requests: int, seed: int, output: str, baseline: str,
+                tolerance: float, update_baseline: bool) -> int:
+    report = run_suite(sizes, requests, seed)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if update_baseline:
+        with open(baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Updated baseline {baseline}")
+        return 0
+    if not os.path.exists(baseline):
+        print(f"No baseline at {baseline}; run with --update-baseline to create one.")
+        return 0
+
+    with open(baseline, "r", encoding="utf-8") as f:
+        regressions = compare_to_baseline(report, json.load(f), tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"{len(regressions)} regression(s) beyond {tolerance:.0%} vs {baseline}")
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Performance benchmarks for the travel planner.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    snap = sub.add_parser("snapshot", help="Catalog load time across repeated reruns.")
+    snap.add_argument("--source", default="travel_data.docx")
+    snap.add_argument("--reruns", type=int, default=1000)
+    snap.add_argument("--max-ratio", type=float, default=1.5,
+                      help="Fail if the last reruns' median load time exceeds the first reruns' by this factor.")
+
+    scoring = sub.add_parser("scoring", help="ScoringEngine equivalence and speed vs the reference loops.")
+    scoring.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    scoring.add_argument("--size", type=int, default=5000)
+    scoring.add_argument("--requests", type=int, default=50)
+
+    topk = sub.add_parser("topk", help="Top-k ranking vs full sort.")
+    topk.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    topk.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    topk.add_argument("-k", type=int, default=3)
+    topk.add_argument("--requests", type=int, default=5)
+
+    budget = sub.add_parser("budget", help="Budget filter: quadratic loop vs cost index.")
+    budget.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    budget.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    budget.add_argument("--requests", type=int, default=5)
+
+    interests = sub.add_parser("interests", help="Interest matching: set intersection vs tag bitsets.")
+    interests.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    interests.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    interests.add_argument("--requests", type=int, default=5)
+
+    activities = sub.add_parser("activities", help="Activity selection on long trips with small pools.")
+    activities.add_argument("--durations", type=int, nargs="+", default=[5, 10, 30, 365])
+    activities.add_argument("--pools", type=int, nargs="+", default=[1, 4, 7, 8, 50])
+    activities.add_argument("--reference-max", type=int, default=7,
+                            help="Largest pool to also run through the original DFS (it is factorial).")
+
+    concurrency = sub.add_parser("concurrency", help="Concurrent run_planning stress test.")
+    concurrency.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    concurrency.add_argument("--size", type=int, default=20_000)
+    concurrency.add_argument("--requests", type=int, default=400)
+    concurrency.add_argument("--workers", type=int, default=8)
+
+    batch = sub.add_parser("batch", help="plan_many process pool vs serial planning.")
+    batch.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    batch.add_argument("--size", type=int, default=20_000)
+    batch.add_argument("--profiles", type=int, default=4000)
+    batch.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+
+    tracing = sub.add_parser("tracing", help="Instrumentation overhead in run_planning.")
+    tracing.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    tracing.add_argument("--size", type=int, default=20_000)
+    tracing.add_argument("--requests", type=int, default=200)
+
+    memory = sub.add_parser("memory", help="Destination footprint: dict-backed vs slotted and interned.")
+    memory.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    memory.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+
+    ingest = sub.add_parser("ingest", help="Whole-document load vs streaming ingestion.")
+    ingest.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    ingest.add_argument("--size", type=int, default=50_000)
+    ingest.add_argument("--bad-records", type=int, default=20)
+
+    mutations = sub.add_parser("mutations", help="In-place upsert/delete vs full rebuild; rankings must match.")
+    mutations.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    mutations.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    mutations.add_argument("--mutations", type=int, default=5000)
+    mutations.add_argument("--requests", type=int, default=100)
+
+    shards = sub.add_parser("shards", help="Scatter-gather ranking over shard processes vs one process.")
+    shards.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    shards.add_argument("--size", type=int, default=100_000)
+    shards.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    shards.add_argument("--requests", type=int, default=50)
+
+    route = sub.add_parser("route", help="Multi-city route search: nodes expanded, latency, optimality.")
+    route.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    route.add_argument("--size", type=int, default=10_000)
+    route.add_argument("--candidates", type=int, nargs="+", default=[6, 8, 10, 12, 15])
+    route.add_argument("--max-stops", type=int, default=5)
+    route.add_argument("--requests", type=int, default=20)
+    route.add_argument("--reference-max", type=int, default=8,
+                       help="Largest candidate set also solved by brute force.")
+
+    itineraries = sub.add_parser("itineraries", help="Lazy per-alternative itineraries vs eager generation.")
+    itineraries.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    itineraries.add_argument("--size", type=int, default=10_000)
+    itineraries.add_argument("--requests", type=int, default=50)
+    itineraries.add_argument("--top-k", type=int, default=5)
+
+    startup = sub.add_parser("startup", help="Cold start in fresh processes: old launcher path vs fast path.")
+    startup.add_argument("--source", default="travel_data.docx", help="Data file to copy into a scratch directory.")
+    startup.add_argument("--repeats", type=int, default=7)
+
+    mapped = sub.add_parser("mmap", help="Memory-mapped catalog vs snapshot: open time, worker memory, equivalence.")
+    mapped.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    mapped.add_argument("--size", type=int, default=100_000)
+    mapped.add_argument("--requests", type=int, default=30)
+    mapped.add_argument("--workers", type=int, default=4, help="Concurrent worker processes for the memory check.")
+
+    session = sub.add_parser("session", help="Incremental re-planning when one input changes vs full planning.")
+    session.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    session.add_argument("--size", type=int, default=100_000)
+    session.add_argument("--steps", type=int, default=200)
+
+    cube = sub.add_parser("cube", help="Precomputed answer cube: build time, size, lookup vs live ranking.")
+    cube.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    cube.add_argument("--sizes", type=int, nargs="+", default=[300, 2_000, 20_000])
+    cube.add_argument("--top-k", type=int, default=3)
+    cube.add_argument("--requests", type=int, default=200)
+    cube.add_argument("--verify", type=int, default=500, help="Random lookups checked against live scoring.")
+
+    retrieval = sub.add_parser("retrieval", help="Embedding-index retrieval + exact rerank: recall@k and latency vs brute force.")
+    retrieval.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    retrieval.add_argument("--sizes", type=int, nargs="+", default=[20_000, 50_000, 100_000])
+    retrieval.add_argument("--pools", type=int, nargs="+", default=[256, 1024, 4096])
+    retrieval.add_argument("--top-k", type=int, default=10)
+    retrieval.add_argument("--requests", type=int, default=200)
+    retrieval.add_argument("--per-list", type=int, default=None,
+                           help="Candidates per probed list (default: pool spread over EmbeddingIndex.PROBE_LISTS lists).")
+    retrieval.add_argument("--target-recall", type=float, default=0.9)
+
+    suite = sub.add_parser("suite", help="Time every pipeline stage per catalog size; compare to a baseline.")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                       help="Catalog sizes (add 1000000 for the full scale run).")
+    suite.add_argument("--requests", type=int, default=10)
+    suite.add_argument("--seed", type=int, default=7, help="Synthetic catalog seed.")
+    suite.add_argument("--output", default="bench_results.json")
+    suite.add_argument("--baseline", default="bench_baseline.json")
+    suite.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown as a fraction.")
+    suite.add_argument("--update-baseline", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "snapshot":
+        return bench_snapshot(args.source, args.reruns, args.max_ratio)
+    if args.command == "scoring":
+        return bench_scoring(args.seed, args.size, args.requests)
+    if args.command == "budget":
+        return bench_budget(args.seed, args.sizes, args.requests)
+    if args.command == "interests":
+        return bench_interests(args.seed, args.sizes, args.requests)
+    if args.command == "activities":
+        return bench_activities(args.durations, args.pools, args.reference_max)
+    if args.command == "concurrency":
+        return bench_concurrency(args.seed, args.size, args.requests, args.workers)
+    if args.command == "batch":
+        return bench_batch(args.seed, args.size, args.profiles, args.workers)
+    if args.command == "tracing":
+        return bench_tracing(args.seed, args.size, args.requests)
+    if args.command == "memory":
+        return bench_memory(args.seed, args.sizes)
+    if args.command == "ingest":
+        return bench_ingest(args.seed, args.size, args.bad_records)
+    if args.command == "mutations":
+        return bench_mutations(args.seed, args.sizes, args.mutations, args.requests)
+    if args.command == "shards":
+        return bench_shards(args.seed, args.size, args.shards, args.requests)
+    if args.command == "route":
+        return bench_route(args.seed, args.size, args.candidates, args.max_stops, args.requests, args.reference_max)
+    if args.command == "itineraries":
+        return bench_itineraries(args.seed, args.size, args.requests, args.top_k)
+    if args.command == "startup":
+        return bench_startup(args.source, args.repeats)
+    if args.command == "mmap":
+        return bench_mapped(args.seed, args.size, args.requests, args.workers)
+    if args.command == "session":
+        return bench_session(args.seed, args.size, args.steps)
+    if args.command == "cube":
+        return bench_cube(args.seed, args.sizes, args.top_k, args.requests, args.verify)
+    if args.command == "retrieval":
+        return bench_retrieval(args.seed, args.sizes, args.pools, args.top_k, args.requests,
+                               args.per_list, args.target_recall)
+    if args.command == "suite":
+        return bench_suite(args.sizes, args.requests, args.seed, args.output, args.baseline,
+                           args.tolerance, args.update_baseline)
+    if args.command == "topk":
+        return bench_topk(args.seed, args.sizes, args.k, args.requests)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1340 @@
+import argparse
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import pickle
+import random
+import struct
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from travel_core import (
+    PAK_CITIES_COORDS, VOCABULARY, CatalogBuilder, DistanceMatrix, PlanningCache, ScoredDestination, ScoringEngine,
+    TagIndex, TravelAgent, load_json_from_docx,
+)
+
+# Constants
+SNAPSHOT_MAGIC = b"TRVLCAT\x00"
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_SUFFIX = ".snapshot"
+
+CATALOG_SHAPE_ERROR = "catalog must be an object with a 'destinations' array"
+REQUIRED_FIELDS = ("id", "name", "country", "avg_daily_cost", "tags", "coords", "activities", "hotel_reco")
+
+STREAM_SUFFIXES = (".jsonl", ".ndjson")
+STREAM_CHUNK_CHARS = 1 << 16
+MAX_RECORD_CHARS = 1 << 20
+MAX_REPORTED_PROBLEMS = 100
+
+# --- Source Handling ---
+def snapshot_path_for(filepath: str) -> str:
+    """Snapshot lives next to its source: travel_data.docx -> travel_data.docx.snapshot"""
+    return filepath + SNAPSHOT_SUFFIX
+
+def hash_source(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def is_stream_source(filepath: str) -> bool:
+    """JSON Lines sources are always streamed, never loaded as one document."""
+    return filepath.lower().endswith(STREAM_SUFFIXES)
+
+def parse_source(filepath: str) -> Dict[str, Any]:
+    """Parses a plain .json file, a JSON Lines file, or the JSON text stored inside a .docx file."""
+    if is_stream_source(filepath):
+        try:
+            records = []
+            for _, record, error in stream_records(filepath):
+                if error is not None:
+                    return {"error": f"Failed to read/parse JSON Lines: {error}"}
+                records.append(record)
+            return {"destinations": records}
+        except FileNotFoundError:
+            return {"error": f"Data file not found at: {filepath}"}
+        except Exception as e:
+            return {"error": f"Failed to read/parse JSON Lines: {e}"}
+    if filepath.lower().endswith(".json"):
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"error": f"Data file not found at: {filepath}"}
+        except Exception as e:
+            return {"error": f"Failed to read/parse JSON: {e}"}
+    return load_json_from_docx(filepath)
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _is_str_list(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def validate_destination(dest: Any, label: str, seen_ids) -> List[str]:
+    """Problems with one destination record; an empty list means it can be loaded."""
+    if not isinstance(dest, dict):
+        return [f"{label}: not an object"]
+    missing = [field for field in REQUIRED_FIELDS if field not in dest]
+    if missing:
+        return [f"{label}: missing {', '.join(missing)}"]
+    if not isinstance(dest["id"], (str, int)) or isinstance(dest["id"], bool):
+        return [f"{label}: id must be a string or integer"]
+
+    label = f"{label} ({dest['id']})"
+    problems = []
+    if dest["id"] in seen_ids:
+        problems.append(f"{label}: duplicate id")
+    if not all(isinstance(dest[field], str) for field in ("name", "country", "hotel_reco")):
+        problems.append(f"{label}: name, country and hotel_reco must be strings")
+    if not _is_number(dest["avg_daily_cost"]):
+        problems.append(f"{label}: avg_daily_cost must be a number")
+    if not _is_str_list(dest["tags"]):
+        problems.append(f"{label}: tags must be a list of strings")
+    if (not isinstance(dest["coords"], (list, tuple)) or len(dest["coords"]) != 2
+            or not all(_is_number(c) for c in dest["coords"])):
+        problems.append(f"{label}: coords must be [x, y]")
+    if not isinstance(dest["activities"], dict) or not all(_is_str_list(a) for a in dest["activities"].values()):
+        problems.append(f"{label}: activities must be an object of string lists")
+    if not _is_str_list(dest.get("local_transport", [])):
+        problems.append(f"{label}: local_transport must be a list of strings")
+    return problems
+
+def validate_catalog(data: Dict[str, Any]) -> List[str]:
+    """Returns a list of problems; an empty list means every destination can be loaded."""
+    if not isinstance(data, dict) or not isinstance(data.get("destinations"), list):
+        return [CATALOG_SHAPE_ERROR]
+
+    problems = []
+    seen_ids = set()
+    for i, dest in enumerate(data["destinations"]):
+        problems.extend(validate_destination(dest, f"destinations[{i}]", seen_ids))
+        if isinstance(dest, dict) and isinstance(dest.get("id"), (str, int)):
+            seen_ids.add(dest["id"])
+    return problems
+
+# --- Streaming Ingestion ---
+# Records are yielded as (label, record, error) with exactly one of record/error set,
+# so callers can report a bad record and keep going.
+JSON_WHITESPACE = " \t\r\n"
+
+def iter_json_lines(f) -> Iterator[Tuple[str, Any, Optional[str]]]:
+    """One record per non-blank line; a malformed line is reported and skipped."""
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        label = f"line {lineno}"
+        try:
+            yield label, json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield label, None, f"{label}: invalid JSON ({e.msg})"
+
+def iter_json_array(f) -> Iterator[Tuple[str, Any, Optional[str]]]:
+    """
+    Incrementally decodes a top-level array, or the array of a catalog object whose
+    first key is "destinations"; any other shape gets the CATALOG_SHAPE_ERROR a whole-file
+    load reports. Holds one read chunk plus the record being decoded. A syntax error
+    inside the array ends the stream (there is no reliable point to resume from) and is
+    reported as the last item; records before it are still delivered.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos = "", 0
+
+    def read_more() -> bool:
+        nonlocal buffer, pos
+        chunk = f.read(STREAM_CHUNK_CHARS)
+        buffer, pos = buffer[pos:] + chunk, 0
+        return bool(chunk)
+
+    def peek() -> str:
+        """Next non-whitespace character ("" at end of input); does not consume it."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in JSON_WHITESPACE:
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                return ""
+
+    if peek() == "{":
+        # Only a catalog whose first key is "destinations" can be streamed; the key is
+        # decoded in place, so a "destinations" string inside another value never matches.
+        pos += 1
+        key = None
+        if peek() == '"':
+            while True:
+                try:
+                    key, pos = decoder.raw_decode(buffer, pos)
+                    break
+                except json.JSONDecodeError:
+                    if len(buffer) - pos > MAX_RECORD_CHARS or not read_more():
+                        break
+        if key != "destinations" or peek() != ":":
+            yield "catalog", None, CATALOG_SHAPE_ERROR
+            return
+        pos += 1
+    if peek() != "[":
+        yield "catalog", None, CATALOG_SHAPE_ERROR
+        return
+    pos += 1
+
+    index = 0
+    while True:
+        next_char = peek()
+        if next_char == "]":
+            return
+        label = f"destinations[{index}]"
+        if next_char == "":
+            yield label, None, f"{label}: unexpected end of file"
+            return
+        while True:
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError as e:
+                if len(buffer) - pos > MAX_RECORD_CHARS or not read_more():
+                    yield label, None, f"{label}: invalid JSON ({e.msg}); stopped reading"
+                    return
+        yield label, record, None
+        index += 1
+
+        next_char = peek()
+        if next_char == ",":
+            pos += 1
+        elif next_char != "]":
+            yield label, None, f"{label}: expected ',' or ']' after record; stopped reading"
+            return
+
+def stream_records(filepath: str) -> Iterator[Tuple[str, Any, Optional[str]]]:
+    """Streams the destination records of a .json or JSON Lines file (.docx text is read whole)."""
+    if filepath.lower().endswith(".docx"):
+        data = load_json_from_docx(filepath)
+        if "error" in data:
+            yield "catalog", None, data["error"]
+            return
+        for i, record in enumerate(data.get("destinations", [])):
+            yield f"destinations[{i}]", record, None
+        return
+    with open(filepath, "r", encoding="utf-8") as f:
+        if is_stream_source(filepath):
+            yield from iter_json_lines(f)
+        else:
+            yield from iter_json_array(f)
+
+class IngestReport:
+    """Outcome of a streaming ingest: counts plus the first MAX_REPORTED_PROBLEMS problems."""
+    def __init__(self, source: str):
+        self.source = source
+        self.accepted = 0
+        self.rejected = 0
+        self.problems: List[str] = []
+        self.error: Optional[str] = None
+        self.seconds = 0.0
+
+    def reject(self, problem: str):
+        self.rejected += 1
+        if len(self.problems) < MAX_REPORTED_PROBLEMS:
+            self.problems.append(problem)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "problems": self.problems,
+            "error": self.error,
+            "seconds": round(self.seconds, 3),
+        }
+
+def ingest_catalog(filepath: str, version: str = "") -> Tuple[Optional[TravelAgent], IngestReport]:
+    """
+    Streams a .json or JSON Lines catalog into a TravelAgent. Each record is validated
+    and fed to a CatalogBuilder as it is decoded, then dropped; bad records are counted
+    in the report and skipped. Returns (None, report) only if nothing could be loaded.
+    """
+    report = IngestReport(filepath)
+    started = time.perf_counter()
+    builder = CatalogBuilder()
+    try:
+        for label, record, error in stream_records(filepath):
+            problems = [error] if error is not None else validate_destination(record, label, builder.row_of)
+            if not problems:
+                try:
+                    builder.add(record)
+                except (TypeError, ValueError) as e:
+                    problems = [f"{label}: {e}"]
+            if problems:
+                report.reject("; ".join(problems))
+    except FileNotFoundError:
+        report.error = f"Data file not found at: {filepath}"
+    except (OSError, UnicodeDecodeError) as e:
+        report.error = f"Failed to read {filepath}: {e}"
+
+    report.accepted = len(builder)
+    if report.error is None and not report.accepted:
+        report.error = "No valid destinations in " + filepath
+    agent = builder.build(version) if report.accepted else None
+    report.seconds = time.perf_counter() - started
+    return agent, report
+
+# --- Snapshot Format ---
+# MAGIC | pickle(header) | pickle(data)
+# The header is unpickled on its own so a stale snapshot is rejected without
+# deserializing the whole catalog.
+
+def write_snapshot(snapshot_path: str, header: Dict[str, Any], data: Dict[str, Any]):
+    """Writes atomically so a concurrent reader never sees a half-written file."""
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, snapshot_path)
+
+def read_snapshot_header(f) -> Optional[Dict[str, Any]]:
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        return None
+    try:
+        header = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(header, dict) or header.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return header
+
+def build_snapshot(filepath: str, snapshot_path: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Parses and validates the source, then writes its snapshot. Returns (data, header)."""
+    snapshot_path = snapshot_path or snapshot_path_for(filepath)
+    started = time.perf_counter()
+
+    try:
+        stat = os.stat(filepath)
+        source_hash = hash_source(filepath)
+    except FileNotFoundError:
+        return {"error": f"Data file not found at: {filepath}"}, {}
+
+    data = parse_source(filepath)
+    if "error" in data:
+        return data, {}
+    problems = validate_catalog(data)
+    if problems:
+        return {"error": "Invalid catalog: " + "; ".join(problems[:5])}, {}
+
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "source": os.path.abspath(filepath),
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_size": stat.st_size,
+        "source_sha256": source_hash,
+        "destinations": len(data["destinations"]),
+        "built_at": time.time(),
+        "build_seconds": time.perf_counter() - started,
+    }
+    try:
+        write_snapshot(snapshot_path, header, data)
+    except OSError:
+        # A read-only deployment still gets a valid catalog, just no cache.
+        pass
+    return data, header
+
+def open_catalog(filepath: str, snapshot_path: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Returns (data, header) for the catalog at filepath, reading only the snapshot
+    when it is current. A snapshot is current when the source mtime and size match;
+    if only the mtime moved, the content hash decides and the header is refreshed.
+    header["cached"] is True when the snapshot was used as-is.
+    """
+    snapshot_path = snapshot_path or snapshot_path_for(filepath)
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return {"error": f"Data file not found at: {filepath}"}, {}
+
+    try:
+        with open(snapshot_path, "rb") as f:
+            header = read_snapshot_header(f)
+            if header is not None and header["source_size"] == stat.st_size:
+                if header["source_mtime_ns"] == stat.st_mtime_ns:
+                    return pickle.load(f), dict(header, cached=True)
+                if header["source_sha256"] == hash_source(filepath):
+                    data = pickle.load(f)
+                    header = dict(header, source_mtime_ns=stat.st_mtime_ns)
+                    try:
+                        write_snapshot(snapshot_path, header, data)
+                    except OSError:
+                        pass
+                    return data, dict(header, cached=True)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    return build_snapshot(filepath, snapshot_path)
+
+def load_catalog(filepath: str) -> Dict[str, Any]:
+    """Drop-in replacement for load_json_from_docx that goes through the snapshot."""
+    data, _ = open_catalog(filepath)
+    return data
+
+# --- Mapped Catalog Format ---
+# A fixed-width binary catalog that worker processes open with mmap, so all of them read
+# one page-cache copy instead of each parsing its own. Little-endian; sections start on
+# 8-byte boundaries, and the header is followed by an (offset, length) pair per section:
+#   cost         float64[n]             avg_daily_cost
+#   coords       float64[n, 2]
+#   flags        uint8[n]               MAPPED_INT_* bits: which values were ints in the source
+#   tags         uint64[n, tag_words]   bit t set = the row has tag_names[t]
+#   fields       uint32[n, 6]           string refs for MAPPED_FIELDS
+#   id_order     uint32[n]              rows sorted by id bytes, for binary-search lookups
+#   tag_names    uint32[tag_count]      string refs
+#   str_offsets  uint64[strings + 1]    string i is str_data[str_offsets[i]:str_offsets[i + 1]]
+#   str_data     UTF-8; equal strings are stored once
+#   origins          float64[origins, 2]   distinct PAK_CITIES_COORDS, in DistanceMatrix row order
+#   distance_scores  float64[origins, n]   DistanceMatrix.distance_scores
+#   flight_costs     int64[origins, n]     DistanceMatrix.flight_costs
+# activities and local_transport are stored as compact JSON strings. The distance block is
+# the bulk of a worker's index memory, so it is mapped like the columns instead of rebuilt.
+MAPPED_MAGIC = b"TRVLMAP\x00"
+MAPPED_FORMAT = 2
+MAPPED_SUFFIX = ".tcat"
+# magic, format, header size, destinations, tag count, tag words, source sha256
+MAPPED_HEADER = struct.Struct("<8sIIQII32s")
+MAPPED_SECTIONS = ("cost", "coords", "flags", "tags", "fields", "id_order", "tag_names", "str_offsets", "str_data",
+                   "origins", "distance_scores", "flight_costs")
+MAPPED_TABLE = struct.Struct("<" + "QQ" * len(MAPPED_SECTIONS))
+MAPPED_FIELDS = ("id", "name", "country", "hotel_reco", "activities", "local_transport")
+MAPPED_INT_COST, MAPPED_INT_ID, MAPPED_INT_COORDS = 1, 2, 4
+
+def _align8(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def is_mapped_source(filepath: str) -> bool:
+    return filepath.lower().endswith(MAPPED_SUFFIX)
+
+def mapped_path_for(filepath: str) -> str:
+    """Mapped catalog lives next to its source: travel_data.docx -> travel_data.tcat"""
+    return os.path.splitext(filepath)[0] + MAPPED_SUFFIX
+
+def write_mapped_catalog(path: str, data: Dict[str, Any], source_sha256: str = "") -> Dict[str, Any]:
+    """Writes a validated catalog in the mapped format (atomically). Returns a summary."""
+    destinations = data["destinations"]
+    n = len(destinations)
+    strings: Dict[str, int] = {}
+    tag_bit: Dict[str, int] = {}
+    for dest in destinations:
+        for tag in dest["tags"]:
+            tag_bit.setdefault(tag, len(tag_bit))
+    tag_words = max(1, (len(tag_bit) + 63) // 64)
+
+    cost = np.array([dest["avg_daily_cost"] for dest in destinations], dtype=np.float64)
+    coords = np.array([dest["coords"] for dest in destinations], dtype=np.float64).reshape(n, 2)
+    encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    flags, masks, refs = [], [], []
+    for dest in destinations:
+        flags.append(MAPPED_INT_COST * isinstance(dest["avg_daily_cost"], int)
+                     | MAPPED_INT_ID * isinstance(dest["id"], int)
+                     | MAPPED_INT_COORDS * all(isinstance(c, int) for c in dest["coords"]))
+        mask = 0
+        for tag in dest["tags"]:
+            mask |= 1 << tag_bit[tag]
+        masks.extend((mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF for word in range(tag_words))
+        refs.extend(strings.setdefault(text, len(strings)) for text in (
+            str(dest["id"]), dest["name"], dest["country"], dest["hotel_reco"],
+            encode(dest["activities"]), encode(dest.get("local_transport", [])),
+        ))
+    flags = np.array(flags, dtype=np.uint8)
+    tags = np.array(masks, dtype=np.uint64).reshape(n, tag_words)
+    fields = np.array(refs, dtype=np.uint32).reshape(n, len(MAPPED_FIELDS))
+    # Ordered by (id text, is-int) so that 7 and "7" are distinct, adjacent entries.
+    id_order = np.array(sorted(range(n), key=lambda row: (str(destinations[row]["id"]).encode("utf-8"),
+                                                          bool(flags[row] & MAPPED_INT_ID))),
+                        dtype=np.uint32)
+    tag_names = np.array([strings.setdefault(tag, len(strings)) for tag in tag_bit], dtype=np.uint32)
+    encoded = [text.encode("utf-8") for text in strings]
+    str_offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    str_offsets[1:] = np.cumsum(np.fromiter(map(len, encoded), dtype=np.uint64, count=len(encoded)))
+    matrix = DistanceMatrix(PAK_CITIES_COORDS, coords)
+    origins = np.array(list(matrix.row_of_coords), dtype=np.float64).reshape(-1, 2)
+
+    payloads = [cost.tobytes(), coords.tobytes(), flags.tobytes(), tags.tobytes(), fields.tobytes(),
+                id_order.tobytes(), tag_names.tobytes(), str_offsets.tobytes(), b"".join(encoded),
+                origins.tobytes(), matrix.distance_scores.tobytes(), matrix.flight_costs.tobytes()]
+    header_size = _align8(MAPPED_HEADER.size + MAPPED_TABLE.size)
+    table, offset = [], header_size
+    for payload in payloads:
+        table += [offset, len(payload)]
+        offset = _align8(offset + len(payload))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAPPED_HEADER.pack(MAPPED_MAGIC, MAPPED_FORMAT, header_size, n, len(tag_bit), tag_words,
+                                   bytes.fromhex(source_sha256) if source_sha256 else bytes(32)))
+        f.write(MAPPED_TABLE.pack(*table))
+        for payload, start in zip(payloads, table[::2]):
+            f.write(b"\x00" * (start - f.tell()))
+            f.write(payload)
+    os.replace(tmp_path, path)
+    return {"format": MAPPED_FORMAT, "destinations": n, "tags": len(tag_bit), "strings": len(encoded),
+            "bytes": os.path.getsize(path)}
+
+def build_mapped_catalog(filepath: str, output: Optional[str] = None) -> Dict[str, Any]:
+    """Converts a .docx/.json catalog (through its snapshot) into the mapped format."""
+    data, header = open_catalog(filepath)
+    if "error" in data:
+        return data
+    return dict(write_mapped_catalog(output or mapped_path_for(filepath), data, header["source_sha256"]),
+                output=output or mapped_path_for(filepath))
+
+class MappedCatalog:
+    """
+    Reader for the mapped format. Columns are numpy views straight onto the map, with no
+    parsing and no copies. The map is copy-on-write (ACCESS_COPY), so its pages stay
+    shared between processes unless one of them edits its catalog. Pickles by path, so
+    pool workers reopen the same file. Raises ValueError for a bad or unsupported file.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        if len(self._map) < MAPPED_HEADER.size + MAPPED_TABLE.size:
+            raise ValueError(f"{path}: truncated mapped catalog")
+        magic, fmt, _, count, tag_count, self.tag_words, sha = MAPPED_HEADER.unpack_from(self._map, 0)
+        if magic != MAPPED_MAGIC:
+            raise ValueError(f"{path}: not a mapped catalog")
+        if fmt != MAPPED_FORMAT:
+            raise ValueError(f"{path}: mapped catalog format {fmt}, expected {MAPPED_FORMAT}")
+        self.count = count
+        self.source_sha256 = sha.hex() if any(sha) else ""
+
+        table = MAPPED_TABLE.unpack_from(self._map, MAPPED_HEADER.size)
+        sections = dict(zip(MAPPED_SECTIONS, zip(table[::2], table[1::2])))
+        if any(start + length > len(self._map) for start, length in sections.values()):
+            raise ValueError(f"{path}: truncated mapped catalog")
+
+        def view(name: str, dtype, *shape: int) -> np.ndarray:
+            start, length = sections[name]
+            return np.frombuffer(self._map, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                                 offset=start).reshape(shape)
+
+        self.cost = view("cost", np.float64, count)
+        self.coords = view("coords", np.float64, count, 2)
+        self.flags = view("flags", np.uint8, count)
+        self.tags = view("tags", np.uint64, count, self.tag_words)
+        self.fields = view("fields", np.uint32, count, len(MAPPED_FIELDS))
+        self.id_order = view("id_order", np.uint32, count)
+        self.str_offsets = view("str_offsets", np.uint64, -1)
+        self._data_start = sections["str_data"][0]
+        self.tag_names = [self.string(ref) for ref in view("tag_names", np.uint32, tag_count).tolist()]
+        self.origins = view("origins", np.float64, -1, 2)
+        self.distance_scores = view("distance_scores", np.float64, len(self.origins), count)
+        self.flight_costs = view("flight_costs", np.int64, len(self.origins), count)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, row: int) -> "MappedDestination":
+        if not 0 <= row < self.count:
+            raise IndexError(row)
+        return MappedDestination(self, row)
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path: str):
+        self.__init__(path)
+
+    def _bytes(self, ref: int) -> bytes:
+        start = self._data_start + int(self.str_offsets[ref])
+        return self._map[start:self._data_start + int(self.str_offsets[ref + 1])]
+
+    def string(self, ref: int) -> str:
+        return self._bytes(ref).decode("utf-8")
+
+    def field(self, row: int, name: str) -> str:
+        return self.string(int(self.fields[row, MAPPED_FIELDS.index(name)]))
+
+    def find(self, dest_id: Any) -> Optional[int]:
+        """Row of dest_id (None if absent): binary search over id_order, no per-process id table."""
+        key = (str(dest_id).encode("utf-8"), isinstance(dest_id, int) and not isinstance(dest_id, bool))
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_key(int(self.id_order[mid])) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count:
+            return None
+        row = int(self.id_order[lo])
+        return row if self._id_key(row) == key else None
+
+    def _id_key(self, row: int) -> Tuple[bytes, bool]:
+        return self._bytes(int(self.fields[row, 0])), bool(self.flags[row] & MAPPED_INT_ID)
+
+    def tag_set(self, row: int) -> frozenset:
+        names = []
+        for word_index, word in enumerate(self.tags[row].tolist()):
+            while word:
+                low = word & -word
+                names.append(self.tag_names[64 * word_index + low.bit_length() - 1])
+                word ^= low
+        return VOCABULARY.tag_set(names)
+
+    def distance_matrix(self) -> Optional[DistanceMatrix]:
+        """The mapped origin x row block, or None if it was written for other origin coordinates."""
+        if [tuple(coords) for coords in self.origins.tolist()] != list(DistanceMatrix.origin_rows(PAK_CITIES_COORDS)):
+            return None
+        return DistanceMatrix.from_arrays(PAK_CITIES_COORDS, self.distance_scores, self.flight_costs)
+
+    def tag_index(self) -> TagIndex:
+        """Per-tag packed bitsets from the row masks (n/8 bytes per tag; the masks stay mapped)."""
+        postings = {}
+        for bit, tag in enumerate(self.tag_names):
+            word = self.tags[:, bit // 64]
+            postings[tag] = np.packbits(((word >> np.uint64(bit % 64)) & np.uint64(1)).astype(bool))
+        return TagIndex.from_postings(self.count, postings)
+
+class MappedDestination:
+    """A Destination-like view of one mapped row; every field is read from the map on access."""
+    __slots__ = ("catalog", "row")
+
+    def __init__(self, catalog: MappedCatalog, row: int):
+        self.catalog = catalog
+        self.row = row
+
+    @property
+    def id(self):
+        dest_id = self.catalog.field(self.row, "id")
+        return int(dest_id) if self.catalog.flags[self.row] & MAPPED_INT_ID else dest_id
+
+    @property
+    def name(self) -> str:
+        return self.catalog.field(self.row, "name")
+
+    @property
+    def country(self) -> str:
+        return self.catalog.field(self.row, "country")
+
+    @property
+    def hotel_reco(self) -> str:
+        return self.catalog.field(self.row, "hotel_reco")
+
+    @property
+    def cost(self):
+        cost = float(self.catalog.cost[self.row])
+        return int(cost) if self.catalog.flags[self.row] & MAPPED_INT_COST else cost
+
+    @property
+    def coords(self) -> Tuple:
+        x, y = self.catalog.coords[self.row].tolist()
+        return (int(x), int(y)) if self.catalog.flags[self.row] & MAPPED_INT_COORDS else (x, y)
+
+    @property
+    def tags(self) -> frozenset:
+        return self.catalog.tag_set(self.row)
+
+    @property
+    def activities(self) -> Dict[str, Tuple[str, ...]]:
+        return {tag: tuple(names) for tag, names in json.loads(self.catalog.field(self.row, "activities")).items()}
+
+    @property
+    def local_transport(self) -> Tuple[str, ...]:
+        return VOCABULARY.sequence(json.loads(self.catalog.field(self.row, "local_transport")))
+
+# A mapped agent is read from the file, but upsert()/delete() still work: edited rows and
+# ids go to small per-process overlays (and their column pages are copied on write).
+class MappedDestinations:
+    """agent.all_destinations for a mapped agent: rows are MappedDestination views."""
+    def __init__(self, catalog: MappedCatalog):
+        self.catalog = catalog
+        self.size = len(catalog)
+        self.overlay: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self.size))]
+        if row < 0:
+            row += self.size
+        if not 0 <= row < self.size:
+            raise IndexError(row)
+        dest = self.overlay.get(row)
+        return dest if dest is not None else MappedDestination(self.catalog, row)
+
+    def __iter__(self) -> Iterator[Any]:
+        return (self[row] for row in range(self.size))
+
+    def __setitem__(self, row: int, dest: Any):
+        self.overlay[row] = dest
+
+    def append(self, dest: Any):
+        self.overlay[self.size] = dest
+        self.size += 1
+
+    def pop(self) -> Any:
+        dest = self[self.size - 1]
+        self.size -= 1
+        self.overlay.pop(self.size, None)
+        return dest
+
+class MappedRowIndex:
+    """engine.row_of for a mapped agent: lookups binary-search the file, edits go to an overlay."""
+    def __init__(self, catalog: MappedCatalog):
+        self.catalog = catalog
+        self.overlay: Dict[Any, Optional[int]] = {}
+
+    def get(self, dest_id: Any, default: Optional[int] = None) -> Optional[int]:
+        row = self.overlay[dest_id] if dest_id in self.overlay else self.catalog.find(dest_id)
+        return default if row is None else row
+
+    def __getitem__(self, dest_id: Any) -> int:
+        row = self.get(dest_id)
+        if row is None:
+            raise KeyError(dest_id)
+        return row
+
+    def __contains__(self, dest_id: Any) -> bool:
+        return self.get(dest_id) is not None
+
+    def __setitem__(self, dest_id: Any, row: int):
+        self.overlay[dest_id] = row
+
+    def pop(self, dest_id: Any, default: Optional[int] = None) -> Optional[int]:
+        row = self.get(dest_id)
+        self.overlay[dest_id] = None
+        return default if row is None else row
+
+def open_mapped_agent(path: str, catalog: Optional[MappedCatalog] = None) -> TravelAgent:
+    """TravelAgent whose columns are views onto a mapped catalog (raises OSError/ValueError)."""
+    catalog = catalog or MappedCatalog(path)
+    engine = ScoringEngine.from_columns(MappedRowIndex(catalog), catalog.cost, catalog.coords, catalog.tag_index(),
+                                        catalog.distance_matrix())
+    return TravelAgent.from_engine(MappedDestinations(catalog), engine, catalog.source_sha256[:12])
+
+# --- Answer Cube ---
+# The UI's ranking inputs are finite: 20 origins (18 distinct coordinates), subsets of 8
+# interests and budgets 50..3000 in steps of 10. The cube stores the top-k rows for every
+# (origin coords, interest subset, budget) cell; lookups rescore just those k rows, so
+# scores and flight costs are exactly the live ones. Layout: CUBE_MAGIC, uint32 header
+# length, JSON header, padding to 8 bytes, then rows[origin, subset, budget, k] with the
+# dtype's max value marking "fewer than k affordable".
+CUBE_MAGIC = b"TRVLCUBE"
+CUBE_FORMAT = 1
+CUBE_SUFFIX = ".cube"
+CUBE_INTERESTS = ["beach", "adventure", "mountains", "history", "nightlife", "food", "art", "gardens"]
+CUBE_BUDGETS = (50, 3000, 10)
+# Budgets are processed in blocks whose highest budget is at most CUBE_BLOCK_SPREAD times
+# the lowest (at most CUBE_BUDGET_BLOCK budgets), which keeps the candidate bounds tight.
+CUBE_BUDGET_BLOCK = 32
+CUBE_BLOCK_SPREAD = 1.25
+# Margin on the candidate bounds so float rounding cannot drop a row that ties the cut.
+CUBE_BOUND_SLACK = 1e-9
+# Build time and memory grow linearly with the catalog (about 25 s and 45 MB at 20k
+# destinations); above this, rank() scoring live is the better trade.
+CUBE_MAX_DESTINATIONS = 20_000
+
+def cube_path_for(filepath: str) -> str:
+    """Cube lives next to its source: travel_data.docx -> travel_data.docx.cube"""
+    return filepath + CUBE_SUFFIX
+
+def build_answer_cube(agent: TravelAgent, path: str, top_k: int = 3) -> Dict[str, Any]:
+    """
+    Materializes the cube for agent's current catalog. Returns a build/size report, or
+    {"error"} for catalogs above CUBE_MAX_DESTINATIONS.
+
+    Works one interest subset and one block of CUBE_BUDGET_BLOCK budgets at a time. Rows
+    sorted by cost make "affordable somewhere in the block" and "affordable in the whole
+    block" two prefixes. A row whose best possible score in the block is below the k-th
+    best guaranteed score of the whole-block rows cannot reach any cell's top k, so only
+    the remaining candidates are scored exactly.
+    """
+    engine = agent.engine
+    n = engine.size
+    if n > CUBE_MAX_DESTINATIONS:
+        return {"error": f"{n} destinations is above the answer cube limit of {CUBE_MAX_DESTINATIONS}; "
+                         "rank() scores live instead"}
+    started = time.perf_counter()
+    origins = list(dict.fromkeys(tuple(coords) for coords in PAK_CITIES_COORDS.values()))
+    low, high, step = CUBE_BUDGETS
+    budgets = np.arange(low, high + 1, step, dtype=np.float64)
+    dtype = next(t for t in (np.uint8, np.uint16, np.uint32) if np.iinfo(t).max > n)
+    table = np.full((len(origins), 1 << len(CUBE_INTERESTS), len(budgets), top_k), np.iinfo(dtype).max, dtype=dtype)
+
+    cost = engine.cost
+    rows = np.arange(n, dtype=np.intp)
+    by_cost = np.argsort(cost, kind="stable")
+    sorted_cost = cost[by_cost]
+    distance_terms = np.stack([engine.distance_score(coords, rows) for coords in origins]) * 0.05
+    depth = min(top_k, n)
+    blocks, first = [], 0
+    while first < len(budgets):
+        last = first + 1
+        while (last < len(budgets) and last - first < CUBE_BUDGET_BLOCK
+               and budgets[last] <= budgets[first] * CUBE_BLOCK_SPREAD):
+            last += 1
+        blocks.append((first, last))
+        first = last
+    for mask in range(1 << len(CUBE_INTERESTS)):
+        interests = {tag for bit, tag in enumerate(CUBE_INTERESTS) if mask >> bit & 1}
+        interest = engine.interest_match(interests, rows) * 0.55
+        # Interest + distance per origin, in cost order; only used for the bounds.
+        fixed = (interest + distance_terms)[:, by_cost]
+        for first, last in blocks:
+            block = budgets[first:last]
+            reach = int(np.searchsorted(sorted_cost, block[-1], side="right"))
+            whole = int(np.searchsorted(sorted_cost, block[0], side="right"))
+            candidates = by_cost[:reach]
+            if whole >= depth:
+                best = fixed[:, :reach] + np.minimum(sorted_cost[:reach] / block[0], 1.0) * 0.40
+                guaranteed = fixed[:, :whole] + (sorted_cost[:whole] / block[-1]) * 0.40
+                floor = np.partition(guaranteed, whole - depth, axis=1)[:, whole - depth]
+                candidates = candidates[(best >= floor[:, None] - CUBE_BOUND_SLACK).any(axis=0)]
+            if not len(candidates):
+                continue
+            # Ascending rows, so _top_rows' positional tie-break is rank()'s row order.
+            candidates = np.sort(candidates)
+            # Same arithmetic as ScoringEngine.utility_scores, where budget fit is cost / budget.
+            scores = ((interest[candidates][None, None, :] + (cost[candidates][None, :] / block[:, None]) * 0.40)
+                      + distance_terms[:, None, candidates])
+            scores[:, cost[candidates][None, :] > block[:, None]] = -np.inf
+            cell_depth = min(depth, len(candidates))
+            table[:, mask, first:last, :cell_depth] = candidates[_top_rows(-scores, cell_depth)]
+    affordable_counts = np.minimum(np.searchsorted(sorted_cost, budgets, side="right"), top_k)
+    for bucket, count in enumerate(affordable_counts.tolist()):
+        table[:, :, bucket, count:] = np.iinfo(dtype).max
+
+    header = {
+        "format": CUBE_FORMAT,
+        "version": agent.version,
+        "top_k": top_k,
+        "origins": [list(coords) for coords in origins],
+        "interests": CUBE_INTERESTS,
+        "budgets": list(CUBE_BUDGETS),
+        "dtype": np.dtype(dtype).name,
+        "shape": list(table.shape),
+        "destinations": n,
+    }
+    encoded = json.dumps(header).encode("utf-8")
+    offset = _align8(len(CUBE_MAGIC) + 4 + len(encoded))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CUBE_MAGIC + struct.pack("<I", len(encoded)) + encoded)
+        f.write(b"\x00" * (offset - f.tell()))
+        f.write(table.tobytes())
+    os.replace(tmp_path, path)
+    return {
+        "path": path, "cells": int(np.prod(table.shape[:3])), "top_k": top_k, "dtype": header["dtype"],
+        "bytes": os.path.getsize(path), "build_seconds": time.perf_counter() - started,
+    }
+
+def _top_rows(neg_scores: np.ndarray, depth: int) -> np.ndarray:
+    """
+    Row indexes of the `depth` lowest values along the last axis, ordered by (value, row)
+    like rank()'s tie-breaking. Partial selection per cell; the few cells with a tie
+    straddling the cut fall back to a stable full sort.
+    """
+    if depth * 8 >= neg_scores.shape[-1]:
+        return np.argsort(neg_scores, axis=-1, kind="stable")[..., :depth]
+    picked = np.argpartition(neg_scores, depth - 1, axis=-1)[..., :depth]
+    values = np.take_along_axis(neg_scores, picked, axis=-1)
+    best = np.take_along_axis(picked, np.lexsort((picked, values), axis=-1), axis=-1)
+    cut = values.max(axis=-1)
+    tied = np.isfinite(cut) & ((neg_scores <= cut[..., None]).sum(axis=-1) > depth)
+    if tied.any():
+        best[tied] = np.argsort(neg_scores[tied], axis=-1, kind="stable")[:, :depth]
+    return best
+
+class AnswerCube:
+    """
+    Read side of the cube (mmap, read-only). lookup() answers rank(user_input, top_k) for
+    inputs inside the table and returns None otherwise: another catalog version, top_k
+    None or above the cube's, a min_budget or interest-match filter, an off-grid budget,
+    an interest outside CUBE_INTERESTS, or an origin whose coordinates are not tabled.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(CUBE_MAGIC)] != CUBE_MAGIC:
+            raise ValueError(f"{path}: not an answer cube")
+        (length,) = struct.unpack_from("<I", self._map, len(CUBE_MAGIC))
+        self.header = json.loads(self._map[len(CUBE_MAGIC) + 4:len(CUBE_MAGIC) + 4 + length])
+        if self.header.get("format") != CUBE_FORMAT:
+            raise ValueError(f"{path}: answer cube format {self.header.get('format')}, expected {CUBE_FORMAT}")
+        self.version = self.header["version"]
+        self.top_k = self.header["top_k"]
+        self.table = np.frombuffer(self._map, dtype=self.header["dtype"], count=int(np.prod(self.header["shape"])),
+                                   offset=_align8(len(CUBE_MAGIC) + 4 + length)).reshape(self.header["shape"])
+        self.missing = np.iinfo(self.table.dtype).max
+        self.origin_index = {tuple(coords): i for i, coords in enumerate(self.header["origins"])}
+        self.interest_bit = {tag: bit for bit, tag in enumerate(self.header["interests"])}
+        self.budgets = self.header["budgets"]
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path: str):
+        self.__init__(path)
+
+    def cell(self, user_input: Dict[str, Any]) -> Optional[Tuple[int, int, int]]:
+        """(origin, subset, budget) indexes of user_input, or None when it is outside the table."""
+        if user_input.get("min_budget") or user_input.get("require_interest_match"):
+            return None
+        low, high, step = self.budgets
+        budget = float(user_input["budget"])
+        if not low <= budget <= high or (budget - low) % step:
+            return None
+        origin = self.origin_index.get(tuple(PAK_CITIES_COORDS.get(user_input.get("origin_city", "Karachi"), (65, 55))))
+        mask = 0
+        for tag in user_input["interests"]:
+            if tag not in self.interest_bit:
+                return None
+            mask |= 1 << self.interest_bit[tag]
+        if origin is None:
+            return None
+        return origin, mask, int(budget - low) // step
+
+    def lookup(self, agent: TravelAgent, user_input: Dict[str, Any],
+               top_k: Optional[int]) -> Optional[List[ScoredDestination]]:
+        cell = self.cell(user_input) if agent.version == self.version and top_k is not None and top_k <= self.top_k else None
+        if cell is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        rows = self.table[cell][:top_k]
+        rows = rows[rows != self.missing].astype(np.intp)
+        return agent.scored_results(rows, agent.engine.utility_scores(user_input, rows), user_input)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.version, "top_k": self.top_k, "cells": int(np.prod(self.table.shape[:3])),
+                "bytes": len(self._map), "hits": self.hits, "misses": self.misses}
+
+def verify_answer_cube(agent: TravelAgent, cube: AnswerCube, samples: int = 500, seed: int = 7) -> Tuple[int, int]:
+    """Compares random cube lookups with live calculate_utility_scores. Returns (checked, mismatches)."""
+    rng = random.Random(seed)
+    low, high, step = cube.budgets
+    mismatches = 0
+    for _ in range(samples):
+        user_input = {
+            "origin_city": rng.choice(list(PAK_CITIES_COORDS)),
+            "budget": rng.randrange(low, high + 1, step),
+            "interests": [tag for tag in cube.header["interests"] if rng.random() < 0.4],
+        }
+        top_k = rng.randint(1, cube.top_k)
+        got = cube.lookup(agent, user_input, top_k)
+        affordable = [agent.all_destinations[row] for row in sorted(agent.affordable_rows(user_input).tolist())]
+        expected = agent.calculate_utility_scores(affordable, user_input, top_k)
+        mismatches += got is None or [(r.id, r.utility_score, r.estimated_flight_cost) for r in got] != [
+            (r.id, r.utility_score, r.estimated_flight_cost) for r in expected]
+    return samples, mismatches
+
+def attach_answer_cube(agent: TravelAgent, path: str) -> Optional[AnswerCube]:
+    """Opens the cube at path for agent if it exists and matches the catalog version."""
+    try:
+        cube = AnswerCube(path)
+    except (OSError, ValueError):
+        return None
+    if cube.version != agent.version:
+        return None
+    agent.answer_cube = cube
+    return cube
+
+# --- Synthetic Catalog ---
+# Tag popularity roughly follows a Zipf curve: the UI's interests dominate, long-tail
+# tags are rare. Each tag has its own pool of activity templates.
+SYNTHETIC_TAGS = {
+    "food": ["Street Food Tour", "Cooking Class", "Night Market", "Tasting Menu"],
+    "history": ["Old Town Walk", "Castle Visit", "Archaeological Site", "History Museum"],
+    "culture": ["Temple Visit", "Folk Performance", "Craft Workshop", "Festival Day"],
+    "art": ["Art Museum", "Gallery Crawl", "Street Art Tour"],
+    "beach": ["Beach Day", "Snorkeling Trip", "Sunset Cruise", "Surf Lesson"],
+    "adventure": ["Zip Line", "Rafting", "Paragliding", "Canyoning"],
+    "nightlife": ["Rooftop Bars", "Live Music Club", "Night Cruise"],
+    "mountains": ["Summit Hike", "Cable Car Ride", "Alpine Lake Walk"],
+    "gardens": ["Botanical Garden", "Palace Gardens", "Tea Garden"],
+    "nature": ["National Park", "Waterfall Hike", "Wildlife Safari"],
+    "shopping": ["Bazaar Visit", "Design District"],
+    "romance": ["Candlelit Dinner", "River Boat Ride"],
+    "wellness": ["Spa Day", "Hot Springs"],
+    "desert": ["Dune Safari", "Desert Camp"],
+    "museums": ["Science Museum", "National Museum"],
+    "islands": ["Island Hopping", "Ferry Day Trip"],
+    "views": ["Observation Deck", "Viewpoint Hike"],
+    "wine": ["Vineyard Tour"],
+    "biking": ["City Bike Tour"],
+    "skiing": ["Ski Day"],
+}
+SYNTHETIC_REGIONS = [
+    # (center, spread, countries)
+    ((45, 80), 8, ["France", "Italy", "Spain", "Germany", "Netherlands", "Greece", "Portugal"]),
+    ((85, 50), 8, ["Japan", "China", "South Korea", "Vietnam", "Thailand"]),
+    ((68, 58), 6, ["Pakistan", "India", "Nepal", "Sri Lanka"]),
+    ((58, 52), 6, ["UAE", "Turkey", "Egypt", "Jordan", "Oman"]),
+    ((30, 25), 10, ["Brazil", "Argentina", "Peru", "Chile", "Colombia"]),
+    ((20, 70), 10, ["USA", "Canada", "Mexico"]),
+    ((55, 20), 10, ["South Africa", "Kenya", "Morocco", "Tanzania"]),
+    ((95, 15), 6, ["Australia", "New Zealand", "Indonesia"]),
+]
+SYNTHETIC_TRANSPORT = ["metro", "taxi", "bus", "walk", "tram", "rental_car", "rental_bike", "ferry", "shuttle"]
+SYNTHETIC_HOTELS = ["Boutique Hotel", "Budget Hostel", "Beach Resort", "Business Hotel", "Guesthouse", "Luxury Suites"]
+SYNTHETIC_SYLLABLES = ["ka", "ri", "to", "man", "sa", "lo", "ve", "na", "dor", "bel", "qu", "is", "ar", "po", "len"]
+
+def generate_synthetic_catalog(size: int, seed: int = 7) -> Dict[str, Any]:
+    """
+    Seeded synthetic catalog in the travel_data JSON format: Zipf-weighted tags (3-6 per
+    destination), log-normal daily costs (median ~$120, clipped to $20-$3000), coords
+    clustered by region, and 1-3 activities per tag.
+    """
+    rng = random.Random(seed)
+    tags = list(SYNTHETIC_TAGS)
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(tags))))
+
+    destinations = []
+    for i in range(size):
+        center, spread, countries = SYNTHETIC_REGIONS[rng.randrange(len(SYNTHETIC_REGIONS))]
+        name = "".join(rng.choice(SYNTHETIC_SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+
+        target = rng.randint(3, 6)
+        dest_tags = set(rng.choices(tags, cum_weights=cum_weights, k=target))
+        while len(dest_tags) < target:
+            dest_tags.add(rng.choices(tags, cum_weights=cum_weights)[0])
+        dest_tags = sorted(dest_tags)
+
+        activities = {
+            tag: [f"{name} {activity}" for activity in rng.sample(SYNTHETIC_TAGS[tag], min(len(SYNTHETIC_TAGS[tag]), rng.randint(1, 3)))]
+            for tag in dest_tags
+        }
+        destinations.append({
+            "id": f"syn_{i:07d}",
+            "name": name,
+            "country": rng.choice(countries),
+            "avg_daily_cost": int(min(3000, max(20, rng.lognormvariate(4.8, 0.6)))),
+            "tags": dest_tags,
+            "coords": [round(rng.gauss(center[0], spread), 1), round(rng.gauss(center[1], spread), 1)],
+            "activities": activities,
+            "hotel_reco": f"{rng.choice(SYNTHETIC_HOTELS)} in {name}",
+            "local_transport": rng.sample(SYNTHETIC_TRANSPORT, rng.randint(1, 3)),
+        })
+    return {"destinations": destinations}
+
+def write_catalog(filepath: str, data: Dict[str, Any]):
+    """Writes a catalog as one JSON document, or one destination per line for JSON Lines paths."""
+    with open(filepath, "w", encoding="utf-8") as f:
+        if is_stream_source(filepath):
+            for dest in data["destinations"]:
+                f.write(json.dumps(dest) + "\n")
+        else:
+            json.dump(data, f)
+
+# --- Shared Catalog ---
+SESSION_ACTIVE_SECONDS = 600
+
+class LoadedCatalog:
+    """One immutable catalog version: the agent built from it plus where it came from."""
+    def __init__(self, agent: TravelAgent, header: Dict[str, Any], source_stat: Tuple[int, int], build_seconds: float):
+        self.agent = agent
+        self.header = header
+        self.source_stat = source_stat
+        self.version = agent.version
+        self.loaded_at = time.time()
+        self.build_seconds = build_seconds
+
+class SharedCatalog:
+    """
+    Process-wide holder of the current TravelAgent for one data file, shared by every
+    session. When the source changes, a background thread builds the new version and
+    swaps it in with a single reference assignment; requests that already hold the
+    old agent finish on it, and new requests keep getting it until the swap.
+    With retrieval_pool > 0 every version gets an embedding index and ranks only the
+    candidates it retrieves (approximate; see TravelAgent.enable_retrieval).
+    """
+    def __init__(self, filepath: str, retrieval_pool: int = 0):
+        self.filepath = filepath
+        self.retrieval_pool = retrieval_pool
+        self.loaded: Optional[LoadedCatalog] = None
+        self.error: Optional[str] = None
+        self.failed_stat: Optional[Tuple[int, int]] = None
+        self.reloads = 0
+        self.mutations = 0
+        # Last streaming ingest (JSON Lines sources only), including rejected records.
+        self.ingest_report: Optional[IngestReport] = None
+        # Where the last (re)load spent its time, in ms: reading the source or snapshot, building indexes.
+        self.load_breakdown: Dict[str, float] = {}
+        self.planning_cache = PlanningCache()
+        self._reload_lock = threading.Lock()
+        # Guards the counters; separate from _reload_lock, which is held for a whole rebuild.
+        self._counter_lock = threading.Lock()
+        self._sessions: Dict[str, float] = {}
+
+    def _source_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _reload(self):
+        try:
+            source_stat = self._source_stat()
+            started = time.perf_counter()
+            VOCABULARY.clear()
+            agent, header, error = self._build_agent()
+            if error is not None:
+                # Keep serving the last good version; surface the problem in stats().
+                self.error = error
+                self.failed_stat = source_stat
+                return
+            if self.retrieval_pool:
+                index = agent.enable_retrieval(self.retrieval_pool)
+                self.load_breakdown["retrieval_index_ms"] = round(index.build_seconds * 1000, 1)
+            previous = self.loaded
+            self.loaded = LoadedCatalog(agent, header, source_stat, time.perf_counter() - started)
+            self.error = None
+            with self._counter_lock:
+                self.reloads += 1
+            if previous is not None:
+                self.planning_cache.invalidate(previous.version)
+        finally:
+            self._reload_lock.release()
+
+    def _build_agent(self) -> Tuple[Optional[TravelAgent], Dict[str, Any], Optional[str]]:
+        """Snapshot-backed sources go through open_catalog; JSON Lines sources are streamed; .tcat files are mapped."""
+        if is_mapped_source(self.filepath):
+            started = time.perf_counter()
+            try:
+                catalog = MappedCatalog(self.filepath)
+                agent = open_mapped_agent(self.filepath, catalog)
+            except FileNotFoundError:
+                return None, {}, f"Data file not found at: {self.filepath}"
+            except (OSError, ValueError) as e:
+                return None, {}, f"Failed to open mapped catalog: {e}"
+            self.load_breakdown = {"mmap_open_ms": round((time.perf_counter() - started) * 1000, 1)}
+            header = {
+                "source": os.path.abspath(self.filepath),
+                "source_sha256": catalog.source_sha256,
+                "destinations": len(catalog),
+                "build_seconds": time.perf_counter() - started,
+            }
+            return agent, header, None
+
+        if not is_stream_source(self.filepath):
+            started = time.perf_counter()
+            data, header = open_catalog(self.filepath)
+            if "error" in data:
+                return None, header, data["error"]
+            read = time.perf_counter()
+            agent = TravelAgent(data, version=header["source_sha256"][:12])
+            self.load_breakdown = {
+                "snapshot_read_ms" if header.get("cached") else "source_parse_ms": round((read - started) * 1000, 1),
+                "index_ms": round((time.perf_counter() - read) * 1000, 1),
+            }
+            # A stale cube (older version) is ignored; rank() then scores live.
+            attach_answer_cube(agent, cube_path_for(self.filepath))
+            return agent, header, None
+
+        try:
+            source_hash = hash_source(self.filepath)
+        except OSError as e:
+            return None, {}, f"Data file not found at: {self.filepath}" if isinstance(e, FileNotFoundError) else str(e)
+        agent, report = ingest_catalog(self.filepath, version=source_hash[:12])
+        self.ingest_report = report
+        self.load_breakdown = {"stream_ingest_ms": round(report.seconds * 1000, 1)}
+        if agent is None:
+            return None, {}, report.error
+        header = {
+            "source": os.path.abspath(self.filepath),
+            "source_sha256": source_hash,
+            "destinations": report.accepted,
+            "rejected_records": report.rejected,
+            "build_seconds": report.seconds,
+        }
+        return agent, header, None
+
+    def current(self, session_id: Optional[str] = None) -> Optional[LoadedCatalog]:
+        """Returns the current version (None only if no version ever loaded; see .error)."""
+        if session_id is not None:
+            self._sessions[session_id] = time.time()
+
+        loaded = self.loaded
+        if loaded is None:
+            self._reload_lock.acquire()
+            if self.loaded is None:
+                self._reload()
+            else:
+                self._reload_lock.release()
+            return self.loaded
+
+        source_stat = self._source_stat()
+        if (source_stat not in (loaded.source_stat, self.failed_stat)
+                and self._reload_lock.acquire(blocking=False)):
+            threading.Thread(target=self._reload, name="catalog-reload", daemon=True).start()
+        return loaded
+
+    # --- Mutations ---
+    # Applied in memory to the live agent; a reload after the source file changes
+    # starts again from the file.
+    def upsert(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Adds or replaces one destination. Returns {"status", "version"} or {"error"}."""
+        problems = validate_destination(record, "destination", ())
+        if problems:
+            return {"error": "Invalid destination: " + "; ".join(problems)}
+        return self._mutate(lambda agent: "created" if agent.upsert(record) else "updated")
+
+    def delete(self, dest_id: str) -> Dict[str, Any]:
+        """Removes one destination. Returns {"status", "version"} or {"error"}."""
+        return self._mutate(lambda agent: "deleted" if agent.delete(dest_id) else None,
+                            f"Unknown destination: {dest_id}")
+
+    def _mutate(self, change: Callable[[TravelAgent], Optional[str]], not_found: str = "") -> Dict[str, Any]:
+        loaded = self.current()
+        if loaded is None:
+            return {"error": f"Catalog unavailable: {self.error}"}
+        previous = loaded.agent.version
+        status = change(loaded.agent)
+        if status is None:
+            return {"error": not_found}
+        loaded.version = loaded.agent.version
+        with self._counter_lock:
+            self.mutations += 1
+        self.planning_cache.invalidate(previous)
+        return {"status": status, "version": loaded.version}
+
+    def active_sessions(self) -> int:
+        cutoff = time.time() - SESSION_ACTIVE_SECONDS
+        for session_id, last_seen in list(self._sessions.items()):
+            if last_seen < cutoff:
+                self._sessions.pop(session_id, None)
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        loaded = self.loaded
+        stats = {
+            "source": self.filepath,
+            "active_sessions": self.active_sessions(),
+            "last_error": self.error,
+            "planning_cache": self.planning_cache.stats(),
+        }
+        with self._counter_lock:
+            stats.update(reloads=self.reloads, mutations=self.mutations)
+        if loaded is not None:
+            stats.update({
+                "version": loaded.version,
+                "destinations": len(loaded.agent.all_destinations),
+                "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(loaded.loaded_at)),
+                "build_ms": round(loaded.build_seconds * 1000, 1),
+                "load_breakdown": self.load_breakdown,
+            })
+            if loaded.agent.embedding_index is not None:
+                stats["retrieval"] = dict(loaded.agent.embedding_index.stats(), pool=loaded.agent.retrieval_pool)
+            cube = loaded.agent.answer_cube
+            stats["answer_cube"] = cube.stats() if cube is not None and cube.version == loaded.version else None
+        if self.ingest_report is not None:
+            stats["rejected_records"] = self.ingest_report.rejected
+            stats["record_problems"] = self.ingest_report.problems[:5]
+        return stats
+
+# --- CLI ---
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compile travel data into a binary catalog snapshot.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="(Re)build the snapshot for a .docx or .json source.")
+    build.add_argument("source", nargs="?", default="travel_data.docx")
+    build.add_argument("--output", help="Snapshot path (default: <source>.snapshot)")
+
+    info = sub.add_parser("info", help="Show the snapshot header for a source.")
+    info.add_argument("source", nargs="?", default="travel_data.docx")
+
+    ingest = sub.add_parser("ingest", help="Stream a .json or JSON Lines catalog and report bad records.")
+    ingest.add_argument("source")
+
+    mapped = sub.add_parser("mmap", help=f"Convert a .docx or .json source to the memory-mapped {MAPPED_SUFFIX} format.")
+    mapped.add_argument("source", nargs="?", default="travel_data.docx")
+    mapped.add_argument("--output", help=f"Output path (default: <source stem>{MAPPED_SUFFIX})")
+
+    cube = sub.add_parser("cube", help=f"Precompute top-k rankings for every UI input (<source>{CUBE_SUFFIX}); "
+                                       f"up to {CUBE_MAX_DESTINATIONS} destinations.")
+    cube.add_argument("source", nargs="?", default="travel_data.docx")
+    cube.add_argument("--top-k", type=int, default=3)
+    cube.add_argument("--verify", type=int, default=500, help="Random lookups checked against live scoring (0 = skip).")
+
+    generate = sub.add_parser("generate", help="Write a seeded synthetic catalog as JSON (.jsonl: one record per line).")
+    generate.add_argument("output")
+    generate.add_argument("--size", type=int, default=10_000)
+    generate.add_argument("--seed", type=int, default=7)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        write_catalog(args.output, generate_synthetic_catalog(args.size, args.seed))
+        print(f"Wrote {args.size} synthetic destinations to {args.output}")
+        return 0
+
+    if args.command == "ingest":
+        agent, report = ingest_catalog(args.source)
+        print(f"{report.accepted} destinations accepted, {report.rejected} rejected in {report.seconds * 1000:.1f} ms")
+        for problem in report.problems:
+            print(f"  {problem}")
+        if report.rejected > len(report.problems):
+            print(f"  ... and {report.rejected - len(report.problems)} more")
+        if agent is None:
+            print(f"ERROR: {report.error}")
+            return 1
+        return 0
+
+    if args.command == "mmap":
+        summary = build_mapped_catalog(args.source, args.output)
+        if "error" in summary:
+            print(f"ERROR: {summary['error']}")
+            return 1
+        print(f"Wrote {summary['output']}: {summary['destinations']} destinations, {summary['tags']} tags, "
+              f"{summary['strings']} strings, {summary['bytes']} bytes")
+        return 0
+
+    if args.command == "cube":
+        data, header = open_catalog(args.source)
+        if "error" in data:
+            print(f"ERROR: {data['error']}")
+            return 1
+        agent = TravelAgent(data, version=header["source_sha256"][:12])
+        report = build_answer_cube(agent, cube_path_for(args.source), args.top_k)
+        if "error" in report:
+            print(f"ERROR: {report['error']}")
+            return 1
+        print(f"Wrote {report['path']}: {report['cells']} cells x top-{report['top_k']} ({report['dtype']}), "
+              f"{report['bytes']} bytes in {report['build_seconds']:.2f} s")
+        if args.verify:
+            checked, mismatches = verify_answer_cube(agent, AnswerCube(report["path"]), args.verify)
+            print(f"Verified {checked} lookups against live scoring: {mismatches} mismatches")
+            return 1 if mismatches else 0
+        return 0
+
+    if args.command == "build":
+        data, header = build_snapshot(args.source, args.output)
+        if "error" in data:
+            print(f"ERROR: {data['error']}")
+            return 1
+        print(f"Built {args.output or snapshot_path_for(args.source)}: "
+              f"{header['destinations']} destinations in {header['build_seconds'] * 1000:.1f} ms")
+        return 0
+
+    data, header = open_catalog(args.source)
+    if "error" in data:
+        print(f"ERROR: {data['error']}")
+        return 1
+    for key, value in header.items():
+        print(f"{key}: {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
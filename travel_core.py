@@ -2,8 +2,20 @@ import json
 import math
 import heapq
 import random
-from docx import Document
-from typing import List, Dict, Any, Tuple, Set
+import sys
+import hashlib
+import threading
+import time
+import zlib
+import re
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from itertools import chain, islice
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+import numpy as np
+from typing import List, Dict, Any, Callable, Iterator, NamedTuple, Optional, Tuple, Set
 
 # Constants
 PAK_CITIES_COORDS = {
@@ -19,74 +31,151 @@ PAK_CITIES_COORDS = {
 DISTANCE_SCALING = 0.005 
 
 # --- Data Handling ---
+def read_docx_text(filepath: str) -> str:
+    """Paragraph text of a .docx file. python-docx is imported here, on first use, to keep startup fast."""
+    from docx import Document
+    doc = Document(filepath)
+    return "".join([para.text for para in doc.paragraphs]).strip()
+
 def load_json_from_docx(filepath: str) -> Dict[str, Any]:
     try:
-        doc = Document(filepath)
-        raw_text = "".join([para.text for para in doc.paragraphs]).strip()
-        return json.loads(raw_text)
+        return json.loads(read_docx_text(filepath))
     except FileNotFoundError:
         return {"error": f"Data file not found at: {filepath}"}
     except Exception as e:
         return {"error": f"Failed to read/parse JSON from docx: {e}"}
 
 # --- Object Model ---
+class Vocabulary:
+    """
+    Shared pool for tag sets, activity tuples and transport tuples: equal values are
+    stored once and every Destination references the same object. Lookups are keyed by
+    the raw tuple, so only the first occurrence of a value pays for building (and, for
+    tags, interning) it. SharedCatalog calls clear() before each reload, so the pool
+    holds the values of the catalog being built rather than every version ever loaded.
+    """
+    def __init__(self):
+        self._tag_sets: Dict[Tuple[str, ...], frozenset] = {}
+        self._sequences: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    def tag_set(self, tags: List[str]) -> frozenset:
+        key = tuple(tags)
+        tag_set = self._tag_sets.get(key)
+        if tag_set is None:
+            tag_set = self._tag_sets[key] = frozenset(map(sys.intern, key))
+        return tag_set
+
+    def sequence(self, items: List[str]) -> Tuple[str, ...]:
+        key = tuple(items)
+        return self._sequences.setdefault(key, key)
+
+    def mapping(self, mapping: Dict[str, List[str]]) -> Dict[str, Tuple[str, ...]]:
+        """key -> pooled tuple, as one comprehension (this runs for every record)."""
+        setdefault, intern = self._sequences.setdefault, sys.intern
+        return {intern(key): setdefault(values := tuple(items), values) for key, items in mapping.items()}
+
+    def clear(self):
+        self._tag_sets.clear()
+        self._sequences.clear()
+
+    def __len__(self) -> int:
+        return len(self._tag_sets) + len(self._sequences)
+
+VOCABULARY = Vocabulary()
+
 class Destination:
-    """Represents a single destination."""
+    """
+    Represents a single destination. Slotted (no per-instance __dict__); names and tags
+    are interned, and tag sets, activity tuples and transport tuples come from the
+    shared VOCABULARY. tags is a frozenset, activities maps tag -> tuple.
+    """
+    __slots__ = ("id", "name", "country", "cost", "tags", "coords", "activities", "hotel_reco", "local_transport")
+
     def __init__(self, data: Dict[str, Any]):
         self.id = data["id"]
-        self.name = data["name"]
-        self.country = data["country"]
+        self.name = sys.intern(data["name"])
+        self.country = sys.intern(data["country"])
         self.cost = data["avg_daily_cost"]
-        self.tags = set(data["tags"])
+        self.tags = VOCABULARY.tag_set(data["tags"])
         self.coords = tuple(data["coords"])
-        self.activities = data["activities"]
-        self.hotel_reco = data["hotel_reco"]
+        self.activities = VOCABULARY.mapping(data["activities"])
+        self.hotel_reco = sys.intern(data["hotel_reco"])
         
         # Local transport only, preferred mode logic removed
-        self.local_transport = data.get("local_transport", [])
-        
-        self.utility_score = 0.0
-        self.estimated_flight_cost = 0
+        self.local_transport = VOCABULARY.sequence(data.get("local_transport", []))
+
+class ScoredDestination(NamedTuple):
+    """
+    Per-request planning result. Scores live here, never on the shared (read-only)
+    Destination, so concurrent requests cannot overwrite each other. Other attributes
+    (name, cost, activities, ...) are read through to the destination.
+    """
+    destination: Destination
+    utility_score: float
+    estimated_flight_cost: int
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.destination, name)
 
 # --- Search Algorithms ---
 class SearchAlgorithms:
 
     @staticmethod
     def bfs_budget_filter(all_destinations: List[Destination], max_cost: float) -> List[Destination]:
-        """[BFS] Finds all destinations within the user's daily budget."""
-        queue = all_destinations[:]
+        """[BFS] Finds all destinations within the user's daily budget (catalog order, O(n))."""
+        queue = deque(all_destinations)
         filtered_destinations = []
         while queue:
-            dest = queue.pop(0) 
+            dest = queue.popleft()
             if dest.cost <= max_cost:
                 filtered_destinations.append(dest)
         return filtered_destinations
 
     @staticmethod
-    def dfs_activity_explorer(activities_list: List[str], max_depth: int) -> List[str]:
-        """[DFS] Explores activity combinations."""
-        def dfs(current_path: List[str]):
-            if len(current_path) >= max_depth:
-                return current_path
-
-            shuffled = list(activities_list)
-            random.shuffle(shuffled) 
-            
-            for activity in shuffled:
-                if activity not in current_path:
-                    new_path = current_path + [activity]
-                    result = dfs(new_path)
-                    if result:
-                        return result
-            return None
+    def dfs_activity_explorer(activities_list: List[str], max_depth: int, rng: Optional[random.Random] = None,
+                              stats: Optional[Dict[str, int]] = None) -> List[str]:
+        """
+        [DFS] Picks max_depth activities: every distinct activity once in random order
+        (as deep as the path can go), then random repeats as filler. O(len(list) + max_depth);
+        the old permutation search tried every ordering when distinct activities ran out.
+        Pass a seeded random.Random for reproducible picks (default: the global RNG); pass a
+        stats dict to have node expansions (distinct activities visited + filler picks) added.
+        """
+        rng = rng or random
+        distinct = list(dict.fromkeys(activities_list))
+        rng.shuffle(distinct)
 
-        result = dfs([])
-        if result is None:
-            result = []
+        result = distinct[:max_depth]
+        filler = max_depth - len(result)
         while len(result) < max_depth:
-             result.append(random.choice(activities_list) if activities_list else "Relaxing Walk")
+             result.append(rng.choice(activities_list) if activities_list else "Relaxing Walk")
+        if stats is not None:
+            stats["dfs_expansions"] = stats.get("dfs_expansions", 0) + len(distinct) + max(filler, 0)
         return result
 
+    @staticmethod
+    def top_k_indices(scores: np.ndarray, k: Optional[int] = None,
+                      tiebreak: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        [Partial Selection] Indices of the k highest scores, best first. Ties go to the
+        lower `tiebreak` value (default: position), exactly like a stable sort(reverse=True)
+        over input ordered by `tiebreak`. O(n) selection plus O(k log k) ordering.
+        """
+        n = len(scores)
+        if tiebreak is None:
+            tiebreak = np.arange(n)
+        if k is None or k >= n:
+            return np.lexsort((tiebreak, -scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+
+        kth_best = np.partition(scores, n - k)[n - k]
+        candidates = np.flatnonzero(scores >= kth_best)
+        order = np.lexsort((tiebreak[candidates], -scores[candidates]))[:k]
+        return candidates[order]
+
     @staticmethod
     def calculate_distance(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> float:
         """Calculates Euclidean distance."""
@@ -94,81 +183,1188 @@ class SearchAlgorithms:
         x2, y2 = end_coords
         return math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
 
+# --- Catalog Indexes ---
+def _with_capacity(buffer: np.ndarray, needed: int, axis: int = 0) -> np.ndarray:
+    """buffer itself, or a zero-padded copy with room for `needed` entries along axis (capacity doubles)."""
+    capacity = buffer.shape[axis]
+    if needed <= capacity:
+        return buffer
+    shape = list(buffer.shape)
+    shape[axis] = max(needed, 2 * capacity, 16)
+    grown = np.zeros(shape, dtype=buffer.dtype)
+    grown[(slice(None),) * axis + (slice(0, capacity),)] = buffer
+    return grown
+
+class CostIndex:
+    """
+    [Sorted Index] Destination rows ordered by avg_daily_cost (ties by row), built once
+    per catalog. Budget queries are a bisect and return a view of the index, not a copy.
+    Catalog mutations do not re-sort: the changed rows are marked stale and their current
+    costs kept in a small overlay that queries merge in (cheapest first; ties then follow
+    no particular row order). The agent rebuilds the index once the overlay outgrows
+    COMPACT_FRACTION of the catalog, so an update costs amortized O(log n).
+    """
+    COMPACT_MIN = 1024
+    COMPACT_FRACTION = 1 / 32
+
+    def __init__(self, costs: np.ndarray):
+        self.order = np.argsort(costs, kind="stable")
+        self.sorted_costs = costs[self.order]
+        # Rows whose entry in `order` is outdated, and the current cost of those still alive.
+        self.stale = np.zeros(len(costs), dtype=bool)
+        self.overlay: Dict[int, float] = {}
+        self.pending = 0
+        self._overlay_sorted: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def update(self, row: int, cost: Optional[float]):
+        """Records that row now costs `cost` (None: the row no longer exists)."""
+        if row < len(self.stale):
+            self.stale[row] = True
+        if cost is None:
+            self.overlay.pop(row, None)
+        else:
+            self.overlay[row] = cost
+        self._overlay_sorted = None
+        self.pending += 1
+
+    def needs_compaction(self) -> bool:
+        return self.pending > max(self.COMPACT_MIN, len(self.stale) * self.COMPACT_FRACTION)
+
+    def _overlay_rows(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._overlay_sorted is None:
+            rows = np.fromiter(self.overlay.keys(), dtype=np.intp, count=len(self.overlay))
+            costs = np.fromiter(self.overlay.values(), dtype=np.float64, count=len(self.overlay))
+            order = np.lexsort((rows, costs))
+            self._overlay_sorted = (rows[order], costs[order])
+        return self._overlay_sorted
+
+    def _range(self, lo: int, hi: int, min_cost: float, max_cost: float) -> np.ndarray:
+        rows = self.order[lo:hi]
+        if not self.pending:
+            return rows
+        live = ~self.stale[rows]
+        rows, costs = rows[live], self.sorted_costs[lo:hi][live]
+        overlay_rows, overlay_costs = self._overlay_rows()
+        start = np.searchsorted(overlay_costs, min_cost, side="left")
+        stop = max(start, np.searchsorted(overlay_costs, max_cost, side="right"))
+        positions = np.searchsorted(costs, overlay_costs[start:stop], side="right")
+        return np.insert(rows, positions, overlay_rows[start:stop])
+
+    def rows_within(self, max_cost: float) -> np.ndarray:
+        """Rows with cost <= max_cost, cheapest first."""
+        return self._range(0, np.searchsorted(self.sorted_costs, max_cost, side="right"), -np.inf, max_cost)
+
+    def rows_between(self, min_cost: float, max_cost: float) -> np.ndarray:
+        """Rows with min_cost <= cost <= max_cost, cheapest first."""
+        lo = np.searchsorted(self.sorted_costs, min_cost, side="left")
+        hi = np.searchsorted(self.sorted_costs, max_cost, side="right")
+        return self._range(lo, max(lo, hi), min_cost, max_cost)
+
+class TagIndex:
+    """
+    [Inverted Index] tag -> packed bitset of destination rows, built once per catalog.
+    Interest matching for the whole catalog is one unpack+add per requested tag, and
+    "shares at least one interest" is an OR of the bitsets.
+    """
+    def __init__(self, destinations: List[Destination]):
+        members = defaultdict(list)
+        for row, dest in enumerate(destinations):
+            for tag in dest.tags:
+                members[tag].append(row)
+        self._pack(len(destinations), members)
+
+    @classmethod
+    def from_members(cls, size: int, members: Dict[str, Any]) -> "TagIndex":
+        """Index from tag -> row list collected elsewhere (see CatalogBuilder)."""
+        index = cls.__new__(cls)
+        index._pack(size, members)
+        return index
+
+    @classmethod
+    def from_postings(cls, size: int, postings: Dict[str, np.ndarray]) -> "TagIndex":
+        """Index over packed bitsets built elsewhere (see travel_catalog.MappedCatalog)."""
+        index = cls.__new__(cls)
+        index.size = size
+        index.nbytes = (size + 7) // 8
+        index.postings = postings
+        return index
+
+    def _pack(self, size: int, members: Dict[str, Any]):
+        self.size = size
+        # Every posting has nbytes bytes; after mutations that can exceed (size + 7) // 8.
+        self.nbytes = (size + 7) // 8
+        self.postings: Dict[str, np.ndarray] = {}
+        for tag, rows in members.items():
+            bits = np.zeros(self.size, dtype=bool)
+            bits[np.asarray(rows, dtype=np.intp)] = True
+            self.postings[tag] = np.packbits(bits)
+
+    def _unpack(self, bitset: np.ndarray) -> np.ndarray:
+        return np.unpackbits(bitset, count=self.size)
+
+    def resize(self, size: int):
+        """Sets the row count, growing every posting (capacity doubles) when it no longer fits."""
+        needed = (size + 7) // 8
+        if needed > self.nbytes:
+            self.nbytes = max(needed, 2 * self.nbytes, 64)
+            for tag, bitset in self.postings.items():
+                self.postings[tag] = _with_capacity(bitset, self.nbytes)
+        self.size = size
+
+    def set_row(self, row: int, old_tags: Set[str], new_tags: Set[str]):
+        """Moves one row from old_tags to new_tags: O(tags changed), bits are flipped in place."""
+        byte, mask = row >> 3, np.uint8(0x80 >> (row & 7))
+        for tag in old_tags:
+            if tag not in new_tags:
+                self.postings[tag][byte] &= ~mask
+        for tag in new_tags:
+            if tag not in old_tags:
+                if tag not in self.postings:
+                    self.postings[tag] = np.zeros(self.nbytes, dtype=np.uint8)
+                self.postings[tag][byte] |= mask
+
+    def match_counts(self, tags: Set[str]) -> np.ndarray:
+        """Number of the given tags each catalog row has."""
+        known = [tag for tag in tags if tag in self.postings]
+        counts = np.zeros(self.size, dtype=np.uint8 if len(known) < 256 else np.int64)
+        for tag in known:
+            counts += self._unpack(self.postings[tag])
+        return counts
+
+    def row_match_counts(self, tags: Set[str], rows: np.ndarray) -> np.ndarray:
+        """match_counts(tags)[rows], reading only those rows' bits: O(len(rows)) per tag."""
+        byte, shift = rows >> 3, (7 - (rows & 7)).astype(np.uint8)
+        counts = np.zeros(len(rows), dtype=np.uint8 if len(tags) < 256 else np.int64)
+        for tag in tags:
+            if tag in self.postings:
+                counts += (self.postings[tag][byte] >> shift) & 1
+        return counts
+
+    def any_match(self, tags: Set[str]) -> np.ndarray:
+        """Boolean mask of catalog rows that have at least one of the given tags."""
+        combined = np.zeros(self.nbytes, dtype=np.uint8)
+        for tag in tags:
+            if tag in self.postings:
+                combined |= self.postings[tag]
+        return self._unpack(combined).view(bool)
+
+class DistanceMatrix:
+    """
+    [Lookup Table] Origin x destination distance scores and flight costs, built once per
+    catalog. Origins sharing coordinates (e.g. Islamabad/Rawalpindi) share one row.
+    After catalog mutations the arrays may have spare columns past the engine's size.
+    """
+    def __init__(self, origins: Dict[str, Tuple[float, float]], dest_coords: np.ndarray):
+        self.row_of_coords = self.origin_rows(origins)
+        n_rows, n_dests = len(self.row_of_coords), len(dest_coords)
+        self.distance_scores = np.empty((n_rows, n_dests), dtype=np.float64)
+        self.flight_costs = np.empty((n_rows, n_dests), dtype=np.int64)
+        for origin_coords, row in self.row_of_coords.items():
+            self._fill(row, origin_coords, dest_coords, slice(None))
+
+    @staticmethod
+    def origin_rows(origins: Dict[str, Tuple[float, float]]) -> Dict[Tuple[float, float], int]:
+        """Matrix row per distinct origin coordinates, in first-seen order."""
+        row_of_coords: Dict[Tuple[float, float], int] = {}
+        for coords in origins.values():
+            row_of_coords.setdefault(tuple(coords), len(row_of_coords))
+        return row_of_coords
+
+    @classmethod
+    def from_arrays(cls, origins: Dict[str, Tuple[float, float]], distance_scores: np.ndarray,
+                    flight_costs: np.ndarray) -> "DistanceMatrix":
+        """Matrix over arrays computed elsewhere (e.g. mapped from a .tcat file), rows in origin_rows order."""
+        matrix = cls.__new__(cls)
+        matrix.row_of_coords = cls.origin_rows(origins)
+        matrix.distance_scores = distance_scores
+        matrix.flight_costs = flight_costs
+        return matrix
+
+    def _fill(self, row: int, origin_coords: Tuple[float, float], dest_coords: np.ndarray, cols):
+        distances = ScoringEngine.euclidean(origin_coords, dest_coords)
+        self.distance_scores[row, cols] = ScoringEngine.score_distances(distances)
+        self.flight_costs[row, cols] = ScoringEngine.price_distances(distances)
+
+    def set_column(self, col: int, coords: Tuple[float, float]):
+        """(Re)computes one destination's column for every origin, growing the matrix if needed."""
+        self.distance_scores = _with_capacity(self.distance_scores, col + 1, axis=1)
+        self.flight_costs = _with_capacity(self.flight_costs, col + 1, axis=1)
+        # Matrix rows are numbered in row_of_coords order; |o - d| == |d - o| bit for bit.
+        distances = ScoringEngine.euclidean(coords, np.array(list(self.row_of_coords), dtype=np.float64))
+        self.distance_scores[:, col] = ScoringEngine.score_distances(distances)
+        self.flight_costs[:, col] = ScoringEngine.price_distances(distances)
+
+    def copy_column(self, src: int, dst: int):
+        self.distance_scores[:, dst] = self.distance_scores[:, src]
+        self.flight_costs[:, dst] = self.flight_costs[:, src]
+
+    def row_for(self, origin_coords: Tuple[float, float]) -> Optional[int]:
+        return self.row_of_coords.get(tuple(origin_coords))
+
+class CatalogBuilder:
+    """
+    Builds a catalog one record at a time for streaming ingestion. Each record becomes
+    a Destination immediately and its cost, coords and tag rows are appended to compact
+    columns, so the raw record can be dropped and build() needs no second pass.
+    """
+    def __init__(self):
+        self.destinations: List[Destination] = []
+        self.row_of: Dict[str, int] = {}
+        self.cost = array("d")
+        self.coords = array("d")
+        self.members: Dict[str, array] = defaultdict(lambda: array("q"))
+
+    def __len__(self) -> int:
+        return len(self.destinations)
+
+    def add(self, record: Dict[str, Any]) -> Destination:
+        dest = Destination(record)
+        row = len(self.destinations)
+        self.destinations.append(dest)
+        self.row_of[dest.id] = row
+        self.cost.append(dest.cost)
+        self.coords.extend(dest.coords)
+        for tag in dest.tags:
+            self.members[tag].append(row)
+        return dest
+
+    def build(self, version: str = "") -> "TravelAgent":
+        engine = ScoringEngine.from_columns(
+            dict(self.row_of),
+            np.frombuffer(self.cost, dtype=np.float64).copy(),
+            np.frombuffer(self.coords, dtype=np.float64).reshape(-1, 2).copy(),
+            TagIndex.from_members(len(self.destinations), self.members),
+        )
+        return TravelAgent.from_engine(list(self.destinations), engine, version)
+
+# --- Embedding Retrieval ---
+EMBEDDING_MIN_WORD = 4
+
+@lru_cache(maxsize=1 << 16)
+def _activity_words(activity: str) -> Tuple[str, ...]:
+    return tuple(word for word in re.findall(r"[a-z]+", activity.lower()) if len(word) >= EMBEDDING_MIN_WORD)
+
+def destination_terms(dest: Destination) -> List[str]:
+    """A destination's tags plus the words of its activity names (its own name's words dropped)."""
+    own = set(dest.name.lower().split())
+    terms = dict.fromkeys(dest.tags)
+    for activities in dest.activities.values():
+        for activity in activities:
+            terms.update((word, None) for word in _activity_words(activity) if word not in own)
+    return list(terms)
+
+class TermEmbeddings:
+    """
+    [Co-occurrence Embeddings] Vectors for tags and activity words, learned from the
+    catalog itself: positive PMI of terms appearing on the same destination, reduced
+    by SVD. Terms that keep company (beach / snorkeling / sunset / views) end up close,
+    so a query is related to destinations whose tags differ from it. Terms on fewer
+    than two destinations carry no co-occurrence signal and are left out.
+    """
+    CHUNK = 65536
+
+    def __init__(self, term_lists: List[List[str]], dim: int = 16, max_terms: int = 2048):
+        df = defaultdict(int)
+        for terms in term_lists:
+            for term in terms:
+                df[term] += 1
+        vocabulary = sorted((term for term, count in df.items() if count >= 2), key=lambda t: (-df[t], t))[:max_terms]
+        self.term_id = {term: i for i, term in enumerate(vocabulary)}
+        counts = np.array([df[term] for term in vocabulary], dtype=np.float64)
+        self.idf = (np.log((1 + len(term_lists)) / (1 + counts)) + 1).astype(np.float32)
+
+        cooccurrence = np.zeros((len(vocabulary), len(vocabulary)), dtype=np.float64)
+        for chunk in self._chunks(term_lists):
+            cooccurrence += chunk.T @ chunk
+        total = cooccurrence.sum()
+        marginal = cooccurrence.sum(axis=1)
+        with np.errstate(divide="ignore"):
+            ppmi = np.maximum(np.log(cooccurrence * total / np.outer(marginal, marginal)), 0)
+        u, s, _ = np.linalg.svd(ppmi, hermitian=True)
+        self.dim = min(dim, len(vocabulary))
+        vectors = (u[:, :self.dim] * np.sqrt(s[:self.dim])).astype(np.float32)
+        self.vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _chunks(self, term_lists: List[List[str]], weighted: bool = False) -> Iterator[np.ndarray]:
+        """Dense (rows x terms) indicator blocks, idf-weighted when asked."""
+        for start in range(0, len(term_lists), self.CHUNK):
+            block = term_lists[start:start + self.CHUNK]
+            ids = [[self.term_id[term] for term in terms if term in self.term_id] for terms in block]
+            chunk = np.zeros((len(block), len(self.term_id)), dtype=np.float32)
+            chunk[np.repeat(np.arange(len(block)), [len(row) for row in ids]),
+                  np.fromiter(chain.from_iterable(ids), dtype=np.intp)] = 1
+            yield chunk * self.idf if weighted else chunk
+
+    def embed_rows(self, term_lists: List[List[str]]) -> np.ndarray:
+        """Unit vector per term list: the idf-weighted sum of its term vectors (zero if no known terms)."""
+        out = np.zeros((len(term_lists), self.dim), dtype=np.float32)
+        start = 0
+        for chunk in self._chunks(term_lists, weighted=True):
+            out[start:start + len(chunk)] = chunk @ self.vectors
+            start += len(chunk)
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+    def embed(self, terms: List[str]) -> Optional[np.ndarray]:
+        """Query vector for terms, or None when none of them is known."""
+        ids = [self.term_id[term] for term in terms if term in self.term_id]
+        if not ids:
+            return None
+        vector = self.idf[ids] @ self.vectors[ids]
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def similar(self, term: str, count: int = 5) -> List[Tuple[str, float]]:
+        """The `count` terms closest to term (cosine), for inspecting what the embedding learned."""
+        if term not in self.term_id:
+            return []
+        sims = self.vectors @ self.vectors[self.term_id[term]]
+        terms = list(self.term_id)
+        return [(terms[i], float(sims[i])) for i in np.argsort(-sims)[1:count + 1]]
+
+class EmbeddingIndex:
+    """
+    [Inverted File ANN] Destination embeddings clustered by spherical k-means into about
+    sqrt(n) lists. Each list is ordered by cost, so a query probes the lists closest to
+    the interests and takes from each the most expensive rows within the budget (budget
+    fit is the other big utility term) until it has `pool` candidates. Mutations work like
+    CostIndex: changed rows go to an overlay that every query includes, and compact()
+    re-sorts the lists once the overlay outgrows COMPACT_FRACTION of the catalog.
+    """
+    COMPACT_MIN = 1024
+    COMPACT_FRACTION = 1 / 32
+    KMEANS_ITERATIONS = 8
+    # Without an explicit per_list, a query spreads its pool over this many nearest lists.
+    PROBE_LISTS = 32
+
+    def __init__(self, destinations: List[Destination], costs: np.ndarray, dim: int = 16,
+                 lists: Optional[int] = None, seed: int = 7):
+        started = time.perf_counter()
+        term_lists = [destination_terms(dest) for dest in destinations]
+        self.embeddings = TermEmbeddings(term_lists, dim)
+        self.vectors = self.embeddings.embed_rows(term_lists)
+        self.size = len(destinations)
+        self.centroids = self._kmeans(lists or max(1, math.isqrt(self.size)), np.random.default_rng(seed))
+        self.assign = self._nearest(self.vectors[:self.size])
+        self.compact(costs)
+        self.build_seconds = time.perf_counter() - started
+
+    def _kmeans(self, lists: int, rng: np.random.Generator) -> np.ndarray:
+        sample = self.vectors[rng.choice(self.size, min(self.size, lists * 64), replace=False)] if self.size else self.vectors
+        centroids = sample[rng.choice(len(sample), min(lists, len(sample)), replace=False)]
+        for _ in range(self.KMEANS_ITERATIONS):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        return centroids
+
+    def _nearest(self, vectors: np.ndarray) -> np.ndarray:
+        return np.concatenate([np.argmax(vectors[start:start + TermEmbeddings.CHUNK] @ self.centroids.T, axis=1)
+                               for start in range(0, len(vectors), TermEmbeddings.CHUNK)] or [np.empty(0, np.intp)])
+
+    def compact(self, costs: np.ndarray):
+        """(Re)sorts rows by (list, cost) and clears the overlay."""
+        self.order = np.lexsort((costs, self.assign[:self.size]))
+        self.sorted_costs = costs[self.order]
+        # (list, cost - floor) as one sorted float key, so every list's budget range is one
+        # searchsorted. Offsets lie in [0, span - 1], so list i owns keys [i * span, (i + 1) * span).
+        self.floor = float(self.sorted_costs.min()) if self.size else 0.0
+        self.span = float(self.sorted_costs.max()) - self.floor + 1 if self.size else 1.0
+        self.keys = self.assign[:self.size][self.order] * self.span + (self.sorted_costs - self.floor)
+        self.stale = np.zeros(self.size, dtype=bool)
+        self.overlay: Dict[int, float] = {}
+        self.pending = 0
+
+    def needs_compaction(self) -> bool:
+        return self.pending > max(self.COMPACT_MIN, len(self.stale) * self.COMPACT_FRACTION)
+
+    # --- Mutations (TravelAgent calls these under its write lock) ---
+    def set_row(self, row: int, dest: Destination):
+        """Embeds dest at row (row == size appends); terms unseen at build time are ignored."""
+        vector = self.embeddings.embed_rows([destination_terms(dest)])
+        self.vectors = _with_capacity(self.vectors, row + 1)
+        self.assign = _with_capacity(self.assign, row + 1)
+        self.vectors[row] = vector[0]
+        self.assign[row] = self._nearest(vector)[0]
+        self.size = max(self.size, row + 1)
+        self._mark(row, dest.cost)
+
+    def copy_row(self, src: int, dst: int, cost: float):
+        self.vectors[dst] = self.vectors[src]
+        self.assign[dst] = self.assign[src]
+        self._mark(dst, cost)
+
+    def resize(self, size: int):
+        for row in range(size, self.size):
+            self._mark(row, None)
+        self.size = size
+
+    def _mark(self, row: int, cost: Optional[float]):
+        if row < len(self.stale):
+            self.stale[row] = True
+        if cost is None:
+            self.overlay.pop(row, None)
+        else:
+            self.overlay[row] = cost
+        self.pending += 1
+
+    def candidates(self, interests: List[str], min_cost: float, max_cost: float, pool: int,
+                   per_list: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Up to `pool` rows with min_cost <= cost <= max_cost from the lists nearest the
+        interests, at most per_list from each (default: pool / PROBE_LISTS), plus every
+        overlay row in that range. None when no interest is known.
+        """
+        query = self.embeddings.embed(interests)
+        if query is None:
+            return None
+        if per_list is None:
+            per_list = -(-pool // min(len(self.centroids), self.PROBE_LISTS))
+        bases = np.arange(len(self.centroids)) * self.span
+        # Both bounds are clipped into the list's own key range, so no list reaches into its neighbour.
+        low, high = min_cost - self.floor, max_cost - self.floor
+        start = np.searchsorted(self.keys, bases + min(max(low, 0.0), self.span - 1), side="left")
+        stop = np.searchsorted(self.keys, bases + min(high, self.span - 1), side="right")
+        take = np.clip(stop - start, 0, per_list)
+        # Nearest lists first, as many as it takes to fill the pool.
+        nearest = np.argsort(-(self.centroids @ query))
+        probed = nearest[:np.searchsorted(np.cumsum(take[nearest]), pool) + 1]
+        counts, ends = take[probed], stop[probed]
+        firsts = np.cumsum(counts) - counts
+        positions = np.repeat(ends - counts - firsts, counts) + np.arange(counts.sum())
+        # The float key can round at the budget edges; the cost check is exact.
+        positions = positions[(self.sorted_costs[positions] >= min_cost) & (self.sorted_costs[positions] <= max_cost)]
+        rows = self.order[positions]
+        if self.pending:
+            rows = rows[~self.stale[rows]]
+        if self.overlay:
+            rows = np.concatenate([rows, np.array([row for row, cost in self.overlay.items() if min_cost <= cost <= max_cost],
+                                                  dtype=np.intp)])
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        return {"terms": len(self.embeddings.term_id), "dim": self.embeddings.dim, "lists": len(self.centroids),
+                "overlay": len(self.overlay), "build_ms": round(self.build_seconds * 1000, 1)}
+
+# --- Scoring Engine ---
+class ScoringEngine:
+    """
+    Struct-of-arrays view of the catalog. Cost, coords and tag membership are kept
+    as arrays so scoring a request is a handful of batched operations instead of a
+    Python loop over Destination objects. Formulas mirror TravelAgent exactly.
+    """
+    def __init__(self, destinations: List[Destination]):
+        self._attach(
+            {dest.id: row for row, dest in enumerate(destinations)},
+            np.array([dest.cost for dest in destinations], dtype=np.float64),
+            np.array([dest.coords for dest in destinations], dtype=np.float64).reshape(-1, 2),
+            TagIndex(destinations),
+        )
+
+    @classmethod
+    def from_columns(cls, row_of: Dict[str, int], cost: np.ndarray, coords: np.ndarray, tag_index: TagIndex,
+                     distance_matrix: Optional[DistanceMatrix] = None) -> "ScoringEngine":
+        """Engine over columns collected elsewhere (see CatalogBuilder); the matrix is built unless given."""
+        engine = cls.__new__(cls)
+        engine._attach(row_of, cost, coords, tag_index, distance_matrix)
+        return engine
+
+    def _attach(self, row_of: Dict[str, int], cost: np.ndarray, coords: np.ndarray, tag_index: TagIndex,
+                distance_matrix: Optional[DistanceMatrix] = None):
+        self.row_of = row_of
+        # Column buffers; rows past `size` are spare capacity for inserted destinations.
+        self.size = len(cost)
+        self._cost = cost
+        self._coords = coords
+        self.tag_index = tag_index
+        if distance_matrix is None:
+            distance_matrix = DistanceMatrix(PAK_CITIES_COORDS, self.coords)
+        self.distance_matrix = distance_matrix
+
+    @property
+    def cost(self) -> np.ndarray:
+        return self._cost[:self.size]
+
+    @property
+    def coords(self) -> np.ndarray:
+        return self._coords[:self.size]
+
+    # --- Mutations (TravelAgent calls these under its write lock) ---
+    def set_row(self, row: int, dest: Destination):
+        """Writes dest's columns at row; row == size appends (capacity doubles as needed)."""
+        if row == self.size:
+            self._cost = _with_capacity(self._cost, row + 1)
+            self._coords = _with_capacity(self._coords, row + 1)
+        elif tuple(self._coords[row]) == tuple(dest.coords):
+            self._cost[row] = dest.cost
+            return
+        self._cost[row] = dest.cost
+        self._coords[row] = dest.coords
+        self.distance_matrix.set_column(row, dest.coords)
+        self.size = max(self.size, row + 1)
+
+    def copy_row(self, src: int, dst: int):
+        self._cost[dst] = self._cost[src]
+        self._coords[dst] = self._coords[src]
+        self.distance_matrix.copy_column(src, dst)
+
+    @staticmethod
+    def euclidean(origin_coords: Tuple[float, float], coords: np.ndarray) -> np.ndarray:
+        delta = coords - np.asarray(origin_coords, dtype=np.float64)
+        return np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+
+    @staticmethod
+    def score_distances(distances: np.ndarray) -> np.ndarray:
+        return np.maximum(0.1, 1.0 - (distances * DISTANCE_SCALING))
+
+    @staticmethod
+    def price_distances(distances: np.ndarray) -> np.ndarray:
+        # Flight cost formula: Base $300 + ($8 * distance units)
+        return (300 + distances * 8).astype(np.int64)
+
+    def rows_for(self, destinations: List[Destination]) -> np.ndarray:
+        return np.fromiter((self.row_of[dest.id] for dest in destinations), dtype=np.intp, count=len(destinations))
+
+    def distances(self, origin_coords: Tuple[float, float], rows: np.ndarray) -> np.ndarray:
+        return self.euclidean(origin_coords, self.coords[rows])
+
+    def flight_costs(self, origin_coords: Tuple[float, float], rows: np.ndarray) -> np.ndarray:
+        matrix_row = self.distance_matrix.row_for(origin_coords)
+        if matrix_row is not None:
+            return self.distance_matrix.flight_costs[matrix_row, rows]
+        return self.price_distances(self.distances(origin_coords, rows))
+
+    def budget_fit(self, max_daily_cost: float, rows: np.ndarray) -> np.ndarray:
+        cost = self.cost[rows]
+        fit = np.where(cost <= max_daily_cost, cost / max_daily_cost, 0.1)
+        return np.minimum(fit, 1.0)
+
+    def interest_match(self, user_interests: Set[str], rows: np.ndarray) -> np.ndarray:
+        if not user_interests:
+            return np.full(len(rows), 0.5)
+        if len(rows) * 64 < self.size:
+            return self.tag_index.row_match_counts(user_interests, rows) / len(user_interests)
+        return self.tag_index.match_counts(user_interests)[rows] / len(user_interests)
+
+    def distance_score(self, origin_coords: Tuple[float, float], rows: np.ndarray) -> np.ndarray:
+        matrix_row = self.distance_matrix.row_for(origin_coords)
+        if matrix_row is not None:
+            return self.distance_matrix.distance_scores[matrix_row, rows]
+        return self.score_distances(self.distances(origin_coords, rows))
+
+    def utility_scores(self, user_input: Dict[str, Any], rows: np.ndarray) -> np.ndarray:
+        origin_coords = PAK_CITIES_COORDS.get(user_input.get("origin_city", "Karachi"), (65, 55))
+        return (
+            (self.interest_match(set(user_input["interests"]), rows) * 0.55) +
+            (self.budget_fit(user_input["budget"], rows) * 0.40) +
+            (self.distance_score(origin_coords, rows) * 0.05)
+        )
+
+# --- Instrumentation ---
+class PlanningTrace:
+    """
+    Per-request instrumentation: wall time and destinations in/out for each planning
+    stage, DFS node expansions, and (profile=True) a cProfile report of the whole call.
+    Planning code only touches it behind `if trace is not None`, so untraced requests
+    pay nothing beyond that check (cProfile is only imported for profiled traces).
+    begin()/end() nest: when one traced call runs another (a cache miss planning),
+    only the outermost pair starts and finishes the trace.
+    """
+    def __init__(self, profile: bool = False):
+        self.stages: List[Dict[str, Any]] = []
+        self.profile_text: Optional[str] = None
+        self._profiler = None
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+        self._mark = 0.0
+        self._depth = 0
+
+    def begin(self):
+        self._depth += 1
+        if self._depth > 1:
+            return
+        if self._profiler is not None:
+            self._profiler.enable()
+        self._mark = time.perf_counter()
+
+    def lap(self, stage: str, n_in: int, n_out: int, **info):
+        """Records the time since the previous lap (or begin) as `stage`."""
+        now = time.perf_counter()
+        self.stages.append({"stage": stage, "ms": round((now - self._mark) * 1000, 4), "in": n_in, "out": n_out, **info})
+        self._mark = now
+
+    def end(self) -> bool:
+        """Closes one begin(); True when that was the outermost one and the trace is finished."""
+        self._depth -= 1
+        if self._depth > 0:
+            return False
+        if self._profiler is not None:
+            self._profiler.disable()
+            import io
+            import pstats
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(25)
+            self.profile_text = out.getvalue()
+        return True
+
+    @property
+    def total_ms(self) -> float:
+        return round(sum(stage["ms"] for stage in self.stages), 4)
+
 # --- AI Engines ---
 
+class ReadWriteLock:
+    """
+    Any number of readers or one writer. Readers never wait for a queued writer (so a
+    read nested in another read cannot deadlock); catalog writes are short and rare,
+    so they still get in between requests. Pickles as a fresh, unlocked lock.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._readers == 0)
+            yield
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
 class TravelAgent:
     """Manages utility scoring and flight cost calculation."""
-    def __init__(self, data: Dict[str, Any]):
-        self.all_destinations: List[Destination] = []
+    # Share of the retrieval pool filled with the priciest affordable rows (budget fit is 40% of utility).
+    RETRIEVAL_BUDGET_SHARE = 0.25
+
+    def __init__(self, data: Dict[str, Any], version: str = ""):
+        destinations: List[Destination] = []
         if 'destinations' in data:
-            self.all_destinations = [Destination(d) for d in data['destinations']]
+            destinations = [Destination(d) for d in data['destinations']]
+        self._attach(destinations, ScoringEngine(destinations), version)
+
+    @classmethod
+    def from_engine(cls, destinations: List[Destination], engine: ScoringEngine, version: str = "") -> "TravelAgent":
+        """Agent over destinations whose ScoringEngine is already built (see CatalogBuilder)."""
+        agent = cls.__new__(cls)
+        agent._attach(destinations, engine, version)
+        return agent
 
-    def estimate_flight_costs(self, origin_city: str):
-        """Calculates flight cost from Origin (Pakistan) to Destination."""
+    def _attach(self, destinations: List[Destination], engine: ScoringEngine, version: str):
+        # Identifies the catalog contents; planning caches key on it. upsert()/delete()
+        # bump the revision, giving "<base_version>+<revision>".
+        self.version = version
+        self.base_version = version
+        self.revision = 0
+        # Reads (ranking, scoring) share it; upsert()/delete() take it exclusively.
+        self.lock = ReadWriteLock()
+        # Called with the finished PlanningTrace of every planning call (see add_hook).
+        self.hooks: List[Callable[[PlanningTrace], None]] = []
+        self.all_destinations = destinations
+        self.engine = engine
+        self.cost_index = CostIndex(self.engine.cost)
+        self.tag_index = self.engine.tag_index
+        # Optional precomputed top-k table (travel_catalog.AnswerCube); rank() tries it first.
+        self.answer_cube = None
+        # Optional ANN candidate retrieval (see enable_retrieval); None keeps ranking exact.
+        self.embedding_index: Optional[EmbeddingIndex] = None
+        self.retrieval_pool = 0
+        self.retrieval_per_list: Optional[int] = None
+
+    def estimate_flight_costs(self, origin_city: str, destinations: Optional[List[Destination]] = None) -> List[int]:
+        """Flight cost from Origin (Pakistan) to each Destination (default: all destinations)."""
         origin_coords = PAK_CITIES_COORDS.get(origin_city, (65, 55)) 
-        
-        for dest in self.all_destinations:
-            distance = SearchAlgorithms.calculate_distance(origin_coords, dest.coords)
-            # Flight cost formula: Base $300 + ($8 * distance units)
-            cost = 300 + (distance * 8)
-            dest.estimated_flight_cost = int(cost)
-
-    def calculate_utility_scores(self, filtered_destinations: List[Destination], user_input: Dict[str, Any]):
-        """Calculates weighted score (Preferred Mode logic REMOVED)."""
-        user_interests = set(user_input["interests"])
-        max_daily_cost = user_input["budget"]
-        
-        origin_city = user_input.get("origin_city", "Karachi")
-        origin_coords = PAK_CITIES_COORDS.get(origin_city, (65, 55))
-
-        for dest in filtered_destinations:
-            # 1. Budget Fit
-            budget_fit = dest.cost / max_daily_cost if dest.cost <= max_daily_cost else 0.1
-            budget_fit = min(budget_fit, 1.0)
-
-            # 2. Interest Match
-            common_interests = dest.tags.intersection(user_interests)
-            interest_match = len(common_interests) / len(user_interests) if user_interests else 0.5
-
-            # 3. Distance Score
-            distance = SearchAlgorithms.calculate_distance(origin_coords, dest.coords)
-            distance_score = max(0.1, 1.0 - (distance * DISTANCE_SCALING))
-
-            # Updated Formula: Interest 55% + Budget 40% + Distance 5%
-            dest.utility_score = (
-                (interest_match * 0.55) +
-                (budget_fit * 0.40) +
-                (distance_score * 0.05)
-            )
-        
-        filtered_destinations.sort(key=lambda d: d.utility_score, reverse=True)
-        return filtered_destinations
+        with self.lock.read():
+            if destinations is None:
+                destinations = self.all_destinations
+            return self.engine.flight_costs(origin_coords, self.engine.rows_for(destinations)).tolist()
 
-    def run_planning(self, user_input: Dict[str, Any]) -> Tuple[List[Destination], Destination, List[List[str]]]:
-        
-        # 0. Pre-calc flight costs
-        self.estimate_flight_costs(user_input.get("origin_city", "Karachi"))
+    def calculate_utility_scores(self, filtered_destinations: List[Destination], user_input: Dict[str, Any],
+                                 top_k: Optional[int] = None) -> List[ScoredDestination]:
+        """
+        Calculates weighted score (Preferred Mode logic REMOVED).
+        Formula: Interest 55% + Budget 40% + Distance 5%, computed by ScoringEngine.
+        Returns scored records best first (only the top_k best when given); ties keep list order.
+        """
+        with self.lock.read():
+            rows = self.engine.rows_for(filtered_destinations)
+            scores = self.engine.utility_scores(user_input, rows)
+            order = SearchAlgorithms.top_k_indices(scores, top_k)
+            return self.scored_results(rows[order], scores[order], user_input)
 
-        # 1. BFS: Filter by Budget
-        affordable_destinations = SearchAlgorithms.bfs_budget_filter(self.all_destinations, user_input["budget"])
-        
-        # 2. Utility Scoring
-        ranked_destinations = self.calculate_utility_scores(affordable_destinations, user_input)
+    def scored_results(self, rows: np.ndarray, scores: np.ndarray, user_input: Dict[str, Any]) -> List[ScoredDestination]:
+        origin_coords = PAK_CITIES_COORDS.get(user_input.get("origin_city", "Karachi"), (65, 55))
+        flight_costs = self.engine.flight_costs(origin_coords, rows)
+        return [
+            ScoredDestination(self.all_destinations[row], score, cost)
+            for row, score, cost in zip(rows.tolist(), scores.tolist(), flight_costs.tolist())
+        ]
+
+    def affordable_rows(self, user_input: Dict[str, Any]) -> np.ndarray:
+        """
+        Budget filter as a cost-index range query: min_budget (optional) <= cost <= budget.
+        With require_interest_match, rows sharing none of the user's interests are dropped too.
+        """
+        min_budget = user_input.get("min_budget")
+        if min_budget:
+            rows = self.cost_index.rows_between(min_budget, user_input["budget"])
+        else:
+            rows = self.cost_index.rows_within(user_input["budget"])
+
+        if user_input.get("require_interest_match") and user_input["interests"]:
+            rows = rows[self.tag_index.any_match(set(user_input["interests"]))[rows]]
+        return rows
+
+    def rank_rows(self, rows: np.ndarray, user_input: Dict[str, Any], top_k: Optional[int] = None,
+                  trace: Optional[PlanningTrace] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (rows, scores) best first. Ties break by catalog row, whatever order `rows` is in."""
+        scores = self.engine.utility_scores(user_input, rows)
+        if trace is not None:
+            trace.lap("scoring", len(rows), len(rows))
+        order = SearchAlgorithms.top_k_indices(scores, top_k, tiebreak=rows)
+        if trace is not None:
+            trace.lap("ranking", len(rows), len(order), top_k=top_k)
+        return rows[order], scores[order]
+
+    # --- Hooks ---
+    def add_hook(self, hook: Callable[[PlanningTrace], None]):
+        """Registers a callback receiving the PlanningTrace of every planning call on this agent."""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[PlanningTrace], None]):
+        self.hooks.remove(hook)
+
+    def _begin_trace(self, trace: Optional[PlanningTrace]) -> Optional[PlanningTrace]:
+        if trace is None and self.hooks:
+            trace = PlanningTrace()
+        if trace is not None:
+            trace.begin()
+        return trace
+
+    def _end_trace(self, trace: Optional[PlanningTrace]):
+        """Finishes the trace and runs the hooks, once per request (nested calls do nothing)."""
+        if trace is not None and trace.end():
+            for hook in self.hooks:
+                hook(trace)
+
+    def rank(self, user_input: Dict[str, Any], top_k: Optional[int] = None,
+             trace: Optional[PlanningTrace] = None) -> List[ScoredDestination]:
+        """Budget filter + utility ranking (only the top_k best when given), no itinerary."""
+        with self.lock.read():
+            ranked = self._cube_rank(user_input, top_k, trace)
+            if ranked is None:
+                ranked = self._retrieval_rank(user_input, top_k, trace)
+            if ranked is not None:
+                return ranked
+
+            # 1. Filter by Budget (cost index range query)
+            affordable_rows = self.affordable_rows(user_input)
+            if trace is not None:
+                trace.lap("budget_filter", len(self.all_destinations), len(affordable_rows))
+
+            # 2. Utility Scoring
+            ranked_rows, scores = self.rank_rows(affordable_rows, user_input, top_k, trace)
+
+            # 3. Flight costs, only for the destinations being returned
+            ranked = self.scored_results(ranked_rows, scores, user_input)
+            if trace is not None:
+                trace.lap("flight_costs", len(ranked_rows), len(ranked))
+            return ranked
+
+    def _cube_rank(self, user_input: Dict[str, Any], top_k: Optional[int],
+                   trace: Optional[PlanningTrace]) -> Optional[List[ScoredDestination]]:
+        """Ranking from the answer cube, or None when there is no cube or the input is outside it."""
+        if self.answer_cube is None:
+            return None
+        ranked = self.answer_cube.lookup(self, user_input, top_k)
+        if ranked is not None and trace is not None:
+            trace.lap("cube_lookup", len(self.all_destinations), len(ranked))
+        return ranked
+
+    def enable_retrieval(self, pool: int = 1024, dim: int = 16, per_list: Optional[int] = None) -> EmbeddingIndex:
+        """
+        Builds the embedding index: from now on rank() scores only ~`pool` candidates
+        (exact utility rerank), so results are approximate. Most come from the index's
+        lists nearest the interests (at most `per_list` each, by default pool spread over
+        EmbeddingIndex.PROBE_LISTS lists), the rest are the priciest affordable rows.
+        top_k=None, empty interests and interests the index has never seen still rank
+        exactly. Larger pools raise recall and latency; travel_bench.py retrieval reports
+        both against exact ranking, which stays faster on small catalogs.
+        """
+        while True:
+            # Build from a consistent snapshot without blocking writers; if an edit lands
+            # meanwhile, the index would miss it, so build again from the new version.
+            with self.lock.read():
+                version = self.version
+                destinations, costs = list(self.all_destinations), self.engine.cost.copy()
+            index = EmbeddingIndex(destinations, costs, dim)
+            with self.lock.write():
+                if self.version == version:
+                    self.embedding_index, self.retrieval_pool, self.retrieval_per_list = index, pool, per_list
+                    return index
+
+    def _retrieval_rank(self, user_input: Dict[str, Any], top_k: Optional[int],
+                        trace: Optional[PlanningTrace]) -> Optional[List[ScoredDestination]]:
+        """Exact rerank of the index's candidates, or None when retrieval is off or does not apply."""
+        if self.embedding_index is None or top_k is None or not user_input["interests"]:
+            return None
+        pool = max(self.retrieval_pool, top_k)
+        by_budget = int(pool * self.RETRIEVAL_BUDGET_SHARE)
+        min_budget = user_input.get("min_budget")
+        rows = self.embedding_index.candidates(user_input["interests"], min_budget or -np.inf,
+                                               user_input["budget"], pool - by_budget, self.retrieval_per_list)
+        if rows is None:
+            return None
+        if by_budget:
+            affordable = (self.cost_index.rows_between(min_budget, user_input["budget"]) if min_budget
+                          else self.cost_index.rows_within(user_input["budget"]))
+            rows = np.concatenate([rows, affordable[max(0, len(affordable) - by_budget):]])
+        # Overlay rows (and the budget channel) can repeat a listed row; rank_rows needs each row once.
+        rows = np.unique(rows)
+        if user_input.get("require_interest_match"):
+            rows = rows[self.tag_index.row_match_counts(set(user_input["interests"]), rows) > 0]
+        if trace is not None:
+            trace.lap("retrieval", len(self.all_destinations), len(rows))
+        ranked_rows, scores = self.rank_rows(rows, user_input, top_k, trace)
+        return self.scored_results(ranked_rows, scores, user_input)
+
+    def score_destination(self, dest_id: str, user_input: Dict[str, Any]) -> Optional[ScoredDestination]:
+        """Scores one destination by id (None if unknown), ignoring the budget filter."""
+        with self.lock.read():
+            row = self.engine.row_of.get(dest_id)
+            if row is None:
+                return None
+            rows = np.array([row], dtype=np.intp)
+            return self.scored_results(rows, self.engine.utility_scores(user_input, rows), user_input)[0]
+
+    # --- Catalog Mutations ---
+    def upsert(self, record: Dict[str, Any]) -> bool:
+        """
+        Adds a destination, or replaces the one with the same id, updating every index in
+        place: O(tags + origins) plus amortized O(log n) for the cost index, independent
+        of catalog size. The record must be valid (see travel_catalog.validate_destination).
+        Returns True if the destination is new.
+        """
+        dest = Destination(record)
+        with self.lock.write():
+            row = self.engine.row_of.get(dest.id)
+            created = row is None
+            if created:
+                row = len(self.all_destinations)
+                old_tags, old_cost = frozenset(), None
+                self.all_destinations.append(dest)
+                self.engine.row_of[dest.id] = row
+                self.tag_index.resize(row + 1)
+            else:
+                old = self.all_destinations[row]
+                old_tags, old_cost = old.tags, old.cost
+                self.all_destinations[row] = dest
+            self.engine.set_row(row, dest)
+            self.tag_index.set_row(row, old_tags, dest.tags)
+            if dest.cost != old_cost:
+                self.cost_index.update(row, dest.cost)
+            if self.embedding_index is not None:
+                self.embedding_index.set_row(row, dest)
+            self._bump_revision()
+        return created
+
+    def delete(self, dest_id: str) -> bool:
+        """
+        Removes a destination (False if unknown). The last row moves into its slot, so
+        rows stay dense and the cost is the same as an update. Returns True if removed.
+        """
+        with self.lock.write():
+            row = self.engine.row_of.pop(dest_id, None)
+            if row is None:
+                return False
+            last = len(self.all_destinations) - 1
+            removed, moved = self.all_destinations[row], self.all_destinations[last]
+            if row != last:
+                self.all_destinations[row] = moved
+                self.engine.row_of[moved.id] = row
+                self.engine.copy_row(last, row)
+                self.tag_index.set_row(row, removed.tags, moved.tags)
+                self.tag_index.set_row(last, moved.tags, frozenset())
+                self.cost_index.update(row, moved.cost)
+                if self.embedding_index is not None:
+                    self.embedding_index.copy_row(last, row, moved.cost)
+            else:
+                self.tag_index.set_row(row, removed.tags, frozenset())
+            self.cost_index.update(last, None)
+            self.all_destinations.pop()
+            self.engine.size = last
+            self.tag_index.resize(last)
+            if self.embedding_index is not None:
+                self.embedding_index.resize(last)
+            self._bump_revision()
+        return True
+
+    def _bump_revision(self):
+        self.revision += 1
+        self.version = f"{self.base_version}+{self.revision}"
+        if self.cost_index.needs_compaction():
+            self.cost_index = CostIndex(self.engine.cost)
+        if self.embedding_index is not None and self.embedding_index.needs_compaction():
+            self.embedding_index.compact(self.engine.cost)
+
+    def run_planning(self, user_input: Dict[str, Any], top_k: Optional[int] = None,
+                     rng: Optional[random.Random] = None,
+                     trace: Optional[PlanningTrace] = None) -> Tuple[List[ScoredDestination], ScoredDestination, List[List[str]]]:
+        """
+        Ranks affordable destinations (only the top_k best when given) and plans the best one.
+        Reads the catalog only, so concurrent calls (e.g. on a thread pool) are safe.
+        Pass a PlanningTrace (or register a hook) to get per-stage instrumentation.
+        """
+        trace = self._begin_trace(trace)
+        ranked_destinations = self.rank(user_input, top_k, trace)
         
         if not ranked_destinations:
+            self._end_trace(trace)
             return [], None, []
 
         best_dest = ranked_destinations[0]
         
-        # 3. Rule-Based Planning
+        # 4. Rule-Based Planning
         planner = ItineraryPlanner()
-        itinerary = planner.generate_itinerary(best_dest, user_input)
+        itinerary = planner.generate_itinerary(best_dest, user_input, rng, trace)
+        self._end_trace(trace)
 
         return ranked_destinations, best_dest, itinerary
 
+    def itinerary_for(self, scored: ScoredDestination, user_input: Dict[str, Any],
+                      trace: Optional[PlanningTrace] = None) -> List[List[str]]:
+        """Itinerary with the RNG seeded from (catalog version, destination, canonical input)."""
+        canonical = PlanningCache.canonical_input(user_input)
+        rng = random.Random(PlanningCache.itinerary_seed(canonical, self.version, scored.id))
+        return ItineraryPlanner().generate_itinerary(scored, canonical, rng, trace)
+
+    def plan_seeded(self, user_input: Dict[str, Any], top_k: Optional[int] = None,
+                    trace: Optional[PlanningTrace] = None):
+        """Deterministic run_planning: canonical input, itinerary from itinerary_for()."""
+        trace = self._begin_trace(trace)
+        canonical = PlanningCache.canonical_input(user_input)
+        ranked_destinations = self.rank(canonical, top_k, trace)
+        if not ranked_destinations:
+            self._end_trace(trace)
+            return [], None, []
+        itinerary = self.itinerary_for(ranked_destinations[0], canonical, trace)
+        self._end_trace(trace)
+        return ranked_destinations, ranked_destinations[0], itinerary
+
+    def plan_many(self, user_inputs: List[Dict[str, Any]], workers: int = 1, top_k: Optional[int] = None,
+                  chunk_size: int = 256) -> Iterator[Tuple[int, Tuple[List[ScoredDestination], ScoredDestination, List[List[str]]]]]:
+        """
+        Batch planning. Yields (index into user_inputs, plan_seeded result) as chunks finish.
+        Profiles are grouped by origin so each chunk reuses one distance-matrix row. With
+        workers > 1 the agent is shared with a process pool (copy-on-write via fork where
+        available) and workers send back only rows/scores, not Destination objects.
+        """
+        by_origin = defaultdict(list)
+        for index, user_input in enumerate(user_inputs):
+            by_origin[user_input.get("origin_city", "Karachi")].append(index)
+        chunks = [
+            [(i, user_inputs[i]) for i in indices[start:start + chunk_size]]
+            for indices in by_origin.values()
+            for start in range(0, len(indices), chunk_size)
+        ]
+
+        if workers <= 1:
+            for chunk in chunks:
+                for index, user_input in chunk:
+                    yield index, self.plan_seeded(user_input, top_k)
+            return
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in start_methods else None)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_batch_worker, initargs=(self,)) as pool:
+            # Workers copy the catalog as it is now; map their rows back with the same rows.
+            with self.lock.read():
+                destinations = list(self.all_destinations)
+                futures = [pool.submit(_plan_batch_chunk, chunk, top_k) for chunk in chunks]
+            for future in as_completed(futures):
+                for index, compact in future.result():
+                    yield index, self._expand_compact(compact, destinations)
+
+    def plan_route(self, user_input: Dict[str, Any], **options) -> "RoutePlan":
+        """Multi-city trip over the top-ranked candidates; options go to RoutePlanner.plan."""
+        return RoutePlanner(self).plan(user_input, **options)
+
+    def shard(self, shards: int, by: str = "region") -> "ShardedAgent":
+        """Partitions the catalog into `shards` worker processes (see ShardedAgent)."""
+        return ShardedAgent(self, shards, by)
+
+    def _compact(self, result) -> Tuple[List[Tuple[int, float, int]], List[List[str]]]:
+        ranked, _, itinerary = result
+        return [(self.engine.row_of[r.id], r.utility_score, r.estimated_flight_cost) for r in ranked], itinerary
+
+    def _expand_compact(self, compact: Tuple[List[Tuple[int, float, int]], List[List[str]]],
+                        destinations: List[Destination]):
+        rows, itinerary = compact
+        ranked = [ScoredDestination(destinations[row], score, cost) for row, score, cost in rows]
+        return ranked, (ranked[0] if ranked else None), itinerary
+
+# Batch worker state: set once per process by the pool initializer.
+_BATCH_AGENT: Optional[TravelAgent] = None
+
+def _init_batch_worker(agent: TravelAgent):
+    global _BATCH_AGENT
+    _BATCH_AGENT = agent
+
+def _plan_batch_chunk(chunk: List[Tuple[int, Dict[str, Any]]], top_k: Optional[int]):
+    return [(index, _BATCH_AGENT._compact(_BATCH_AGENT.plan_seeded(user_input, top_k))) for index, user_input in chunk]
+
+# --- Sharded Ranking ---
+SHARD_STRATEGIES = ("region", "hash")
+
+def shard_rows(agent: TravelAgent, shards: int, by: str = "region") -> List[np.ndarray]:
+    """
+    Catalog rows per shard, each ascending. "region" cuts the catalog into equal-sized
+    bands by x then y coordinate; "hash" assigns by CRC-32 of the destination id, which
+    is stable across processes and runs.
+    """
+    if by not in SHARD_STRATEGIES:
+        raise ValueError(f"unknown shard strategy {by!r}; expected one of {SHARD_STRATEGIES}")
+    if by == "region":
+        coords = agent.engine.coords
+        bands = np.array_split(np.lexsort((coords[:, 1], coords[:, 0])), shards)
+        return [np.sort(band) for band in bands]
+    owner = np.fromiter((zlib.crc32(str(dest.id).encode("utf-8")) % shards for dest in agent.all_destinations),
+                        dtype=np.intp, count=len(agent.all_destinations))
+    return [np.flatnonzero(owner == shard) for shard in range(shards)]
+
+class ShardedAgent:
+    """
+    Scatter-gather ranking. Each shard is a TravelAgent over part of the catalog, served
+    by its own worker process. A request goes to every shard, each returns its local
+    top-k as (score, catalog row, ScoredDestination), and the coordinator merges the
+    already-sorted lists with heapq.merge. Shards keep catalog order, so ordering by
+    (-score, catalog row) reproduces single-process ranking exactly, ties included.
+    The catalog is partitioned as it was at construction; later upsert()/delete() calls
+    on the source agent are not seen by the shards.
+    """
+    def __init__(self, agent: TravelAgent, shards: int, by: str = "region"):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.version = agent.version
+        self.by = by
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in start_methods else None)
+
+        self.pools: List[ProcessPoolExecutor] = []
+        self.shard_sizes: List[int] = []
+        with agent.lock.read():
+            partitions = shard_rows(agent, shards, by)
+            for rows in partitions:
+                destinations = [agent.all_destinations[row] for row in rows.tolist()]
+                shard = TravelAgent.from_engine(destinations, ScoringEngine(destinations), agent.version)
+                pool = ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                           initializer=_init_shard_worker, initargs=(shard, rows))
+                self.pools.append(pool)
+                self.shard_sizes.append(len(destinations))
+        # Start every worker now, so the first request does not pay for it.
+        for future in [pool.submit(_shard_size) for pool in self.pools]:
+            future.result()
+
+    def rank(self, user_input: Dict[str, Any], top_k: Optional[int] = None) -> List[ScoredDestination]:
+        """Same result as TravelAgent.rank on the unsharded catalog."""
+        futures = [pool.submit(_shard_rank, user_input, top_k) for pool in self.pools]
+        merged = heapq.merge(*(future.result() for future in futures), key=lambda hit: (-hit[0], hit[1]))
+        return [scored for _, _, scored in islice(merged, top_k)]
+
+    def plan_seeded(self, user_input: Dict[str, Any], top_k: Optional[int] = None):
+        """Same result as TravelAgent.plan_seeded: the itinerary is generated here, on the coordinator."""
+        canonical = PlanningCache.canonical_input(user_input)
+        ranked = self.rank(canonical, top_k)
+        if not ranked:
+            return [], None, []
+        best = ranked[0]
+        rng = random.Random(PlanningCache.itinerary_seed(canonical, self.version, best.id))
+        return ranked, best, ItineraryPlanner().generate_itinerary(best, canonical, rng)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.version, "by": self.by, "shards": len(self.pools), "shard_sizes": self.shard_sizes}
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown()
+        self.pools = []
+
+    def __enter__(self) -> "ShardedAgent":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Shard worker state: the shard's agent and its local row -> catalog row map.
+_SHARD_AGENT: Optional[TravelAgent] = None
+_SHARD_ROWS: Optional[np.ndarray] = None
+
+def _init_shard_worker(agent: TravelAgent, rows: np.ndarray):
+    global _SHARD_AGENT, _SHARD_ROWS
+    _SHARD_AGENT, _SHARD_ROWS = agent, rows
+
+def _shard_size() -> int:
+    return len(_SHARD_AGENT.all_destinations)
+
+def _shard_rank(user_input: Dict[str, Any], top_k: Optional[int]) -> List[Tuple[float, int, ScoredDestination]]:
+    agent = _SHARD_AGENT
+    ranked_rows, scores = agent.rank_rows(agent.affordable_rows(user_input), user_input, top_k)
+    scored = agent.scored_results(ranked_rows, scores, user_input)
+    return list(zip(scores.tolist(), _SHARD_ROWS[ranked_rows].tolist(), scored))
+
+class DayTemplates:
+    """
+    Shared line templates for itineraries. The transport and evening lines are picked
+    once per itinerary, and "Morning: <activity>"-style lines are built once per
+    (slot, activity) and reused, so cached itineraries share their strings.
+    """
+    TRANSPORT = {
+        "rental car": "TRANSPORT: Pick up Rental Car.",
+        "metro": "TRANSPORT: Buy a Day Pass for Metro.",
+        "walk": "TRANSPORT: Wear comfortable shoes for walking.",
+    }
+    TRANSPORT_DEFAULT = "TRANSPORT: Use Taxi/Uber."
+    EVENING_NIGHTLIFE = "Evening: Explore local nightlife."
+    EVENING_DEFAULT = "Evening: Relaxing dinner at hotel."
+
+    @classmethod
+    def transport(cls, inside_city_pref: str) -> str:
+        return cls.TRANSPORT.get(inside_city_pref, cls.TRANSPORT_DEFAULT)
+
+    @classmethod
+    def evening(cls, user_interests: List[str]) -> str:
+        return cls.EVENING_NIGHTLIFE if 'nightlife' in user_interests else cls.EVENING_DEFAULT
+
+    @staticmethod
+    @lru_cache(maxsize=1 << 16)
+    def slot(slot: str, activity: str) -> str:
+        return f"{slot}: {activity}"
+
 class ItineraryPlanner:
     
-    def generate_itinerary(self, dest: Destination, user_input: Dict[str, Any]):
+    def generate_itinerary(self, dest: ScoredDestination, user_input: Dict[str, Any], rng: Optional[random.Random] = None,
+                           trace: Optional[PlanningTrace] = None):
         itinerary = []
         user_interests = user_input["interests"]
         duration = int(user_input["duration"])
@@ -184,8 +1380,15 @@ class ItineraryPlanner:
             all_activities.extend(dest.activities.get("culture", []))
 
         num_activities_needed = duration * 2
-        selected_activities = SearchAlgorithms.dfs_activity_explorer(all_activities, num_activities_needed)
+        dfs_stats = {} if trace is not None else None
+        selected_activities = SearchAlgorithms.dfs_activity_explorer(all_activities, num_activities_needed, rng, dfs_stats)
+        if trace is not None:
+            trace.lap("activity_dfs", len(all_activities), len(selected_activities), **dfs_stats)
         
+        # RULE: Local Transport / evening, the same line every day
+        transport_line = DayTemplates.transport(inside_city_pref)
+        evening_line = DayTemplates.evening(user_interests)
+
         activity_index = 0
         for day in range(1, duration + 1):
             daily_plan = []
@@ -198,28 +1401,493 @@ class ItineraryPlanner:
                 else:
                     daily_plan.append(f"TIP: Look for budget flight deals (~${dest.estimated_flight_cost}).")
 
-            # RULE: Local Transport
-            if inside_city_pref == "rental car":
-                daily_plan.append("TRANSPORT: Pick up Rental Car.")
-            elif inside_city_pref == "metro":
-                 daily_plan.append("TRANSPORT: Buy a Day Pass for Metro.")
-            elif inside_city_pref == "walk":
-                 daily_plan.append("TRANSPORT: Wear comfortable shoes for walking.")
-            else:
-                 daily_plan.append("TRANSPORT: Use Taxi/Uber.")
+            daily_plan.append(transport_line)
 
             if activity_index < len(selected_activities):
-                daily_plan.append(f"Morning: {selected_activities[activity_index]}")
+                daily_plan.append(DayTemplates.slot("Morning", selected_activities[activity_index]))
                 activity_index += 1
             if activity_index < len(selected_activities):
-                daily_plan.append(f"Afternoon: {selected_activities[activity_index]}")
+                daily_plan.append(DayTemplates.slot("Afternoon", selected_activities[activity_index]))
                 activity_index += 1
             
-            if 'nightlife' in user_interests:
-                daily_plan.append("Evening: Explore local nightlife.")
-            else:
-                 daily_plan.append("Evening: Relaxing dinner at hotel.")
+            daily_plan.append(evening_line)
             
             itinerary.append(daily_plan)
-        
-        return itinerary
\ No newline at end of file
+
+        if trace is not None:
+            trace.lap("itinerary", 1, 1, days=len(itinerary))
+        return itinerary
+
+# --- Lazy Itineraries ---
+_PREFETCH_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_PREFETCH_LOCK = threading.Lock()
+
+def _prefetch_executor() -> ThreadPoolExecutor:
+    global _PREFETCH_EXECUTOR
+    with _PREFETCH_LOCK:
+        if _PREFETCH_EXECUTOR is None:
+            _PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="itinerary")
+        return _PREFETCH_EXECUTOR
+
+class ItineraryProvider:
+    """
+    Itineraries for a ranked result list, generated on first access through
+    TravelAgent.itinerary_for and memoized per index. prefetch() warms the next few
+    alternatives on a shared background pool; get() never generates one twice.
+    """
+    def __init__(self, agent: "TravelAgent", user_input: Dict[str, Any], ranked: List[ScoredDestination],
+                 known: Optional[Dict[str, List[List[str]]]] = None):
+        self.agent = agent
+        self.user_input = PlanningCache.canonical_input(user_input)
+        self.ranked = ranked
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self.generated = 0
+        for index, scored in enumerate(ranked):
+            if known and scored.id in known:
+                future = Future()
+                future.set_result(known[scored.id])
+                self._futures[index] = future
+
+    def __len__(self) -> int:
+        return len(self.ranked)
+
+    def _claim(self, index: int) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._futures.get(index)
+            if future is not None:
+                return future, False
+            future = self._futures[index] = Future()
+            return future, True
+
+    def _fill(self, index: int, future: Future):
+        try:
+            future.set_result(self.agent.itinerary_for(self.ranked[index], self.user_input))
+            with self._lock:
+                self.generated += 1
+        except Exception as e:
+            future.set_exception(e)
+
+    def get(self, index: int) -> List[List[str]]:
+        """Itinerary of ranked[index]; generated inline unless already done or in flight."""
+        if not 0 <= index < len(self.ranked):
+            raise IndexError(index)
+        future, owner = self._claim(index)
+        if owner:
+            self._fill(index, future)
+        return future.result()
+
+    def is_ready(self, index: int) -> bool:
+        future = self._futures.get(index)
+        return future is not None and future.done()
+
+    def prefetch(self, count: int, start: int = 1) -> int:
+        """Queue background generation for ranked[start:start+count]; returns how many were queued."""
+        queued = 0
+        for index in range(start, min(start + count, len(self.ranked))):
+            future, owner = self._claim(index)
+            if owner:
+                _prefetch_executor().submit(self._fill, index, future)
+                queued += 1
+        return queued
+
+# --- Multi-City Routes ---
+class RoutePlan(NamedTuple):
+    """One multi-city trip. Each stop's estimated_flight_cost is the leg flown to reach it."""
+    stops: List[ScoredDestination]
+    days: List[int]
+    legs: List[Tuple[str, str, int]]  # (from, to, flight cost); the last leg returns home on round trips
+    total_utility: float
+    travel_cost: int
+    stay_cost: float
+    objective: float
+    itineraries: List[List[List[str]]]
+    stats: Dict[str, Any]
+
+class RoutePlanner:
+    """
+    [A* / Branch and Bound] Chooses and orders up to max_stops of the top-ranked candidates
+    to maximize  sum(utility) - travel_weight * sum(leg flight costs), where each leg costs
+    300 + 8 * calculate_distance, and stays + flights must fit total_budget.
+
+    Each stop count k is searched separately (so days per route position are fixed) with
+    best-first search over partial routes. f = g + h, where h is admissible: the best
+    utilities still available minus the cheapest possible remaining legs. Nodes are pruned
+    when f cannot beat the best route found so far, when even the cheapest completion
+    breaks the budget, or when another partial route with the same stops and last stop
+    was both cheaper to fly and cheaper overall (the Held-Karp state, with dominance).
+    """
+    LEG_BASE_FARE = 300
+    LEG_FARE_PER_UNIT = 8
+
+    def __init__(self, agent: "TravelAgent"):
+        self.agent = agent
+
+    @classmethod
+    def leg_cost(cls, start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> int:
+        return int(cls.LEG_BASE_FARE + SearchAlgorithms.calculate_distance(start_coords, end_coords) * cls.LEG_FARE_PER_UNIT)
+
+    @staticmethod
+    def days_by_position(duration: int, stops: int) -> List[int]:
+        """Splits the trip evenly; earlier stops get the leftover days."""
+        base, extra = divmod(duration, stops)
+        return [base + 1 if position < extra else base for position in range(stops)]
+
+    def plan(self, user_input: Dict[str, Any], candidates: int = 12, max_stops: int = 4, min_days_per_stop: int = 2,
+             total_budget: Optional[float] = None, travel_weight: float = 0.001, round_trip: bool = True) -> RoutePlan:
+        """
+        total_budget covers stays and flights (default: daily budget x duration). An empty
+        RoutePlan (no stops) means not even one candidate fits the budget.
+        """
+        started = time.perf_counter()
+        canonical = PlanningCache.canonical_input(user_input)
+        duration = canonical["duration"]
+        budget = canonical["budget"] * duration if total_budget is None else total_budget
+        pool = self.agent.rank(canonical, candidates)
+        origin_coords = PAK_CITIES_COORDS.get(canonical.get("origin_city", "Karachi"), (65, 55))
+
+        # Node n is home; legs[i][j] is the flight from i to j.
+        coords = [dest.coords for dest in pool] + [origin_coords]
+        legs = [[self.leg_cost(a, b) for b in coords] for a in coords]
+        problem = {
+            "utilities": [dest.utility_score for dest in pool],
+            "daily_costs": [dest.cost for dest in pool],
+            "legs": legs,
+            "min_leg": min((legs[i][j] for i in range(len(coords)) for j in range(len(coords)) if i != j), default=0),
+            "budget": budget,
+            "weight": travel_weight,
+            "round_trip": round_trip,
+        }
+        stats = {"candidates": len(pool), "nodes_expanded": 0, "nodes_generated": 0,
+                 "pruned_bound": 0, "pruned_budget": 0, "pruned_dominated": 0}
+
+        best = None
+        max_k = min(max_stops, max(1, duration // max(1, min_days_per_stop)), len(pool))
+        for k in range(1, max_k + 1):
+            found = self._search(problem, self.days_by_position(duration, k), best, stats)
+            if found is not None:
+                best = found
+        stats["seconds"] = time.perf_counter() - started
+
+        if best is None:
+            return RoutePlan([], [], [], 0.0, 0, 0.0, 0.0, [], stats)
+        objective, path, travel, spent = best
+        return self._route(pool, path, legs, duration, round_trip, objective, travel, spent, canonical, stats)
+
+    def _search(self, problem: Dict[str, Any], days: List[int], best: Optional[Tuple], stats: Dict[str, Any]) -> Optional[Tuple]:
+        """Best route with exactly len(days) stops that beats `best`, as (objective, path, travel, spent)."""
+        utilities, daily_costs, legs = problem["utilities"], problem["daily_costs"], problem["legs"]
+        budget, weight, round_trip, min_leg = problem["budget"], problem["weight"], problem["round_trip"], problem["min_leg"]
+        n, k = len(utilities), len(days)
+        home = n
+        by_utility = sorted(range(n), key=lambda i: -utilities[i])
+        by_cost = sorted(range(n), key=lambda i: daily_costs[i])
+        best_objective = best[0] if best is not None else -math.inf
+        found = None
+
+        def bound(mask: int, last: int, position: int) -> Tuple[float, float]:
+            """(max utility still to gain, min cost still to pay) for the remaining positions."""
+            remaining = k - position
+            gain = sum(utilities[i] for i in islice((i for i in by_utility if not mask >> i & 1), remaining))
+            stays = sum(daily_costs[i] * d for i, d in zip((i for i in by_cost if not mask >> i & 1), sorted(days[position:], reverse=True)))
+            if remaining:
+                next_leg = min(legs[last][i] for i in range(n) if not mask >> i & 1)
+                flights = next_leg + (remaining - 1 + round_trip) * min_leg
+            else:
+                flights = legs[last][home] if round_trip else 0
+            return gain - weight * flights, stays + flights
+
+        frontier = [(-math.inf, 0, 0.0, 0, 0.0, 0, home, ())]
+        pareto: Dict[Tuple[int, int], List[Tuple[int, float]]] = {}
+        counter = 0
+        while frontier:
+            neg_f, _, utility, travel, spent, mask, last, path = heapq.heappop(frontier)
+            if -neg_f <= best_objective and path:
+                break
+            stats["nodes_expanded"] += 1
+            if len(path) == k:
+                # Goal nodes carry their exact objective, so the first one popped is optimal.
+                best_objective, found = -neg_f, (-neg_f, path, travel, spent)
+                break
+
+            position = len(path)
+            for stop in range(n):
+                if mask >> stop & 1:
+                    continue
+                stats["nodes_generated"] += 1
+                next_mask, next_travel = mask | (1 << stop), travel + legs[last][stop]
+                next_spent = spent + legs[last][stop] + daily_costs[stop] * days[position]
+                next_utility = utility + utilities[stop]
+
+                key = (next_mask, stop)
+                front = pareto.setdefault(key, [])
+                if any(t <= next_travel and c <= next_spent for t, c in front):
+                    stats["pruned_dominated"] += 1
+                    continue
+                front.append((next_travel, next_spent))
+
+                gain_bound, cost_bound = bound(next_mask, stop, position + 1)
+                if next_spent + cost_bound > budget:
+                    stats["pruned_budget"] += 1
+                    continue
+                f = next_utility - weight * next_travel + gain_bound
+                if f <= best_objective:
+                    stats["pruned_bound"] += 1
+                    continue
+                if position + 1 == k:
+                    # Complete: fly home (if round trip) and push with the exact objective.
+                    home_leg = legs[stop][home] if round_trip else 0
+                    next_travel, next_spent = next_travel + home_leg, next_spent + home_leg
+                    f = next_utility - weight * next_travel
+                counter += 1
+                heapq.heappush(frontier, (-f, counter, next_utility, next_travel, next_spent, next_mask, stop, path + (stop,)))
+        return found
+
+    def _route(self, pool: List[ScoredDestination], path: Tuple[int, ...], legs: List[List[int]], duration: int,
+               round_trip: bool, objective: float, travel: int, spent: float, canonical: Dict[str, Any], stats: Dict[str, Any]) -> RoutePlan:
+        days = self.days_by_position(duration, len(path))
+        home = len(pool)
+        origin_name = canonical.get("origin_city", "Karachi")
+        stops, route_legs, itineraries = [], [], []
+        previous, previous_name = home, origin_name
+        for stop, stop_days in zip(path, days):
+            dest = pool[stop]
+            scored = ScoredDestination(dest.destination, dest.utility_score, legs[previous][stop])
+            stops.append(scored)
+            route_legs.append((previous_name, dest.name, legs[previous][stop]))
+            stop_input = dict(canonical, duration=stop_days, origin_city=previous_name)
+            itineraries.append(self.agent.itinerary_for(scored, stop_input))
+            previous, previous_name = stop, dest.name
+        if round_trip:
+            route_legs.append((previous_name, origin_name, legs[previous][home]))
+        return RoutePlan(
+            stops, days, route_legs, sum(s.utility_score for s in stops), travel, spent - travel, objective,
+            itineraries, stats,
+        )
+
+# --- Planning Cache ---
+class PlanningCache:
+    """
+    Bounded LRU cache in front of TravelAgent.run_planning. Keys are the canonical user
+    input plus the catalog version and top_k; entries expire after ttl_seconds. Each key
+    plans through TravelAgent.plan_seeded, so a cached itinerary is the one a miss would produce.
+    """
+    def __init__(self, maxsize: int = 256, ttl_seconds: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def canonical_input(user_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Same plan, same dict: interests sorted/deduplicated, numbers normalized, defaults filled."""
+        canonical = {
+            "budget": float(user_input["budget"]),
+            "min_budget": float(user_input.get("min_budget") or 0),
+            "duration": int(user_input["duration"]),
+            "interests": sorted(set(user_input["interests"])),
+            "require_interest_match": bool(user_input.get("require_interest_match", False)),
+            "inside_city": user_input.get("inside_city", "taxi"),
+            "airline_pref": user_input.get("airline_pref", "Cheap"),
+        }
+        # Scoring and the itinerary default a missing origin differently, so keep it missing.
+        if "origin_city" in user_input:
+            canonical["origin_city"] = user_input["origin_city"]
+        return canonical
+
+    @staticmethod
+    def make_key(canonical: Dict[str, Any], version: str, top_k: Optional[int]) -> str:
+        return json.dumps([version, top_k, canonical], sort_keys=True)
+
+    @staticmethod
+    def seed_for(key: str) -> int:
+        return int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:16], 16)
+
+    @staticmethod
+    def itinerary_seed(canonical: Dict[str, Any], version: str, dest_id: str) -> int:
+        """Seed for one destination's itinerary; independent of top_k, so any caller gets the same days."""
+        return PlanningCache.seed_for(json.dumps([version, dest_id, canonical], sort_keys=True))
+
+    def get_or_plan(self, agent: TravelAgent, user_input: Dict[str, Any], top_k: Optional[int] = None,
+                    trace: Optional[PlanningTrace] = None, planner: Optional[Callable] = None):
+        """
+        Returns run_planning's (ranked, best, itinerary), from cache when possible. Misses go
+        to agent.plan_seeded, or to `planner` (same signature and result, e.g. PlanningSession.plan).
+        """
+        canonical = self.canonical_input(user_input)
+        key = self.make_key(canonical, agent.version, top_k)
+        now = time.monotonic()
+        # One trace per request: hits finish it here, misses hand it to the planner, whose
+        # nested begin/end leave finishing (and the agent's hooks) to the _end_trace below.
+        trace = agent._begin_trace(trace)
+
+        # Only bookkeeping under the lock: trace hooks are user code and may call back into the cache.
+        cached = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    cached = entry[2]
+                else:
+                    del self._entries[key]
+                    self.expirations += 1
+            if cached is None:
+                self.misses += 1
+
+        # Cached lists are never handed out or mutated, so copying them needs no lock.
+        if cached is not None:
+            if trace is not None:
+                trace.lap("cache_hit", 1, len(cached[0]))
+            agent._end_trace(trace)
+            return self._copy(cached)
+
+        if trace is not None:
+            trace.lap("cache_lookup", 1, 0, hit=False)
+        result = (planner or agent.plan_seeded)(canonical, top_k, trace)
+        agent._end_trace(trace)
+
+        with self._lock:
+            self._entries[key] = (now, agent.version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return self._copy(result)
+
+    @staticmethod
+    def _copy(result):
+        """Fresh ranked/itinerary lists per caller, so mutating a result cannot change the cached one."""
+        ranked, best, itinerary = result
+        return list(ranked), best, [list(day) for day in itinerary]
+
+    def invalidate(self, version: Optional[str] = None) -> int:
+        """Drops every entry, or only those planned against `version`. Returns how many."""
+        with self._lock:
+            if version is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            stale = [key for key, entry in self._entries.items() if entry[1] == version]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+# --- Planning Sessions ---
+class PlanningSession:
+    """
+    One user's planning state across reruns. Keeps the per-row score components of the
+    last ranking (interest match counts, budget fit, distance scores) keyed by the inputs
+    each depends on, so a rerun recomputes only the component whose input changed and
+    re-sums the cached ones. Transport/class/duration changes reuse the ranking as-is and
+    only regenerate the itinerary. Results are identical to TravelAgent.plan_seeded.
+    """
+    RANKING_KEYS = ("origin_city", "budget", "min_budget", "interests", "require_interest_match")
+
+    def __init__(self, agent: TravelAgent):
+        self.agent = agent
+        self.last_input: Optional[Dict[str, Any]] = None
+        # Inputs that differed from the previous plan() call.
+        self.changed: Set[str] = set()
+        self.recomputed = {"rows": 0, "interest": 0, "budget": 0, "distance": 0, "ranking": 0, "itinerary": 0}
+        self._reset()
+
+    def _reset(self):
+        self.version = self.agent.version
+        # Each cache is (key, value); keys are the inputs the value depends on.
+        self._rows: Optional[Tuple[Any, np.ndarray]] = None
+        self._interest: Optional[Tuple[Any, Optional[np.ndarray]]] = None
+        self._budget: Optional[Tuple[Any, np.ndarray]] = None
+        self._distance: Optional[Tuple[Any, np.ndarray]] = None
+        self._ranking: Optional[Tuple[Any, List[ScoredDestination]]] = None
+        self._itinerary: Optional[Tuple[Any, List[List[str]]]] = None
+
+    def _cached(self, name: str, key: Any, compute: Callable[[], Any]) -> Any:
+        entry = getattr(self, "_" + name)
+        if entry is None or entry[0] != key:
+            entry = (key, compute())
+            setattr(self, "_" + name, entry)
+            self.recomputed[name] += 1
+        return entry[1]
+
+    def _distance_row(self, origin_coords: Tuple[float, float]) -> np.ndarray:
+        """Distance scores for the whole catalog: a view of the lookup table when the origin is in it."""
+        engine = self.agent.engine
+        matrix_row = engine.distance_matrix.row_for(origin_coords)
+        if matrix_row is not None:
+            return engine.distance_matrix.distance_scores[matrix_row, :engine.size]
+        return engine.distance_score(origin_coords, np.arange(engine.size, dtype=np.intp))
+
+    def _rank(self, canonical: Dict[str, Any], top_k: Optional[int],
+              trace: Optional[PlanningTrace]) -> List[ScoredDestination]:
+        agent, engine = self.agent, self.agent.engine
+        ranked = agent._cube_rank(canonical, top_k, trace)
+        if ranked is None:
+            ranked = agent._retrieval_rank(canonical, top_k, trace)
+        if ranked is not None:
+            return ranked
+        interests = tuple(canonical["interests"])
+        rows_key = (canonical["budget"], canonical["min_budget"], canonical["require_interest_match"],
+                    interests if canonical["require_interest_match"] else None)
+        rows = self._cached("rows", rows_key, lambda: agent.affordable_rows(canonical))
+        if trace is not None:
+            trace.lap("budget_filter", len(agent.all_destinations), len(rows))
+
+        # Full-catalog components are indexed by the current rows; same arithmetic as utility_scores.
+        counts = self._cached("interest", interests,
+                              lambda: agent.tag_index.match_counts(set(interests)) if interests else None)
+        origin_coords = PAK_CITIES_COORDS.get(canonical.get("origin_city", "Karachi"), (65, 55))
+        distance = self._cached("distance", origin_coords, lambda: self._distance_row(origin_coords))
+        budget = self._cached("budget", rows_key, lambda: engine.budget_fit(canonical["budget"], rows))
+        interest = counts[rows] / len(interests) if counts is not None else np.full(len(rows), 0.5)
+        scores = (interest * 0.55) + (budget * 0.40) + (distance[rows] * 0.05)
+        if trace is not None:
+            trace.lap("scoring", len(rows), len(rows), recomputed=sorted(self.changed & set(self.RANKING_KEYS)))
+
+        order = SearchAlgorithms.top_k_indices(scores, top_k, tiebreak=rows)
+        if trace is not None:
+            trace.lap("ranking", len(rows), len(order), top_k=top_k)
+        ranked = agent.scored_results(rows[order], scores[order], canonical)
+        if trace is not None:
+            trace.lap("flight_costs", len(order), len(ranked))
+        return ranked
+
+    def plan(self, user_input: Dict[str, Any], top_k: Optional[int] = None,
+             trace: Optional[PlanningTrace] = None):
+        """Same (ranked, best, itinerary) as agent.plan_seeded, reusing whatever the last calls computed."""
+        agent = self.agent
+        trace = agent._begin_trace(trace)
+        canonical = PlanningCache.canonical_input(user_input)
+        previous = self.last_input or {}
+        self.changed = {key for key in set(canonical) | set(previous) if canonical.get(key) != previous.get(key)}
+        self.last_input = canonical
+
+        with agent.lock.read():
+            if agent.version != self.version:
+                self._reset()
+            ranking_key = (top_k, json.dumps({key: canonical.get(key) for key in self.RANKING_KEYS}))
+            ranked = self._cached("ranking", ranking_key, lambda: self._rank(canonical, top_k, trace))
+        if not ranked:
+            agent._end_trace(trace)
+            return [], None, []
+        itinerary = self._cached("itinerary", (ranked[0].id, json.dumps(canonical, sort_keys=True)),
+                                 lambda: agent.itinerary_for(ranked[0], canonical, trace))
+        agent._end_trace(trace)
+        return ranked, ranked[0], itinerary
+
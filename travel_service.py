@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import json
+import math
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from travel_catalog import SharedCatalog
+from travel_core import PlanningCache, ScoredDestination
+
+# Constants
+DEFAULT_PORT = 8502
+MAX_BODY_BYTES = 1 << 20
+REQUIRED_INPUT_FIELDS = ("budget", "duration", "interests")
+TEXT_INPUT_FIELDS = ("origin_city", "inside_city", "airline_pref")
+ROUTE_OPTIONS = ("candidates", "max_stops", "min_days_per_stop", "total_budget", "travel_weight", "round_trip")
+
+HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# --- Serialization ---
+def scored_to_json(scored: ScoredDestination) -> Dict[str, Any]:
+    return {
+        "id": scored.id,
+        "name": scored.name,
+        "country": scored.country,
+        "avg_daily_cost": scored.cost,
+        "utility_score": scored.utility_score,
+        "estimated_flight_cost": scored.estimated_flight_cost,
+        "hotel_reco": scored.hotel_reco,
+        "local_transport": scored.local_transport,
+    }
+
+def _number(body: Dict[str, Any], field: str) -> float:
+    value = body[field]
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = float(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{field} must be a number")
+    if not math.isfinite(number):
+        raise HTTPError(400, f"{field} must be a number")
+    return number
+
+def parse_user_input(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Request body is the same user_input dict the UI builds (plus optional top_k).
+    Returns it canonicalized exactly as PlanningCache keys it (numbers coerced, interests
+    sorted and deduplicated, defaults filled); wrong types are a 400, never a 500.
+    """
+    missing = [field for field in REQUIRED_INPUT_FIELDS if field not in body]
+    if missing:
+        raise HTTPError(400, f"missing field(s): {', '.join(missing)}")
+    budget, duration = _number(body, "budget"), _number(body, "duration")
+    if budget <= 0 or duration < 1 or duration != int(duration):
+        raise HTTPError(400, "budget must be > 0 and duration a whole number >= 1")
+    min_budget = _number(body, "min_budget") if body.get("min_budget") is not None else 0.0
+    if min_budget < 0:
+        raise HTTPError(400, "min_budget must be >= 0")
+    if not isinstance(body["interests"], list) or not all(isinstance(tag, str) for tag in body["interests"]):
+        raise HTTPError(400, "interests must be a list of strings")
+    for field in TEXT_INPUT_FIELDS:
+        if field in body and not isinstance(body[field], str):
+            raise HTTPError(400, f"{field} must be a string")
+    if body.get("require_interest_match") not in (None, True, False):
+        raise HTTPError(400, "require_interest_match must be true/false")
+    return PlanningCache.canonical_input(dict(body, budget=budget, duration=int(duration), min_budget=min_budget))
+
+def parse_top_k(body: Dict[str, Any]) -> Optional[int]:
+    top_k = body.get("top_k", 10)
+    if top_k is not None and (not isinstance(top_k, int) or top_k < 1):
+        raise HTTPError(400, "top_k must be a positive integer or null")
+    return top_k
+
+# --- Planning Service ---
+class PlanningService:
+    """
+    Headless JSON API over the shared TravelAgent. Requests are parsed on the asyncio
+    event loop; scoring and itinerary generation run on a thread pool. Threads are
+    deliberate: handlers share one agent that PUT/DELETE /destinations and hot reloads
+    change in place, and one PlanningCache, whose hits are cheap (travel_bench.py
+    concurrency: ~22k hits/s vs ~2k plans/s at 20k destinations). Scoring holds the GIL
+    for much of each miss, so `workers` bounds concurrency more than it adds throughput
+    (4 threads: 0.8-0.9x serial on one CPU); to use more cores run several service
+    processes, ideally on one mapped .tcat catalog. At most `max_pending` requests may be
+    queued or running; beyond that the service answers 503 instead of letting latency grow.
+    """
+    def __init__(self, shared_catalog: SharedCatalog, workers: int = 4, max_pending: int = 64,
+                 request_timeout: float = 10.0):
+        self.shared_catalog = shared_catalog
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="planner")
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.pending = 0
+        self.counters = {"requests": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+        self.routes: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            ("POST", "/plan"): self.plan,
+            ("POST", "/rank"): self.rank,
+            ("POST", "/itinerary"): self.itinerary,
+            ("POST", "/route"): self.route,
+            ("GET", "/health"): self.health,
+            ("PUT", "/destinations"): self.upsert_destination,
+            ("DELETE", "/destinations"): self.delete_destination,
+        }
+
+    def _agent(self):
+        catalog = self.shared_catalog.current()
+        if catalog is None:
+            raise HTTPError(503, f"catalog unavailable: {self.shared_catalog.error}")
+        return catalog.agent
+
+    # Handlers run on the worker pool.
+    def plan(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        user_input, top_k = parse_user_input(body), parse_top_k(body)
+        ranked, best, itinerary = self.shared_catalog.planning_cache.get_or_plan(self._agent(), user_input, top_k)
+        return {
+            "ranked": [scored_to_json(r) for r in ranked],
+            "best": scored_to_json(best) if best else None,
+            "itinerary": itinerary,
+        }
+
+    def rank(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        user_input, top_k = parse_user_input(body), parse_top_k(body)
+        return {"ranked": [scored_to_json(r) for r in self._agent().rank(user_input, top_k)]}
+
+    def itinerary(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        if "destination_id" not in body:
+            raise HTTPError(400, "missing field(s): destination_id")
+        user_input = parse_user_input({k: v for k, v in body.items() if k != "destination_id"})
+        agent = self._agent()
+        scored = agent.score_destination(body["destination_id"], user_input)
+        if scored is None:
+            raise HTTPError(404, f"unknown destination: {body['destination_id']}")
+        return {"destination": scored_to_json(scored), "itinerary": agent.itinerary_for(scored, user_input)}
+
+    def route(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Multi-city trip; optional candidates, max_stops, min_days_per_stop, total_budget, round_trip."""
+        options = {key: body[key] for key in ROUTE_OPTIONS if key in body}
+        for key, value in options.items():
+            expected = bool if key == "round_trip" else (int, float) if key in ("total_budget", "travel_weight") else int
+            if not isinstance(value, expected) or (expected is not bool and (isinstance(value, bool) or value <= 0)):
+                raise HTTPError(400, f"{key} must be {'true/false' if expected is bool else 'a positive number'}")
+        user_input = parse_user_input({k: v for k, v in body.items() if k not in ROUTE_OPTIONS})
+        plan = self._agent().plan_route(user_input, **options)
+        return {
+            "stops": [dict(scored_to_json(stop), days=days, itinerary=itinerary)
+                      for stop, days, itinerary in zip(plan.stops, plan.days, plan.itineraries)],
+            "legs": [{"from": start, "to": end, "flight_cost": cost} for start, end, cost in plan.legs],
+            "total_utility": plan.total_utility,
+            "travel_cost": plan.travel_cost,
+            "stay_cost": plan.stay_cost,
+            "objective": plan.objective,
+            "search": plan.stats,
+        }
+
+    # Catalog mutations: the body is a destination record / {"id": ...}.
+    def upsert_destination(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        result = self.shared_catalog.upsert(body)
+        if "error" in result:
+            raise HTTPError(400, result["error"])
+        return result
+
+    def delete_destination(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        if "id" not in body:
+            raise HTTPError(400, "missing field(s): id")
+        result = self.shared_catalog.delete(body["id"])
+        if "error" in result:
+            raise HTTPError(404, result["error"])
+        return result
+
+    def health(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "catalog": self.shared_catalog.stats(),
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            **self.counters,
+        }
+
+    async def dispatch(self, method: str, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                raise HTTPError(405, f"{method} not allowed on {path}")
+            raise HTTPError(404, f"no route for {path}")
+
+        if self.pending >= self.max_pending:
+            self.counters["rejected"] += 1
+            raise HTTPError(503, "server busy, retry later")
+
+        # The slot is held until the worker really finishes, even if the client timed out,
+        # so abandoned work still counts against max_pending.
+        self.pending += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, handler, body)
+        future.add_done_callback(self._release_slot)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise HTTPError(504, f"request exceeded {self.request_timeout}s")
+
+    def _release_slot(self, _future):
+        self.pending -= 1
+
+    # --- HTTP/1.1 (one request per connection) ---
+    async def read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, Any]]:
+        """(method, path, JSON body). Anything wrong with the request itself is an HTTPError(400/413)."""
+        try:
+            request_line = (await asyncio.wait_for(reader.readline(), self.request_timeout)).decode("latin-1")
+            parts = request_line.split()
+            if len(parts) != 3:
+                raise HTTPError(400, "malformed request line")
+            method, path = parts[0].upper(), parts[1].split("?", 1)[0]
+
+            headers = {}
+            while True:
+                line = (await asyncio.wait_for(reader.readline(), self.request_timeout)).decode("latin-1")
+                if line in ("\r\n", "\n", ""):
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            try:
+                length = int(headers.get("content-length", "0") or 0)
+            except ValueError:
+                raise HTTPError(400, "invalid Content-Length")
+            if length < 0:
+                raise HTTPError(400, "invalid Content-Length")
+            if length > MAX_BODY_BYTES:
+                raise HTTPError(413, "request body too large")
+            raw_body = await asyncio.wait_for(reader.readexactly(length), self.request_timeout) if length else b""
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            raise HTTPError(400, "incomplete or malformed request")
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+        except ValueError:
+            raise HTTPError(400, "body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        return method, path, body
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        status, payload = 200, None
+        try:
+            method, path, body = await self.read_request(reader)
+            self.counters["requests"] += 1
+            payload = await self.dispatch(method, path, body)
+        except HTTPError as e:
+            status, payload = e.status, {"error": e.message}
+        except Exception:
+            # A bug in a handler, not a bad request: log it here, tell the client nothing specific.
+            self.counters["errors"] += 1
+            traceback.print_exc()
+            status, payload = 500, {"error": "internal error"}
+
+        data = json.dumps(payload).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Error')}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\nConnection: close\r\n")
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        try:
+            writer.write(head.encode("latin-1") + b"\r\n" + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(service: PlanningService, host: str, port: int):
+    server = await asyncio.start_server(service.handle_connection, host, port, backlog=service.max_pending * 4)
+    print(f"Planning service listening on http://{host}:{port} "
+          "(POST /plan /rank /itinerary /route, PUT/DELETE /destinations, GET /health)")
+    async with server:
+        await server.serve_forever()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Headless JSON planning service.")
+    parser.add_argument("--data", default="travel_data.docx")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Planning worker threads (bound concurrency; scale CPU with more processes).")
+    parser.add_argument("--max-pending", type=int, default=64, help="Queued+running requests before 503.")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--retrieval-pool", type=int, default=0,
+                        help="Rank only ~N candidates from the embedding index per request (0 = exact ranking). "
+                             "Approximate; only faster than exact ranking above ~30k destinations.")
+    args = parser.parse_args(argv)
+
+    shared_catalog = SharedCatalog(args.data, args.retrieval_pool)
+    if shared_catalog.current() is None:
+        print(f"FATAL ERROR: {shared_catalog.error}")
+        return 1
+
+    service = PlanningService(shared_catalog, args.workers, args.max_pending, args.timeout)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
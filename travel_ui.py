@@ -1,7 +1,15 @@
 import streamlit as st
 import os
+import uuid
 from typing import Dict, List, Any
-from travel_core import TravelAgent, load_json_from_docx, Destination
+from travel_core import Destination, PlanningTrace, ItineraryProvider, PlanningSession
+from travel_catalog import SharedCatalog
+
+
+@st.cache_resource
+def get_shared_catalog(data_path: str) -> SharedCatalog:
+    """One catalog + TravelAgent per server process, shared by all sessions."""
+    return SharedCatalog(data_path)
 
 
 def run_ui():
@@ -23,12 +31,14 @@ def run_ui():
     """
     st.markdown(hide_st_style, unsafe_allow_html=True)
 
-    # 1. Load Data
+    # 1. Load Data (shared across sessions, hot-reloaded when the file changes)
     data_path = "travel_data.docx"
-    data = load_json_from_docx(data_path)
+    shared_catalog = get_shared_catalog(data_path)
+    session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+    catalog = shared_catalog.current(session_id)
 
-    if "error" in data:
-        st.error(f"FATAL ERROR: {data['error']}")
+    if catalog is None:
+        st.error(f"FATAL ERROR: {shared_catalog.error}")
         return
 
     # 2. Header
@@ -62,11 +72,24 @@ def run_ui():
         step=10,
         help="Enter your daily spending limit (Up to $3000)"
     )
+    min_budget = st.sidebar.number_input(
+        "Min Daily Budget ($USD)",
+        min_value=0,
+        max_value=3000,
+        value=0,
+        step=10,
+        help="Skip destinations cheaper than this (0 = no minimum)"
+    )
 
     duration = st.sidebar.number_input("3. Travel Duration (Days)", min_value=1, value=5)
     
     interest_options = ["beach", "adventure", "mountains", "history", "nightlife", "food", "art", "gardens"]
     interests = st.sidebar.multiselect("4. Interests", interest_options, default=["history", "food"])
+    require_interest_match = st.sidebar.checkbox(
+        "Only destinations matching an interest",
+        value=False,
+        help="Skip destinations that share none of your interests before scoring"
+    )
 
     st.sidebar.markdown("---")
     
@@ -74,6 +97,43 @@ def run_ui():
     inside_city = st.sidebar.selectbox("Inside City", ["metro", "taxi", "rental car", "walk"])
     airline_pref = st.sidebar.radio("Class", ["Cheap", "Comfortable"])
 
+    st.sidebar.markdown("---")
+
+    st.sidebar.header("🧭 Multi-City")
+    plan_route = st.sidebar.checkbox("Plan a multi-city route", value=False)
+    if plan_route:
+        max_stops = st.sidebar.slider("Max stops", min_value=2, max_value=6, value=3)
+        total_budget = st.sidebar.number_input(
+            "Total trip budget ($USD, stays + flights)",
+            min_value=100,
+            value=int(budget * duration) + 1500,
+            step=100,
+        )
+
+    st.sidebar.markdown("---")
+    show_diagnostics = st.sidebar.checkbox("🔬 Planning diagnostics", value=False)
+    capture_profile = show_diagnostics and st.sidebar.checkbox("Capture cProfile", value=False)
+
+    with st.sidebar.expander("🩺 Catalog Health"):
+        stats = shared_catalog.stats()
+        breakdown = ", ".join(f"{stage[:-3].replace('_', ' ')} {ms} ms" for stage, ms in stats['load_breakdown'].items())
+        st.markdown(
+            f"**Version:** `{stats['version']}`  \n"
+            f"**Destinations:** {stats['destinations']}  \n"
+            f"**Loaded at:** {stats['loaded_at']} ({stats['build_ms']} ms build: {breakdown})  \n"
+            f"**Active sessions:** {stats['active_sessions']}  \n"
+            f"**Reloads:** {stats['reloads']}  \n"
+            f"**Plan cache:** {stats['planning_cache']['hits']} hits / "
+            f"{stats['planning_cache']['misses']} misses / {stats['planning_cache']['evictions']} evictions"
+        )
+        cube = stats.get('answer_cube')
+        st.caption(f"Answer cube: {cube['hits']} hits / {cube['misses']} fallbacks to live scoring" if cube
+                   else "Answer cube: none (ranking scores live)")
+        if stats['last_error']:
+            st.warning(f"Last reload failed, serving previous version: {stats['last_error']}")
+        if stats.get('rejected_records'):
+            st.caption(f"{stats['rejected_records']} source record(s) skipped: " + "; ".join(stats['record_problems']))
+
     # Run button
     if st.sidebar.button("✨ Find Optimal Trip"):
         if not interests:
@@ -82,24 +142,39 @@ def run_ui():
             user_input = {
                 "origin_city": origin_city,
                 "budget": budget,
+                "min_budget": min_budget,
                 "duration": duration,
                 "interests": interests,
+                "require_interest_match": require_interest_match,
                 "inside_city": inside_city,
                 "airline_pref": airline_pref
             }
 
             st.session_state['run_plan'] = user_input
+            st.session_state['route_options'] = (
+                {"max_stops": max_stops, "total_budget": total_budget} if plan_route else None
+            )
             st.session_state['is_planning'] = True
 
     # 4. Main Display Logic
     if 'run_plan' in st.session_state and st.session_state.get('is_planning'):
 
-        agent = TravelAgent(data)
+        agent = catalog.agent
         user_input = st.session_state['run_plan']
 
         with st.spinner(f'Calculating flights from {user_input["origin_city"]} and planning itinerary...'):
             try:
-                ranked_destinations, best_dest, itinerary = agent.run_planning(user_input)
+                trace = PlanningTrace(profile=capture_profile) if show_diagnostics else None
+                # Per-user session: a rerun after changing one control recomputes only what that control affects.
+                session = st.session_state.get('planning_session')
+                if session is None or session.agent is not agent:
+                    session = st.session_state['planning_session'] = PlanningSession(agent)
+                ranked_destinations, best_dest, itinerary = shared_catalog.planning_cache.get_or_plan(
+                    agent, user_input, top_k=3, trace=trace, planner=session.plan
+                )
+                st.session_state['trace'] = trace
+                route_options = st.session_state.get('route_options')
+                st.session_state['route'] = agent.plan_route(user_input, **route_options) if route_options else None
                 
                 if not ranked_destinations:
                     st.error("No destinations found matching your Budget criteria.")
@@ -108,6 +183,11 @@ def run_ui():
                     st.session_state['ranked'] = ranked_destinations
                     st.session_state['best'] = best_dest
                     st.session_state['itinerary'] = itinerary
+                    # Alternatives' itineraries are built on first click; warm the next two now.
+                    provider = ItineraryProvider(agent, user_input, ranked_destinations, known={best_dest.id: itinerary})
+                    provider.prefetch(2)
+                    st.session_state['itineraries'] = provider
+                    st.session_state['selected_alt'] = 0
                     st.session_state['is_planning'] = False
 
             except Exception as e:
@@ -121,6 +201,7 @@ def run_ui():
         ranked_destinations = st.session_state['ranked']
         itinerary = st.session_state['itinerary']
         origin = st.session_state['run_plan']['origin_city']
+        provider = st.session_state.get('itineraries')
 
         st.header(f"Trip Recommendation: {origin} ✈️ {best_dest.name}, {best_dest.country}")
         st.markdown(f"**Utility Score: {best_dest.utility_score:.4f}**")
@@ -143,11 +224,18 @@ def run_ui():
             st.subheader("📊 Top Alternatives")
             for i, dest in enumerate(ranked_destinations[:3]):
                 st.info(f"**{i+1}. {dest.name}**\n*Flight: ${dest.estimated_flight_cost}*")
+                if provider is not None and st.button(f"View {dest.name} itinerary", key=f"alt_{i}"):
+                    st.session_state['selected_alt'] = i
+
+        selected = st.session_state.get('selected_alt', 0) if provider is not None else 0
+        shown_dest = ranked_destinations[selected] if selected else best_dest
+        if selected:
+            itinerary = provider.get(selected)
 
         # Itinerary Section
         with col_itinerary:
-            st.subheader("🗺️ Itinerary")
-            st.markdown(f"**Hotel Suggestion:** {best_dest.hotel_reco}")
+            st.subheader("🗺️ Itinerary" if not selected else f"🗺️ Itinerary — {shown_dest.name}, {shown_dest.country}")
+            st.markdown(f"**Hotel Suggestion:** {shown_dest.hotel_reco}")
             st.markdown("---")
 
             for day_num, activities in enumerate(itinerary):
@@ -161,6 +249,41 @@ def run_ui():
                         st.markdown(f"- {activity}")
                 st.markdown("---")
 
+        route = st.session_state.get('route')
+        if route is not None:
+            st.header("🧭 Multi-City Route")
+            if not route.stops:
+                st.warning("No route fits the total trip budget.")
+            else:
+                st.markdown(" ✈️ ".join([origin] + [f"**{stop.name}** ({days}d)" for stop, days in zip(route.stops, route.days)]
+                                        + ([origin] if len(route.legs) > len(route.stops) else [])))
+                col_route1, col_route2, col_route3 = st.columns(3)
+                with col_route1:
+                    st.metric("Total Utility", f"{route.total_utility:.3f}")
+                with col_route2:
+                    st.metric("Flights", f"${route.travel_cost}")
+                with col_route3:
+                    st.metric("Stays", f"${route.stay_cost:,.0f}")
+                st.caption(f"Searched {route.stats['candidates']} candidates, "
+                           f"{route.stats['nodes_expanded']} nodes expanded in {route.stats['seconds'] * 1000:.1f} ms")
+                for stop, days, stop_itinerary in zip(route.stops, route.days, route.itineraries):
+                    with st.expander(f"{stop.name}, {stop.country} — {days} days (flight ${stop.estimated_flight_cost})"):
+                        for day_num, activities in enumerate(stop_itinerary):
+                            st.markdown(f"**DAY {day_num + 1}:** " + " · ".join(activities))
+
+
+    # 6. Diagnostics
+    if show_diagnostics and st.session_state.get('trace') is not None:
+        trace = st.session_state['trace']
+        with st.expander(f"🔬 Diagnostics — {trace.total_ms:.2f} ms total", expanded=False):
+            st.table(trace.stages)
+            session = st.session_state.get('planning_session')
+            if session is not None:
+                st.caption(f"Changed since last plan: {', '.join(sorted(session.changed)) or 'nothing'} · "
+                           f"session recomputations: {session.recomputed}")
+            if trace.profile_text:
+                st.code(trace.profile_text)
+
 
 if __name__ == "__main__":
     run_ui()
\ No newline at end of file